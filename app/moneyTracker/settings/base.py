@@ -88,6 +88,23 @@ SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(days=1),
 }
 
+CACHES = {
+    "default": {
+        # Set CACHE_BACKEND=django.core.cache.backends.filebased.FileBasedCache and
+        # CACHE_LOCATION to a directory to share the cache between workers
+        "BACKEND": os.environ.get(
+            "CACHE_BACKEND", "django.core.cache.backends.locmem.LocMemCache"
+        ),
+        "LOCATION": os.environ.get("CACHE_LOCATION", "money-tracker"),
+    }
+}
+
+# Seconds a cached API response is kept; writes make entries stale immediately
+TRACKER_RESPONSE_CACHE_TIMEOUT = int(os.environ.get("TRACKER_RESPONSE_CACHE_TIMEOUT", 300))
+
+# Pub/sub hub fanning task events out to the project streams, see tracker.events
+TRACKER_EVENT_HUB = os.environ.get("TRACKER_EVENT_HUB", "tracker.events.LocalHub")
+
 CORS_ALLOWED_ORIGINS = ["http://localhost:5173"]
 
 STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
@@ -8,6 +8,11 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        # Take the write lock when a transaction begins, so concurrent writers
+        # wait on the busy timeout instead of failing on lock upgrades
+        "OPTIONS": {"transaction_mode": "IMMEDIATE", "timeout": 20},
+        # File-backed so threaded tests share the database and honour the timeout
+        "TEST": {"NAME": BASE_DIR / "test_db.sqlite3"},
     }
 }
 
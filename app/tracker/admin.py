@@ -11,3 +11,8 @@ admin.site.register(models.Category)
 admin.site.register(models.Project)
 admin.site.register(models.Task)
 admin.site.register(models.Team)
+admin.site.register(models.MonthlyRollup)
+admin.site.register(models.Budget)
+admin.site.register(models.RecurringTransaction)
+admin.site.register(models.ProjectAccess)
+admin.site.register(models.Tombstone)
@@ -0,0 +1,139 @@
+"""
+HTTP caching helpers for Tracker api
+"""
+
+import hashlib
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.response import Response
+
+STATS_KEY = "tracker:cache-stats:{endpoint}:{outcome}"
+
+# Names of the endpoints wrapped by ``cached``, for reporting
+CACHED_ENDPOINTS = []
+
+
+def conditional(get_version):
+    """Answer conditional GETs of a viewset method from a cheap version stamp.
+
+    ``get_version(request)`` returns ``(version, last_modified)`` for the data
+    behind the endpoint. The ETag combines it with the user, the full path and
+    the Accept header, so a request whose ``If-None-Match`` or
+    ``If-Modified-Since`` still matches gets a 304 before the querysets and
+    serializers of the endpoint run.
+    """
+
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            version, last_modified = request_version(request, get_version)
+            etag = make_etag(request, version)
+            timestamp = int(last_modified.timestamp()) if last_modified else None
+
+            response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+            if response is None:
+                response = method(self, request, *args, **kwargs)
+            if response.status_code in (200, 304):
+                response["ETag"] = etag
+                if timestamp is not None:
+                    response["Last-Modified"] = http_date(timestamp)
+                patch_cache_control(response, private=True, no_cache=True)
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def cached(get_version):
+    """Cache the data returned by a viewset method per user, endpoint, query
+    string and version.
+
+    The version from ``get_version(request)`` is part of the key, so bumping it
+    on writes makes every older entry unreachable at once; they then expire on
+    their own. Hits and misses are counted per endpoint, see ``get_stats``.
+    """
+
+    def decorator(method):
+        endpoint = method.__qualname__
+        CACHED_ENDPOINTS.append(endpoint)
+
+        @wraps(method)
+        def wrapper(self, request, *args, **kwargs):
+            version, _ = request_version(request, get_version)
+            key = make_cache_key(request, endpoint, version)
+            data = cache.get(key)
+            if data is not None:
+                count(endpoint, "hits")
+                response = Response(data)
+            else:
+                count(endpoint, "misses")
+                response = method(self, request, *args, **kwargs)
+                if response.status_code == 200:
+                    cache.set(key, response.data, settings.TRACKER_RESPONSE_CACHE_TIMEOUT)
+            response["X-Cache"] = "HIT" if data is not None else "MISS"
+            return response
+
+        return wrapper
+
+    return decorator
+
+
+def request_version(request, get_version):
+    """``get_version(request)``, computed once per request"""
+    versions = request.__dict__.setdefault("_tracker_versions", {})
+    if get_version not in versions:
+        versions[get_version] = get_version(request)
+    return versions[get_version]
+
+
+def count(endpoint, outcome):
+    key = STATS_KEY.format(endpoint=endpoint, outcome=outcome)
+    if not cache.add(key, 1, timeout=None):
+        try:
+            cache.incr(key)
+        except ValueError:
+            # Evicted between add and incr
+            cache.add(key, 1, timeout=None)
+
+
+def get_stats(endpoints=CACHED_ENDPOINTS):
+    """Hits, misses and hit rate of the response cache for each endpoint"""
+    keys = [
+        STATS_KEY.format(endpoint=endpoint, outcome=outcome)
+        for endpoint in endpoints
+        for outcome in ("hits", "misses")
+    ]
+    values = cache.get_many(keys)
+    stats = {}
+    for endpoint in endpoints:
+        hits = values.get(STATS_KEY.format(endpoint=endpoint, outcome="hits"), 0)
+        misses = values.get(STATS_KEY.format(endpoint=endpoint, outcome="misses"), 0)
+        total = hits + misses
+        stats[endpoint] = {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / total if total else None,
+        }
+    return stats
+
+
+def make_cache_key(request, endpoint, version):
+    key = "|".join([str(request.user.pk), endpoint, str(version), request.get_full_path()])
+    return "tracker:response:" + hashlib.sha1(key.encode()).hexdigest()
+
+
+def make_etag(request, version):
+    key = "|".join(
+        [
+            str(request.user.pk),
+            str(version),
+            request.get_full_path(),
+            request.META.get("HTTP_ACCEPT", ""),
+        ]
+    )
+    return quote_etag(hashlib.sha1(key.encode()).hexdigest())
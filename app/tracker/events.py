@@ -0,0 +1,215 @@
+"""
+Live project events for Tracker api
+
+Task changes are published to a hub once their transaction commits and fanned
+out to the server-sent events streams of the project. The default hub lives in
+the worker process; ``TRACKER_EVENT_HUB`` names another class with the same
+``subscribe``/``publish`` interface to share events between workers.
+"""
+
+import asyncio
+import json
+import threading
+from collections import defaultdict, deque
+from functools import cache
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+from rest_framework.renderers import BaseRenderer
+
+# Events a subscriber may fall behind by before its stream is closed
+MAX_PENDING_EVENTS = 100
+# Seconds between keep-alive comments on an idle stream
+HEARTBEAT_SECONDS = 15
+# Milliseconds a client waits before reconnecting a closed stream
+RETRY_MILLISECONDS = 3000
+
+TASK_FIELDS = (
+    "id",
+    "project_id",
+    "name",
+    "description",
+    "status",
+    "priority",
+    "owner_id",
+    "due_date",
+    "created_at",
+    "updated_at",
+    "user_id",
+)
+
+
+class Subscription:
+    """Events of one channel waiting to be read by one stream.
+
+    Delivery may come from any thread, reading happens on the event loop of the
+    stream. A subscriber that falls ``max_pending`` events behind is closed
+    rather than buffered without bound: its client reconnects and refetches.
+    """
+
+    def __init__(self, hub, channel, max_pending=MAX_PENDING_EVENTS):
+        self.hub = hub
+        self.channel = channel
+        self.max_pending = max_pending
+        self.closed = False
+        self._pending = deque()
+        self._waiter = None
+        self._lock = threading.Lock()
+
+    def deliver(self, event):
+        with self._lock:
+            if self.closed:
+                return
+            if len(self._pending) < self.max_pending:
+                self._pending.append(event)
+            else:
+                self._pending.clear()
+                self.closed = True
+            waiter, self._waiter = self._waiter, None
+        if self.closed:
+            self.hub.unsubscribe(self)
+        _wake(waiter)
+
+    async def get(self):
+        """Next event, or None once the subscription is closed"""
+        while True:
+            with self._lock:
+                if self._pending:
+                    return self._pending.popleft()
+                if self.closed:
+                    return None
+                loop = asyncio.get_running_loop()
+                self._waiter = (loop, loop.create_future())
+                future = self._waiter[1]
+            await future
+
+    def close(self):
+        with self._lock:
+            self.closed = True
+            waiter, self._waiter = self._waiter, None
+        self.hub.unsubscribe(self)
+        _wake(waiter)
+
+
+def _wake(waiter):
+    if waiter is not None:
+        loop, future = waiter
+        loop.call_soon_threadsafe(_resolve, future)
+
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+
+class LocalHub:
+    """In-process publish/subscribe hub, events reach the subscribers of the
+    same worker only"""
+
+    def __init__(self):
+        self._channels = defaultdict(set)
+        self._sequence = 0
+        self._lock = threading.Lock()
+
+    def subscribe(self, channel):
+        subscription = Subscription(self, channel)
+        with self._lock:
+            self._channels[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            subscribers = self._channels.get(subscription.channel)
+            if subscribers is not None:
+                subscribers.discard(subscription)
+                if not subscribers:
+                    del self._channels[subscription.channel]
+
+    def publish(self, channel, event_type, data):
+        """Send an event with JSON encoded ``data`` to the subscribers of a channel"""
+        with self._lock:
+            self._sequence += 1
+            event = (self._sequence, event_type, data)
+            subscribers = list(self._channels.get(channel, ()))
+        for subscription in subscribers:
+            subscription.deliver(event)
+
+    def subscriber_count(self, channel):
+        with self._lock:
+            return len(self._channels.get(channel, ()))
+
+
+@cache
+def get_hub():
+    """The hub of this process, of the class named by ``TRACKER_EVENT_HUB``"""
+    return import_string(settings.TRACKER_EVENT_HUB)()
+
+
+def project_channel(project_id):
+    return f"project:{project_id}"
+
+
+def publish_project_events(project_id, events):
+    """Publish ``(event_type, data)`` pairs to the stream of a project once the
+    current transaction commits, so rolled back changes are never announced"""
+    channel = project_channel(project_id)
+    messages = [
+        (event_type, json.dumps(data, cls=DjangoJSONEncoder, separators=(",", ":")))
+        for event_type, data in events
+    ]
+
+    def publish():
+        hub = get_hub()
+        for event_type, data in messages:
+            hub.publish(channel, event_type, data)
+
+    transaction.on_commit(publish)
+
+
+def task_data(task):
+    """Fields of a task as sent in its events, related objects by id"""
+    return {field.removesuffix("_id"): getattr(task, field) for field in TASK_FIELDS}
+
+
+class EventStream:
+    """Server-sent events of a subscription, with a keep-alive comment every
+    ``heartbeat`` seconds. Closing the response closes the subscription."""
+
+    def __init__(self, subscription, heartbeat=HEARTBEAT_SECONDS):
+        self.subscription = subscription
+        self.heartbeat = heartbeat
+
+    def __aiter__(self):
+        return self._messages()
+
+    async def _messages(self):
+        try:
+            yield f"retry: {RETRY_MILLISECONDS}\n\n".encode()
+            while True:
+                try:
+                    event = await asyncio.wait_for(self.subscription.get(), self.heartbeat)
+                except asyncio.TimeoutError:
+                    yield b": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return
+                event_id, event_type, data = event
+                yield f"id: {event_id}\nevent: {event_type}\ndata: {data}\n\n".encode()
+        finally:
+            self.subscription.close()
+
+    def close(self):
+        self.subscription.close()
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets ``Accept: text/event-stream`` requests through content negotiation,
+    the stream itself is written by ``EventStream``"""
+
+    media_type = "text/event-stream"
+    format = "event-stream"
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return json.dumps(data).encode() if data is not None else b""
@@ -0,0 +1,67 @@
+"""
+Filters for Tracker api
+"""
+
+import calendar
+
+from django.db.models import Q
+from django.utils import timezone
+from django_filters import rest_framework as filters
+from rest_framework.exceptions import ValidationError
+
+from . import models
+
+
+class TransactionFilter(filters.FilterSet):
+    """Transaction filters. Every filter is combined with the user of the
+    request, so each one has a matching index prefixed with ``user``"""
+
+    UNCATEGORIZED = "uncategorized"
+
+    created_at = filters.DateFilter(method="filter_month", label="Any day of the month")
+    date_from = filters.DateFilter(field_name="created_at", lookup_expr="gte")
+    date_to = filters.DateFilter(field_name="created_at", lookup_expr="lte")
+    transaction_type = filters.ChoiceFilter(choices=models.Transaction.TRANSACTION_TYPE_COICES)
+    category = filters.CharFilter(method="filter_category", label="Category id or 'uncategorized'")
+    amount_min = filters.NumberFilter(field_name="amount", lookup_expr="gte")
+    amount_max = filters.NumberFilter(field_name="amount", lookup_expr="lte")
+    description = filters.CharFilter(field_name="description", lookup_expr="icontains")
+
+    class Meta:
+        model = models.Transaction
+        fields = []
+
+    def filter_month(self, queryset, name, value):
+        last_day = calendar.monthrange(value.year, value.month)[1]
+        return queryset.filter(
+            created_at__range=(value.replace(day=1), value.replace(day=last_day))
+        )
+
+    def filter_category(self, queryset, name, value):
+        if value == self.UNCATEGORIZED:
+            return queryset.filter(category__isnull=True)
+        if not value.isdigit():
+            raise ValidationError({"category": ["Expected a category id or 'uncategorized'."]})
+        return queryset.filter(category_id=int(value))
+
+
+class TaskFilter(filters.FilterSet):
+    """Task filters. Every filter is combined with the project of the route,
+    status and due date ones have matching indexes"""
+
+    status = filters.ChoiceFilter(choices=models.Task.STATUS_CHOICES)
+    priority = filters.NumberFilter(field_name="priority")
+    priority_min = filters.NumberFilter(field_name="priority", lookup_expr="gte")
+    priority_max = filters.NumberFilter(field_name="priority", lookup_expr="lte")
+    owner = filters.NumberFilter(field_name="owner_id")
+    due_date_from = filters.DateFilter(field_name="due_date", lookup_expr="gte")
+    due_date_to = filters.DateFilter(field_name="due_date", lookup_expr="lte")
+    overdue = filters.BooleanFilter(method="filter_overdue", label="Past due and not completed")
+
+    class Meta:
+        model = models.Task
+        fields = []
+
+    def filter_overdue(self, queryset, name, value):
+        overdue = Q(due_date__lt=timezone.localdate()) & ~Q(status=models.Task.COMPLETED)
+        return queryset.filter(overdue) if value else queryset.exclude(overdue)
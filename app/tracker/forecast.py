@@ -0,0 +1,122 @@
+"""
+Cash-flow forecast of a user's balance
+"""
+
+from datetime import date
+from decimal import Decimal
+
+import numpy as np
+from django.utils import timezone
+
+from . import models
+
+# Complete months of history the forecast is fitted on
+HISTORY_MONTHS = 36
+# Months averaged for the level of each series
+MOVING_AVERAGE_MONTHS = 3
+
+
+def load_history(user_id, first_month, last_month):
+    """Monthly totals of a user between two months as columnar arrays:
+    ``(month numbers, series codes, amounts, series)``.
+
+    Reads the monthly rollups, which already hold the history totalled per
+    month, category and type, so the cost depends on the months and categories
+    involved rather than on the number of transactions. A series is one
+    ``(category_id, transaction_type)`` pair, ``series`` lists them by code.
+    """
+    rows = models.MonthlyRollup.objects.filter(
+        user_id=user_id, month__range=(first_month, last_month), transaction_count__gt=0
+    ).values_list("month", "category_id", "transaction_type", "amount")
+    if not rows:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0), []
+    months, category_ids, types, amounts = zip(*rows)
+
+    month_numbers = np.array(months, dtype="datetime64[M]").astype(np.int64)
+    keys = np.array(
+        [category_id or 0 for category_id in category_ids], dtype=np.int64
+    ) * 2 + (np.array(types) == "IN")
+    unique_keys, codes = np.unique(keys, return_inverse=True)
+    series = [(int(key) // 2 or None, "IN" if key % 2 else "OUT") for key in unique_keys]
+    return month_numbers, codes, np.array(amounts, dtype=np.float64), series
+
+
+def project(history, horizon, gap=0, moving_average=MOVING_AVERAGE_MONTHS):
+    """Project a ``(series, months)`` matrix of monthly totals over ``horizon``
+    months, starting ``gap`` months after the end of the history.
+
+    Each series continues at the moving average of its last months, with the
+    seasonal deviation of each calendar month taken out of the average and put
+    back into the projection. Seasonality is measured over the last whole
+    years of history, when there is at least one.
+    """
+    series_count, month_count = history.shape
+    seasonal = np.zeros((series_count, 12))
+    years = month_count // 12
+    if years:
+        # The last whole years end right before month 0, so column m % 12 of
+        # each year is the same calendar month as month m after the history
+        recent = history[:, -years * 12:].reshape(series_count, years, 12)
+        seasonal = (recent - recent.mean(axis=2, keepdims=True)).mean(axis=1)
+
+    window = min(moving_average, month_count)
+    level = np.zeros(series_count)
+    if window:
+        level = (history[:, -window:] - seasonal[:, 12 - window:]).mean(axis=1)
+    return np.maximum(level[:, None] + seasonal[:, (gap + np.arange(horizon)) % 12], 0)
+
+
+def forecast_balance(user_id, months=6, today=None):
+    """Income, expense and closing balance of each of the next ``months``
+    months, starting from the current balance.
+
+    Fitted on up to ``HISTORY_MONTHS`` complete months before the current one.
+    """
+    today = today or timezone.localdate()
+    current = np.datetime64(today, "M").astype(np.int64)
+    first = current - HISTORY_MONTHS
+    month_numbers, codes, amounts, series = load_history(
+        user_id, _month_date(first), _month_date(current - 1)
+    )
+
+    history = np.zeros((len(series), HISTORY_MONTHS))
+    np.add.at(history, (codes, month_numbers - first), amounts)
+    # Months before the first one with any activity would flatten the averages
+    active = np.flatnonzero(history.any(axis=0))
+    history = history[:, active[0]:] if active.size else history[:, :0]
+
+    # The current month is still in progress, the forecast starts with the next
+    projected = project(history, months, gap=1)
+    is_income = np.array([transaction_type == "IN" for _, transaction_type in series], bool)
+    income = projected[is_income].sum(axis=0)
+    expense = projected[~is_income].sum(axis=0)
+    net = income - expense
+
+    balance = (
+        models.Balance.objects.filter(user_id=user_id).values_list("amount", flat=True).first()
+        or Decimal(0)
+    )
+    closing = float(balance) + np.cumsum(net)
+    return {
+        "balance": balance,
+        "months": [
+            {
+                "month": _month_date(current + 1 + index),
+                "income": _money(income[index]),
+                "expense": _money(expense[index]),
+                "net": _money(net[index]),
+                "balance": _money(closing[index]),
+            }
+            for index in range(months)
+        ],
+    }
+
+
+def _month_date(month_number):
+    year, month = divmod(int(month_number), 12)
+    return date(1970 + year, month + 1, 1)
+
+
+def _money(value):
+    return Decimal(f"{value:.2f}")
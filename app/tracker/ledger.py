@@ -0,0 +1,139 @@
+"""
+Ledger writes: transactions with their effect on the balance and rollups
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from . import models
+from .rollups import apply_rollup_deltas
+from .utilities import (
+    bump_version,
+    increment_or_create,
+    month_start,
+    record_deletions,
+    signed_amount,
+)
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.db.transaction import atomic
+from django.utils import timezone
+
+
+def stored_transaction(transaction_pk, user_id):
+    """Return the ledger entry of the stored version of a transaction.
+
+    The row is locked until the end of the surrounding atomic block so two
+    concurrent updates of the same transaction can't both reverse the old amount.
+    """
+    prev_transaction = (
+        models.Transaction.objects.select_for_update()
+        .filter(pk=transaction_pk)
+        .values(*models.Transaction.LEDGER_FIELDS)
+        .first()
+    )
+    if prev_transaction is not None and prev_transaction["user_id"] != user_id:
+        raise ValidationError("Transaction does not belong to the user")
+    return prev_transaction
+
+
+def apply_balance_delta(user_id, delta):
+    """Add a signed delta to the user's balance"""
+    if delta:
+        increment_or_create(models.Balance, {"user_id": user_id}, amount=delta)
+
+
+def apply_transaction_changes(user_id, removed=(), added=()):
+    """Apply the effect of removed and added transaction versions to the
+    balance and the monthly rollups.
+
+    Entries are dicts with the ``Transaction.LEDGER_FIELDS``, or totals of
+    several transactions with an extra ``count`` (see ``ledger_totals``).
+    Deltas are merged first, so every balance or rollup row is written at most
+    once per call. Callers number the write with the ledger ``bump_version``
+    before touching any row.
+    """
+    balance_delta = Decimal(0)
+    rollup_deltas = defaultdict(lambda: [Decimal(0), 0])
+    for entries, sign in ((removed, -1), (added, 1)):
+        for entry in entries:
+            balance_delta += sign * signed_amount(entry["transaction_type"], entry["amount"])
+            month = month_start(entry["created_at"])
+            rollup = rollup_deltas[(month, entry["category_id"], entry["transaction_type"])]
+            rollup[0] += sign * entry["amount"]
+            rollup[1] += sign * entry.get("count", 1)
+
+    apply_balance_delta(user_id, balance_delta)
+    apply_rollup_deltas(
+        user_id, {key: delta for key, delta in rollup_deltas.items() if delta[0] or delta[1]}
+    )
+
+
+def ledger_totals(queryset):
+    """Ledger entries of a queryset of transactions, totalled per type,
+    category and month in one grouped query"""
+    rows = (
+        queryset.annotate(month=TruncMonth("created_at"))
+        .values("transaction_type", "category_id", "month")
+        .annotate(total=Sum("amount"), count=Count("id"))
+        .order_by()
+    )
+    return [
+        {
+            "transaction_type": row["transaction_type"],
+            "category_id": row["category_id"],
+            "created_at": row["month"],
+            "amount": row["total"],
+            "count": row["count"],
+        }
+        for row in rows
+    ]
+
+
+def bulk_delete_transactions(user_id, queryset):
+    """Delete a queryset of a user's transactions, reverting their effect on
+    the balance and rollups with one net adjustment.
+
+    The number of statements depends on the months and categories involved,
+    not on the number of transactions.
+    """
+    with atomic():
+        change_seq = bump_version(user_id, models.DataVersion.LEDGER)
+        ids = list(queryset.select_for_update().values_list("id", flat=True))
+        selected = models.Transaction.objects.filter(user_id=user_id, id__in=ids)
+        removed = ledger_totals(selected)
+        record_deletions(
+            models.Tombstone.TRANSACTION, [(pk, user_id, None) for pk in ids], change_seq
+        )
+        deleted, _ = selected.delete()
+        if deleted:
+            apply_transaction_changes(user_id, removed=removed)
+    return deleted
+
+
+def bulk_update_transactions(user_id, queryset, changes):
+    """Apply the same field changes to a queryset of a user's transactions with
+    one UPDATE, adjusting the balance and rollups by the net difference"""
+    with atomic():
+        change_seq = bump_version(user_id, models.DataVersion.LEDGER)
+        ids = list(queryset.select_for_update().values_list("id", flat=True))
+        selected = models.Transaction.objects.filter(user_id=user_id, id__in=ids)
+        removed = ledger_totals(selected)
+        updated = selected.update(**changes, updated_at=timezone.now(), change_seq=change_seq)
+        if updated:
+            apply_transaction_changes(user_id, removed=removed, added=ledger_totals(selected))
+    return updated
+
+
+def bulk_create_transactions(user_id, transactions, batch_size=500):
+    """Insert many transactions with batched INSERTs and apply their combined
+    effect to the balance and rollups once"""
+    with atomic():
+        transactions = list(transactions)
+        change_seq = bump_version(user_id, models.DataVersion.LEDGER)
+        for transaction in transactions:
+            transaction.change_seq = change_seq
+        created = models.Transaction.objects.bulk_create(transactions, batch_size=batch_size)
+        apply_transaction_changes(user_id, added=[t.ledger_entry for t in created])
+    return created
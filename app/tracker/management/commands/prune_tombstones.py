@@ -0,0 +1,113 @@
+"""
+Django command to prune the tombstones that sync clients had time to read.
+"""
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Case, F, Max, Q, Value, When
+from django.db.models.functions import Greatest
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from tracker import models
+from tracker.projects import lock_projects
+
+
+class Command(BaseCommand):
+    """Delete the tombstones older than ``--days``, a batch of users or
+    projects at a time.
+
+    The tombstones of a user, or of the tasks of a project, are deleted up to
+    the newest change number among the old ones, which is kept as the pruned
+    version of the user or project. Sync cursors from before it get a 410
+    and sync again from scratch instead of missing the deletions.
+    """
+
+    help = "Delete the tombstones older than the retention period."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days",
+            type=int,
+            default=90,
+            help="Keep the tombstones of the last DAYS days.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of users or projects processed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        if options["days"] < 0:
+            raise CommandError("--days must not be negative")
+        cutoff = timezone.now() - timedelta(days=options["days"])
+
+        old = models.Tombstone.objects.filter(deleted_at__lt=cutoff)
+        ledger = self.prune(
+            old.filter(user__isnull=False), "user_id", self.set_ledger_horizons, batch_size
+        )
+        tasks = self.prune(
+            old.filter(project_id__isnull=False),
+            "project_id",
+            self.set_project_horizons,
+            batch_size,
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Deleted {ledger} ledger and {tasks} task tombstones")
+        )
+
+    @staticmethod
+    def prune(old, key, set_horizons, batch_size):
+        """Prune the ``old`` tombstones a batch of ``key`` values at a time,
+        keeping the horizons with ``set_horizons``. Returns how many were
+        deleted"""
+        owners = old.order_by(key).values_list(key, flat=True).distinct()
+        last = deleted = 0
+        while True:
+            batch = list(owners.filter(**{f"{key}__gt": last})[:batch_size])
+            if not batch:
+                break
+            last = batch[-1]
+            with atomic():
+                horizons = dict(
+                    old.filter(**{f"{key}__in": batch})
+                    .values_list(key)
+                    .annotate(seq=Max("change_seq"))
+                    .order_by()
+                )
+                set_horizons(horizons)
+                condition = Q(pk__in=[])
+                for owner, seq in horizons.items():
+                    condition |= Q(**{key: owner}, change_seq__lte=seq)
+                deleted += models.Tombstone.objects.filter(condition).delete()[0]
+        return deleted
+
+    @staticmethod
+    def set_ledger_horizons(horizons):
+        """Raise the pruned ledger version of users, locking their version rows
+        in user id order like ``bump_versions``"""
+        versions = models.DataVersion.objects.filter(
+            user_id__in=horizons, scope=models.DataVersion.LEDGER
+        )
+        list(versions.select_for_update().order_by("user_id").values_list("pk", flat=True))
+        versions.update(pruned_version=Greatest(F("pruned_version"), horizon(horizons, "user_id")))
+
+    @staticmethod
+    def set_project_horizons(horizons):
+        """Raise the pruned change number of projects, locked in id order like
+        the other project writes"""
+        lock_projects(horizons)
+        models.Project.objects.filter(pk__in=horizons).update(
+            pruned_seq=Greatest(F("pruned_seq"), horizon(horizons, "pk"))
+        )
+
+
+def horizon(horizons, key):
+    """The pruned change number of each row, by its ``key``"""
+    return Case(*[When(**{key: owner}, then=Value(seq)) for owner, seq in horizons.items()])
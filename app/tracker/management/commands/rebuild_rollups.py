@@ -0,0 +1,113 @@
+"""
+Django command to rebuild or verify the monthly transaction rollups.
+"""
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Count, Sum
+from django.db.models.functions import TruncMonth
+from django.db.transaction import atomic
+
+from tracker import models
+
+
+class Command(BaseCommand):
+    """Recompute the monthly rollups from the transactions, a batch of users at a time."""
+
+    help = "Rebuild the monthly transaction rollups, or check them with --verify."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--verify",
+            action="store_true",
+            help="Only report users whose rollups don't match their transactions.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of users processed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+
+        users = get_user_model().objects.order_by("pk").values_list("pk", flat=True)
+        last_pk = 0
+        checked = mismatched = 0
+        while True:
+            user_ids = list(users.filter(pk__gt=last_pk)[:batch_size])
+            if not user_ids:
+                break
+            last_pk = user_ids[-1]
+            checked += len(user_ids)
+
+            expected = self.expected_rollups(user_ids)
+            if options["verify"]:
+                stale = {key[0] for key in self.diff(expected, self.stored_rollups(user_ids))}
+                mismatched += len(stale)
+                for user_id in sorted(stale):
+                    self.stdout.write(f"User {user_id}: rollups don't match transactions")
+            else:
+                self.replace_rollups(user_ids, expected)
+
+        if options["verify"]:
+            if mismatched:
+                raise CommandError(f"{mismatched} of {checked} users have stale rollups")
+            self.stdout.write(self.style.SUCCESS(f"Rollups of {checked} users are up to date"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt rollups of {checked} users"))
+
+    def expected_rollups(self, user_ids):
+        """Rollups computed from the transactions of the given users"""
+        rows = (
+            models.Transaction.objects.filter(user_id__in=user_ids)
+            .annotate(month=TruncMonth("created_at"))
+            .values("user_id", "month", "category_id", "transaction_type")
+            .annotate(total=Sum("amount"), count=Count("id"))
+            .order_by()
+        )
+        return {
+            (row["user_id"], row["month"], row["category_id"], row["transaction_type"]): (
+                row["total"],
+                row["count"],
+            )
+            for row in rows
+        }
+
+    def stored_rollups(self, user_ids):
+        """Non empty rollups currently stored for the given users"""
+        rows = models.MonthlyRollup.objects.filter(
+            user_id__in=user_ids, transaction_count__gt=0
+        ).values_list(
+            "user_id", "month", "category_id", "transaction_type", "amount", "transaction_count"
+        )
+        return {tuple(row[:4]): (row[4], row[5]) for row in rows}
+
+    @staticmethod
+    def diff(expected, stored):
+        """Keys whose totals differ between the two sets of rollups"""
+        keys = expected.keys() | stored.keys()
+        return {key for key in keys if expected.get(key) != stored.get(key)}
+
+    @staticmethod
+    def replace_rollups(user_ids, expected):
+        with atomic():
+            models.MonthlyRollup.objects.filter(user_id__in=user_ids).delete()
+            models.MonthlyRollup.objects.bulk_create(
+                [
+                    models.MonthlyRollup(
+                        user_id=user_id,
+                        month=month,
+                        category_id=category_id,
+                        transaction_type=transaction_type,
+                        amount=total,
+                        transaction_count=count,
+                    )
+                    for (user_id, month, category_id, transaction_type), (total, count)
+                    in expected.items()
+                ],
+                batch_size=500,
+            )
@@ -0,0 +1,107 @@
+"""
+Django command to materialize the due occurrences of recurring transactions.
+"""
+from collections import defaultdict
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import F, Q
+from django.db.transaction import atomic
+from django.utils import timezone
+
+from tracker import models
+from tracker.ledger import bulk_create_transactions
+from tracker.utilities import next_occurrence
+
+
+class Command(BaseCommand):
+    """Create the transactions of every recurring transaction due up to a date,
+    a batch of users at a time.
+
+    Each recurring transaction remembers its first occurrence not yet created,
+    so reruns only pick up what is newly due, and the unique occurrence
+    constraint on transactions rules out duplicates from concurrent runs. The
+    transactions of a user are inserted in bulk with one balance and rollup
+    update, however many periods were missed.
+    """
+
+    help = "Create the transactions of recurring transactions that are due."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--until",
+            type=date.fromisoformat,
+            help="Create occurrences up to this date (YYYY-MM-DD), today by default.",
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=500,
+            help="Number of users processed per batch.",
+        )
+
+    def handle(self, *args, **options):
+        """Entrypoint for command."""
+        batch_size = options["batch_size"]
+        if batch_size < 1:
+            raise CommandError("--batch-size must be positive")
+        until = options["until"] or timezone.localdate()
+
+        users = (
+            self.due(until).order_by("user_id").values_list("user_id", flat=True).distinct()
+        )
+        last_user_id = 0
+        created = processed = 0
+        while True:
+            user_ids = list(users.filter(user_id__gt=last_user_id)[:batch_size])
+            if not user_ids:
+                break
+            last_user_id = user_ids[-1]
+            processed += len(user_ids)
+            created += self.materialize(user_ids, until)
+
+        self.stdout.write(
+            self.style.SUCCESS(f"Created {created} transactions for {processed} users")
+        )
+
+    @staticmethod
+    def due(until):
+        """Recurring transactions with an occurrence on or before ``until``"""
+        return models.RecurringTransaction.objects.filter(
+            Q(end_date__isnull=True) | Q(end_date__gte=F("next_run")),
+            next_run__lte=until,
+        )
+
+    def materialize(self, user_ids, until):
+        """Create the due occurrences of a batch of users and move their
+        recurring transactions past ``until``"""
+        with atomic():
+            recurring = list(
+                self.due(until).select_for_update().filter(user_id__in=user_ids).order_by("pk")
+            )
+            if not recurring:
+                return 0
+            existing = set(
+                models.Transaction.objects.filter(
+                    recurring__in=recurring,
+                    created_at__gte=min(item.next_run for item in recurring),
+                ).values_list("recurring_id", "created_at")
+            )
+
+            transactions = defaultdict(list)
+            for item in recurring:
+                days = list(item.occurrences(until))
+                transactions[item.user_id].extend(
+                    item.materialize(day) for day in days if (item.pk, day) not in existing
+                )
+                item.next_run = next_occurrence(
+                    days[-1], item.frequency, item.interval, item.start_date.day
+                )
+
+            for user_id, user_transactions in transactions.items():
+                if user_transactions:
+                    bulk_create_transactions(user_id, user_transactions)
+            models.RecurringTransaction.objects.bulk_update(
+                recurring, ["next_run"], batch_size=500
+            )
+        return sum(len(user_transactions) for user_transactions in transactions.values())
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-17 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0012_dataversion'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='dataversion',
+            name='scope',
+            field=models.CharField(choices=[('ledger', 'Transactions, balance and categories'), ('projects', 'Projects and tasks'), ('team', 'Team')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,77 @@
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE tracker_transaction ADD COLUMN search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(description, ''))) STORED
+    """,
+    "CREATE INDEX transaction_search_idx ON tracker_transaction USING GIN (search_vector)",
+]
+
+POSTGRES_BACKWARD = [
+    "DROP INDEX IF EXISTS transaction_search_idx",
+    "ALTER TABLE tracker_transaction DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE tracker_transaction_fts USING fts5(
+        description, content='tracker_transaction', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER tracker_transaction_fts_insert AFTER INSERT ON tracker_transaction BEGIN
+        INSERT INTO tracker_transaction_fts(rowid, description)
+        VALUES (new.id, coalesce(new.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_transaction_fts_delete AFTER DELETE ON tracker_transaction BEGIN
+        INSERT INTO tracker_transaction_fts(tracker_transaction_fts, rowid, description)
+        VALUES ('delete', old.id, coalesce(old.description, ''));
+    END
+    """,
+    """
+    CREATE TRIGGER tracker_transaction_fts_update AFTER UPDATE OF description
+    ON tracker_transaction BEGIN
+        INSERT INTO tracker_transaction_fts(tracker_transaction_fts, rowid, description)
+        VALUES ('delete', old.id, coalesce(old.description, ''));
+        INSERT INTO tracker_transaction_fts(rowid, description)
+        VALUES (new.id, coalesce(new.description, ''));
+    END
+    """,
+    "INSERT INTO tracker_transaction_fts(tracker_transaction_fts) VALUES ('rebuild')",
+]
+
+SQLITE_BACKWARD = [
+    "DROP TRIGGER IF EXISTS tracker_transaction_fts_update",
+    "DROP TRIGGER IF EXISTS tracker_transaction_fts_delete",
+    "DROP TRIGGER IF EXISTS tracker_transaction_fts_insert",
+    "DROP TABLE IF EXISTS tracker_transaction_fts",
+]
+
+
+def run_for_vendor(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+    """Full-text index of transaction descriptions, maintained by the database:
+    a generated tsvector column with a GIN index on PostgreSQL and an FTS5
+    table kept in sync by triggers on SQLite."""
+
+    dependencies = [
+        ("tracker", "0013_dataversion_scopes"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor({"postgresql": POSTGRES_FORWARD, "sqlite": SQLITE_FORWARD}),
+            run_for_vendor({"postgresql": POSTGRES_BACKWARD, "sqlite": SQLITE_BACKWARD}),
+        ),
+    ]
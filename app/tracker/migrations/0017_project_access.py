@@ -0,0 +1,52 @@
+# Generated by Django 5.1 on 2026-10-17 23:45
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def build_access(apps, schema_editor):
+    Project = apps.get_model("tracker", "Project")
+    ProjectAccess = apps.get_model("tracker", "ProjectAccess")
+    ProjectAccess.objects.bulk_create(
+        (
+            ProjectAccess(project_id=project_id, user_id=user_id, role="owner")
+            for project_id, user_id in Project.objects.values_list("id", "user_id").iterator()
+        ),
+        batch_size=500,
+    )
+    # Owners who are also participants keep their owner row
+    ProjectAccess.objects.bulk_create(
+        (
+            ProjectAccess(project_id=project_id, user_id=user_id, role="participant")
+            for project_id, user_id in Project.participants.through.objects.values_list(
+                "project_id", "user_id"
+            ).iterator()
+        ),
+        batch_size=500,
+        ignore_conflicts=True,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tracker', '0016_recurring_transaction'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectAccess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('role', models.CharField(choices=[('owner', 'Owner'), ('participant', 'Participant')], max_length=11)),
+                ('project', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='access', to='tracker.project')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('user', 'project'), name='unique_project_access')],
+            },
+        ),
+        migrations.RunPython(build_access, migrations.RunPython.noop),
+    ]
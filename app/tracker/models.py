@@ -4,8 +4,18 @@ Models for Tracker api
 
 from django.utils import timezone
 from django.db import models
+from django.db.transaction import atomic
 from django.conf import settings
-from .utilities import normalize_balance
+from django.core.validators import MinValueValidator
+from .events import publish_project_events, task_data
+from .ledger import apply_transaction_changes, stored_transaction
+from .projects import (
+    add_project_participants,
+    record_access_changes,
+    set_project_owner,
+    touch_projects,
+)
+from .utilities import bump_version, next_occurrence, record_deletions
 
 
 class Category(models.Model):
@@ -13,10 +23,30 @@ class Category(models.Model):
 
     name = models.CharField(max_length=255)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    change_seq = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "change_seq"], name="category_user_change_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Create or update the category, numbered with the new ledger version"""
+        with atomic():
+            self.change_seq = bump_version(self.user_id, DataVersion.LEDGER)
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        """Delete the category, numbered with the new ledger version. Its
+        monthly rollups are moved to uncategorized by a ``pre_delete`` signal"""
+        with atomic():
+            change_seq = bump_version(self.user_id, DataVersion.LEDGER)
+            record_deletions(Tombstone.CATEGORY, [(self.pk, self.user_id, None)], change_seq)
+            return super().delete(*args, **kwargs)
+
 
 class Balance(models.Model):
     """Balance model"""
@@ -43,33 +73,212 @@ class Transaction(models.Model):
     description = models.TextField(blank=True, null=True)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True)
+    recurring = models.ForeignKey(
+        "RecurringTransaction",
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name="transactions",
+    )
+    change_seq = models.PositiveBigIntegerField(default=0, editable=False)
+
+    LEDGER_FIELDS = ("user_id", "transaction_type", "amount", "category_id", "created_at")
+
+    class Meta:
+        indexes = [
+            # Supports the newest-first keyset pagination of a user's history
+            models.Index(
+                fields=["user", "-created_at", "-id"], name="transaction_user_created_idx"
+            ),
+            # One index per filter of TransactionFilter, in the list ordering
+            models.Index(
+                fields=["user", "transaction_type", "-created_at", "-id"],
+                name="transaction_user_type_idx",
+            ),
+            models.Index(
+                fields=["user", "category", "-created_at", "-id"],
+                name="transaction_user_category_idx",
+            ),
+            models.Index(fields=["user", "amount"], name="transaction_user_amount_idx"),
+            # Changes since a sync cursor
+            models.Index(fields=["user", "change_seq"], name="transaction_user_change_idx"),
+        ]
+        constraints = [
+            # A recurring transaction is materialized at most once per date
+            models.UniqueConstraint(
+                fields=["recurring", "created_at"],
+                condition=models.Q(recurring__isnull=False),
+                name="unique_recurring_occurrence",
+            ),
+        ]
 
     def __str__(self):
         return self.transaction_type
 
+    @property
+    def ledger_entry(self):
+        """The fields that determine the effect of the transaction on the
+        balance and rollups, with their values cleaned"""
+        return {
+            field: self._meta.get_field(field).to_python(getattr(self, field))
+            for field in self.LEDGER_FIELDS
+        }
+
     def save(self, *args, **kwargs):
-        """Create or update a transaction, updating the current balance"""
-        balance, created = Balance.objects.get_or_create(user=self.user)
+        """Create or update a transaction, applying the net change to the balance
+        and rollups"""
+        with atomic():
+            self.change_seq = bump_version(self.user_id, DataVersion.LEDGER)
+            previous = stored_transaction(self.pk, self.user_id) if self.pk else None
+            super().save(*args, **kwargs)
+            apply_transaction_changes(
+                self.user_id,
+                removed=[previous] if previous else [],
+                added=[self.ledger_entry],
+            )
 
-        if self.pk:
-            normalize_balance(balance, self.pk, self.user)
+    def delete(self, *args, **kwargs):
+        """Delete the transaction, reverting its effect on the balance and rollups"""
+        with atomic():
+            change_seq = bump_version(self.user_id, DataVersion.LEDGER)
+            previous = stored_transaction(self.pk, self.user_id)
+            record_deletions(
+                Tombstone.TRANSACTION, [(self.pk, self.user_id, None)], change_seq
+            )
+            deleted = super().delete(*args, **kwargs)
+            apply_transaction_changes(self.user_id, removed=[previous] if previous else [])
+        return deleted
+
+
+class RecurringTransaction(models.Model):
+    """Transaction repeated on a schedule, materialized by the
+    ``run_recurring_transactions`` command"""
+
+    DAILY = "DAY"
+    WEEKLY = "WEEK"
+    MONTHLY = "MONTH"
+    YEARLY = "YEAR"
+    FREQUENCY_CHOICES = [
+        (DAILY, "Daily"),
+        (WEEKLY, "Weekly"),
+        (MONTHLY, "Monthly"),
+        (YEARLY, "Yearly"),
+    ]
 
-        if self.transaction_type == "IN":
-            balance.amount += self.amount
-        else:
-            balance.amount -= self.amount
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    transaction_type = models.CharField(
+        max_length=3, choices=Transaction.TRANSACTION_TYPE_COICES
+    )
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True)
+    description = models.TextField(blank=True, null=True)
+    frequency = models.CharField(max_length=5, choices=FREQUENCY_CHOICES)
+    interval = models.PositiveSmallIntegerField(default=1, validators=[MinValueValidator(1)])
+    start_date = models.DateField()
+    end_date = models.DateField(blank=True, null=True)
+    # First occurrence that hasn't been materialized yet
+    next_run = models.DateField()
 
-        balance.save()
-        super().save(*args, **kwargs)
+    class Meta:
+        indexes = [models.Index(fields=["next_run"], name="recurring_next_run_idx")]
 
-    def delete(self, *args, **kwargs):
-        """Delete the transaction, updating the current balance"""
-        balance = Balance.objects.get(user=self.user)
+    def __str__(self):
+        return f"{self.transaction_type} {self.amount} {self.frequency}"
+
+    def occurrences(self, until):
+        """Dates of the occurrences due from ``next_run`` up to ``until``"""
+        if self.end_date is not None:
+            until = min(until, self.end_date)
+        day = self.next_run
+        while day <= until:
+            yield day
+            day = next_occurrence(day, self.frequency, self.interval, self.start_date.day)
+
+    def materialize(self, day):
+        """Unsaved transaction for the occurrence of ``day``"""
+        return Transaction(
+            user_id=self.user_id,
+            transaction_type=self.transaction_type,
+            amount=self.amount,
+            category_id=self.category_id,
+            description=self.description,
+            created_at=day,
+            recurring=self,
+        )
+
+
+class MonthlyRollup(models.Model):
+    """Totals of a user's transactions per month, category and type, kept up to
+    date on every transaction write"""
 
-        normalize_balance(balance, self.pk, self.user)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    month = models.DateField()
+    category = models.ForeignKey(Category, on_delete=models.CASCADE, null=True)
+    transaction_type = models.CharField(
+        max_length=3, choices=Transaction.TRANSACTION_TYPE_COICES
+    )
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    transaction_count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "month", "category", "transaction_type"],
+                condition=models.Q(category__isnull=False),
+                name="unique_rollup_per_category",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "month", "transaction_type"],
+                condition=models.Q(category__isnull=True),
+                name="unique_rollup_uncategorized",
+            ),
+        ]
 
-        balance.save()
-        super().delete(*args, **kwargs)
+    def __str__(self):
+        return f"{self.month:%Y-%m} {self.transaction_type}"
+
+
+class Budget(models.Model):
+    """Monthly spending limit of a category. The spend of each month is read
+    from the category's expense rollup"""
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    category = models.OneToOneField(Category, on_delete=models.CASCADE, related_name="budget")
+    amount = models.DecimalField(max_digits=10, decimal_places=2)
+
+    def __str__(self):
+        return f"{self.category} {self.amount}"
+
+
+class DataVersion(models.Model):
+    """Counter of the changes to a group of a user's data, bumped on every
+    write so readers get a cheap version stamp for it. The projects version
+    only counts the access granted and revoked, edits are counted by the
+    projects themselves, see ``Project.change_seq``"""
+
+    LEDGER = "ledger"
+    PROJECTS = "projects"
+    TEAM = "team"
+    SCOPE_CHOICES = [
+        (LEDGER, "Transactions, balance and categories"),
+        (PROJECTS, "Projects and tasks"),
+        (TEAM, "Team"),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    scope = models.CharField(max_length=20, choices=SCOPE_CHOICES)
+    version = models.PositiveBigIntegerField(default=0)
+    updated_at = models.DateTimeField(default=timezone.now)
+    # The tombstones numbered up to this version were pruned
+    pruned_version = models.PositiveBigIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "scope"], name="unique_version_scope"),
+        ]
+
+    def __str__(self):
+        return f"{self.scope} v{self.version}"
 
 
 class Team(models.Model):
@@ -80,6 +289,16 @@ class Team(models.Model):
     )
     members = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="teams")
 
+    def save(self, *args, **kwargs):
+        with atomic():
+            super().save(*args, **kwargs)
+            bump_version(self.user_id, DataVersion.TEAM)
+
+    def delete(self, *args, **kwargs):
+        with atomic():
+            bump_version(self.user_id, DataVersion.TEAM)
+            return super().delete(*args, **kwargs)
+
 
 class Project(models.Model):
     """Project Model"""
@@ -92,19 +311,73 @@ class Project(models.Model):
     is_active = models.BooleanField(default=True)
     participants = models.ManyToManyField(settings.AUTH_USER_MODEL, related_name="projects")
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    # Numbers the changes of the project and its tasks, see ``touch_projects``
+    change_seq = models.PositiveBigIntegerField(default=0, editable=False)
+    # The task tombstones numbered up to this change were pruned
+    pruned_seq = models.PositiveBigIntegerField(default=0, editable=False)
 
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        """Create or update the project, keeping the owner's access row"""
+        with atomic():
+            adding = self._state.adding
+            if adding:
+                self.change_seq = 1
+            else:
+                self.change_seq = touch_projects([self.pk]).get(self.pk, self.change_seq)
+            super().save(*args, **kwargs)
+            granted, revoked = set_project_owner(self.pk, self.user_id, adding)
+            record_access_changes(granted=granted, revoked=revoked)
+
+    def delete(self, *args, **kwargs):
+        """Delete the project, recording that everyone with access lost it"""
+        with atomic():
+            touch_projects([self.pk])
+            user_ids = ProjectAccess.objects.filter(project_id=self.pk).values_list(
+                "user_id", flat=True
+            )
+            revoked = [(self.pk, user_id) for user_id in user_ids]
+            deleted = super().delete(*args, **kwargs)
+            record_access_changes(revoked=revoked)
+        return deleted
+
+
+class ProjectAccess(models.Model):
+    """Who can access a project: its owner and its participants. Kept in sync
+    with ``Project.user`` and ``Project.participants`` so access is resolved
+    with one lookup on ``(user, project)``"""
+
+    OWNER = "owner"
+    PARTICIPANT = "participant"
+    ROLE_CHOICES = [
+        (OWNER, "Owner"),
+        (PARTICIPANT, "Participant"),
+    ]
+
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="access")
+    role = models.CharField(max_length=11, choices=ROLE_CHOICES)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "project"], name="unique_project_access"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} {self.role} {self.project_id}"
+
 
 class Task(models.Model):
     """Task Model"""
 
+    COMPLETED = "C"
     STATUS_CHOICES = [
         ("N", "Not Started"),
         ("P", "In Progress"),
         ("R", "In Review"),
-        ("C", "Completed"),
+        (COMPLETED, "Completed"),
     ]
 
     project = models.ForeignKey(Project, on_delete=models.CASCADE, related_name="tasks")
@@ -123,21 +396,82 @@ class Task(models.Model):
         null=True,
         related_name="owner",
     )
+    change_seq = models.PositiveBigIntegerField(default=0, editable=False)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a project's tasks, whole or by status
+            models.Index(
+                fields=["project", "-updated_at", "-id"], name="task_project_updated_idx"
+            ),
+            models.Index(
+                fields=["project", "status", "-updated_at", "-id"],
+                name="task_project_status_idx",
+            ),
+            # Owner and due date filters, including overdue tasks
+            models.Index(fields=["owner", "due_date"], name="task_owner_due_idx"),
+            # Changes since a sync cursor
+            models.Index(fields=["project", "change_seq"], name="task_project_change_idx"),
+        ]
 
     def __str__(self):
         return self.name
 
     def save(self, *args, **kwargs):
-        project = self.project
-        super().save(*args, **kwargs)
-        if self.owner and self.owner not in project.participants.all():
-            project.participants.add(self.owner)
-        project.updated_at = timezone.now()
-        project.save()
+        """Create or update the task, adding its owner to the project
+        participants, touching the project and announcing the change"""
+        event_type = "task.created" if self._state.adding else "task.updated"
+        with atomic():
+            self.change_seq = touch_projects([self.project_id]).get(self.project_id, 0)
+            super().save(*args, **kwargs)
+            if self.owner_id:
+                granted = add_project_participants(self.project_id, [self.owner_id])
+                record_access_changes(granted=granted)
+            publish_project_events(self.project_id, [(event_type, task_data(self))])
 
     def delete(self, *args, **kwargs):
+        """Delete the task, touching its project and announcing the change"""
+        data = {"id": self.pk, "project": self.project_id}
+        with atomic():
+            change_seq = touch_projects([self.project_id]).get(self.project_id, 0)
+            record_deletions(Tombstone.TASK, [(self.pk, None, self.project_id)], change_seq)
+            deleted = super().delete(*args, **kwargs)
+            publish_project_events(self.project_id, [("task.deleted", data)])
+        return deleted
+
+
+class Tombstone(models.Model):
+    """A deleted row, kept so syncing clients learn to drop their copy.
+
+    Deleted tasks are found through ``project_id`` and numbered like the
+    project changes, the other kinds through ``user`` and numbered with the
+    ledger version. Projects are not tombstoned: a sync cursor lists the
+    projects its client has, those the user can no longer access are gone.
+    """
+
+    CATEGORY = "category"
+    TRANSACTION = "transaction"
+    TASK = "task"
+    KIND_CHOICES = [
+        (CATEGORY, "Category"),
+        (TRANSACTION, "Transaction"),
+        (TASK, "Task"),
+    ]
+
+    kind = models.CharField(max_length=11, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.CASCADE, null=True, blank=True
+    )
+    project_id = models.PositiveBigIntegerField(null=True, blank=True)
+    change_seq = models.PositiveBigIntegerField()
+    deleted_at = models.DateTimeField(default=timezone.now)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "change_seq"], name="tombstone_user_change_idx"),
+            models.Index(fields=["project_id", "change_seq"], name="tombstone_project_change_idx"),
+        ]
 
-        project = self.project
-        super().delete(*args, **kwargs)
-        project.updated_at = timezone.now()
-        project.save()
+    def __str__(self):
+        return f"{self.kind} {self.object_id}"
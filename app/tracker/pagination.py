@@ -0,0 +1,163 @@
+"""
+Pagination classes for Tracker api
+"""
+
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """Opaque cursor pagination over a unique ordering key.
+
+    Unlike offset pagination each page is fetched with a range condition on the
+    key of the last row seen, so with a matching index the cost of a page does
+    not depend on how deep into the results the client is. The ordering must end
+    with a unique field and all of its fields must share the same direction.
+    """
+
+    ordering = ("-created_at", "-id")
+    page_size = 50
+    max_page_size = 500
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    invalid_cursor_message = "Invalid cursor"
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request, queryset.model)
+        reverse = cursor is not None and cursor[0]
+
+        ordering = self.reverse_ordering(self.ordering) if reverse else self.ordering
+        queryset = queryset.order_by(*ordering)
+        if cursor is not None:
+            queryset = queryset.filter(self.position_filter(ordering, cursor[1]))
+
+        results = list(queryset[:self.page_size + 1])
+        has_more = len(results) > self.page_size
+        del results[self.page_size:]
+        if reverse:
+            results.reverse()
+
+        self.next_key = self.previous_key = None
+        if results:
+            if has_more or reverse:
+                self.next_key = self.get_key(results[-1])
+            if (has_more and reverse) or (cursor is not None and not reverse):
+                self.previous_key = self.get_key(results[0])
+        return results
+
+    def get_paginated_response(self, data):
+        return Response(
+            {
+                "next": self.get_next_link(),
+                "previous": self.get_previous_link(),
+                "results": data,
+            }
+        )
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return min(max(page_size, 1), self.max_page_size)
+
+    def get_next_link(self):
+        if self.next_key is None:
+            return None
+        return self.encode_cursor(False, self.next_key)
+
+    def get_previous_link(self):
+        if self.previous_key is None:
+            return None
+        return self.encode_cursor(True, self.previous_key)
+
+    def get_key(self, obj):
+        """Values of the ordering fields for a row, as JSON friendly strings"""
+        values = []
+        for field in self.ordering:
+            value = getattr(obj, field.lstrip("-"))
+            values.append(value.isoformat() if hasattr(value, "isoformat") else str(value))
+        return values
+
+    def encode_cursor(self, reverse, key):
+        payload = json.dumps([int(reverse), key], separators=(",", ":"))
+        cursor = base64.urlsafe_b64encode(payload.encode()).decode()
+        return replace_query_param(self.base_url, self.cursor_query_param, cursor)
+
+    def decode_cursor(self, request, model):
+        """Return ``(reverse, key)`` for the requested cursor, or None on the first page"""
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            reverse, raw_key = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+            if len(raw_key) != len(self.ordering):
+                raise ValueError
+            key = [
+                model._meta.get_field(field.lstrip("-")).to_python(value)
+                for field, value in zip(self.ordering, raw_key)
+            ]
+        except (TypeError, ValueError, ValidationError, binascii.Error):
+            raise NotFound(self.invalid_cursor_message)
+        return bool(reverse), key
+
+    @staticmethod
+    def reverse_ordering(ordering):
+        return tuple(field[1:] if field.startswith("-") else f"-{field}" for field in ordering)
+
+    @staticmethod
+    def position_filter(ordering, key):
+        """Rows strictly after ``key`` in ``ordering``.
+
+        Expands ``(a, b) < (x, y)`` as ``a <= x AND (a < x OR (a = x AND b < y))``
+        so the leading bound can drive an index range scan.
+        """
+        names = [field.lstrip("-") for field in ordering]
+        lookup = "lt" if ordering[0].startswith("-") else "gt"
+        condition = Q()
+        for index, name in enumerate(names):
+            equal = dict(zip(names[:index], key[:index]))
+            condition |= Q(**equal, **{f"{name}__{lookup}": key[index]})
+        return Q(**{f"{names[0]}__{lookup}e": key[0]}) & condition
+
+
+class TransactionPagination(KeysetPagination):
+    """Newest transactions first, keyed on ``(created_at, id)``"""
+
+    ordering = ("-created_at", "-id")
+
+
+class TaskPagination(KeysetPagination):
+    """Most recently updated tasks first, keyed on ``(updated_at, id)``"""
+
+    ordering = ("-updated_at", "-id")
+
+
+class BoardColumnPagination(KeysetPagination):
+    """Tasks of one board column in priority order, keyed on ``(priority, id)``"""
+
+    ordering = ("priority", "id")
+    page_size = 10
+    max_page_size = 100
+    page_size_query_param = "limit"
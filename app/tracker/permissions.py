@@ -1,5 +1,27 @@
 from rest_framework import permissions
 
+from . import models
+
+
+def project_role(request, project_id):
+    """Role of the request user on a project, or None without access.
+
+    Looked up once per request and project on the ``(user, project)`` index of
+    ``ProjectAccess``, so permission checks and querysets of the nested
+    project routes share a single query.
+    """
+    if not str(project_id).isdigit():
+        return None
+    roles = request.__dict__.setdefault("_tracker_project_roles", {})
+    project_id = int(project_id)
+    if project_id not in roles:
+        roles[project_id] = (
+            models.ProjectAccess.objects.filter(user_id=request.user.id, project_id=project_id)
+            .values_list("role", flat=True)
+            .first()
+        )
+    return roles[project_id]
+
 
 class IsOwnerOfProject(permissions.BasePermission):
     """
@@ -7,11 +29,28 @@ class IsOwnerOfProject(permissions.BasePermission):
     """
 
     def has_permission(self, request, view):
-        # This check happens before accessing the object.
-        # It allows the request if the user is authenticated.
-        return request.user.is_authenticated
+        # On nested project routes the project is known before accessing the
+        # object, so only its owner gets through
+        if not request.user.is_authenticated:
+            return False
+        project_id = view.kwargs.get("projects_pk")
+        if project_id is None:
+            return True
+        return project_role(request, project_id) == models.ProjectAccess.OWNER
 
     def has_object_permission(self, request, view, obj):
         # Instance must have a project attribute and the user
         #  must be the owner of the project
-        return obj.project.user == request.user
+        return project_role(request, obj.project_id) == models.ProjectAccess.OWNER
+
+
+class IsOwnerOfProjectOrTask(permissions.IsAuthenticated):
+    """
+    Only lets the project owner or the owner of a task change it. Participants
+    see the tasks they own only, see ``TaskViewSet.get_queryset``.
+    """
+
+    def has_object_permission(self, request, view, obj):
+        if obj.owner_id is not None and obj.owner_id == request.user.id:
+            return True
+        return project_role(request, obj.project_id) == models.ProjectAccess.OWNER
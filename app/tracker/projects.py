@@ -0,0 +1,229 @@
+"""
+Project and task writes, with the project access they imply
+"""
+
+from . import models
+from .events import publish_project_events, task_data
+from .utilities import bump_versions
+from django.db import connection
+from django.db.transaction import atomic
+from django.utils import timezone
+
+
+TOUCH_PROJECT = """
+    UPDATE {table} SET "updated_at" = %s, "change_seq" = "change_seq" + 1
+    WHERE "id" = %s
+    RETURNING "change_seq"
+"""
+
+
+def touch_projects(project_ids):
+    """Bump ``updated_at`` and the change number of projects, one UPDATE per
+    project in id order. Returns the new change numbers by project id.
+
+    Project writes lock their project rows first, then task and access rows,
+    then the versions of the users whose access changed, so they never wait
+    on each other in opposite orders.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    sql = TOUCH_PROJECT.format(table=connection.ops.quote_name(models.Project._meta.db_table))
+    change_seqs = {}
+    with connection.cursor() as cursor:
+        for project_id in sorted(set(project_ids)):
+            cursor.execute(sql, [now, project_id])
+            row = cursor.fetchone()
+            if row is not None:
+                change_seqs[project_id] = row[0]
+    return change_seqs
+
+
+def lock_projects(project_ids):
+    """Lock project rows in id order, for writes that reach them through
+    another table first, like participant changes"""
+    list(
+        models.Project.objects.select_for_update()
+        .filter(pk__in=project_ids)
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
+
+
+def record_access_changes(granted=(), revoked=()):
+    """Bump the projects version of the users in the ``(project_id, user_id)``
+    pairs of access granted or revoked by a write. Edits of the projects and
+    their tasks only bump the project change numbers, see ``touch_projects``"""
+    user_ids = {user_id for _, user_id in granted} | {user_id for _, user_id in revoked}
+    if user_ids:
+        bump_versions(user_ids, models.DataVersion.PROJECTS)
+
+
+def add_project_participants(project_id, user_ids):
+    """Add users to the participants of a project with one INSERT that skips
+    the existing memberships, instead of loading them first. Returns the
+    ``(project_id, user_id)`` pairs of the users who got access"""
+    membership = models.Project.participants.through
+    membership.objects.bulk_create(
+        [membership(project_id=project_id, user_id=user_id) for user_id in set(user_ids)],
+        ignore_conflicts=True,
+    )
+    return grant_project_access([(project_id, user_id) for user_id in user_ids])
+
+
+GRANT_PROJECT_ACCESS = """
+    INSERT INTO {table} (project_id, user_id, role) VALUES {values}
+    ON CONFLICT (user_id, project_id) DO NOTHING
+    RETURNING project_id, user_id
+"""
+
+
+def grant_project_access(pairs):
+    """Give participant access for ``(project_id, user_id)`` pairs, keeping
+    the role of users who already have access. Returns the pairs that had no
+    access yet, from the rows the INSERT added, without reading the existing
+    ones. The projects must be locked first, see ``touch_projects``"""
+    pairs = sorted(set(pairs))
+    if not pairs:
+        return set()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            GRANT_PROJECT_ACCESS.format(
+                table=models.ProjectAccess._meta.db_table,
+                values=", ".join(["(%s, %s, %s)"] * len(pairs)),
+            ),
+            [
+                value
+                for project_id, user_id in pairs
+                for value in (project_id, user_id, models.ProjectAccess.PARTICIPANT)
+            ],
+        )
+        return set(cursor.fetchall())
+
+
+def revoke_project_access(project_ids=None, user_ids=None):
+    """Remove the participant access of users to projects. Either side left
+    out means all of them. Returns the ``(project_id, user_id)`` pairs removed"""
+    access = models.ProjectAccess.objects.filter(role=models.ProjectAccess.PARTICIPANT)
+    if project_ids is not None:
+        access = access.filter(project_id__in=project_ids)
+    if user_ids is not None:
+        access = access.filter(user_id__in=user_ids)
+    return delete_project_access(access)
+
+
+def delete_project_access(access):
+    """Delete access rows, returning their ``(project_id, user_id)`` pairs"""
+    rows = list(access.values_list("pk", "project_id", "user_id"))
+    if rows:
+        models.ProjectAccess.objects.filter(pk__in=[pk for pk, _, _ in rows]).delete()
+    return {(project_id, user_id) for _, project_id, user_id in rows}
+
+
+def set_project_owner(project_id, user_id, created=False):
+    """Make the access row of ``user_id`` on a project the owner's one. A
+    previous owner keeps participant access only if it is a participant.
+    Returns the ``(project_id, user_id)`` pairs of access granted and revoked"""
+    access = models.ProjectAccess.objects.filter(project_id=project_id)
+    granted, revoked = {(project_id, user_id)}, set()
+    if not created:
+        owners = set(
+            access.filter(role=models.ProjectAccess.OWNER).values_list("user_id", flat=True)
+        )
+        if owners == {user_id}:
+            return set(), set()
+        previous = access.filter(role=models.ProjectAccess.OWNER).exclude(user_id=user_id)
+        participants = models.Project.participants.through.objects.filter(
+            project_id=project_id
+        ).values("user_id")
+        previous.filter(user_id__in=participants).update(role=models.ProjectAccess.PARTICIPANT)
+        revoked = delete_project_access(previous.filter(role=models.ProjectAccess.OWNER))
+        if access.filter(user_id=user_id).exists():
+            granted = set()
+    models.ProjectAccess.objects.bulk_create(
+        [
+            models.ProjectAccess(
+                project_id=project_id, user_id=user_id, role=models.ProjectAccess.OWNER
+            )
+        ],
+        update_conflicts=True,
+        unique_fields=["user", "project"],
+        update_fields=["role"],
+    )
+    return granted, revoked
+
+
+def save_tasks(project_id, user_id, items):
+    """Create and update many tasks of a project in bulk.
+
+    ``items`` are validated task fields, those with an ``id`` update the task
+    of the project with that id. Owners join the participants and the project
+    is touched once for the whole batch. Returns the created and updated tasks.
+    """
+    with atomic():
+        change_seq = touch_projects([project_id]).get(project_id, 0)
+        ids = [item["id"] for item in items if "id" in item]
+        existing = models.Task.objects.select_for_update().in_bulk(ids)
+        now = timezone.now()
+        created, updated, fields = [], [], {"updated_at", "change_seq"}
+        for item in items:
+            values = {field: value for field, value in item.items() if field != "id"}
+            if "id" in item:
+                task = existing[item["id"]]
+                for field, value in values.items():
+                    setattr(task, field, value)
+                task.updated_at = now
+                task.change_seq = change_seq
+                fields.update(values)
+                updated.append(task)
+            else:
+                created.append(
+                    models.Task(
+                        project_id=project_id, user_id=user_id, change_seq=change_seq, **values
+                    )
+                )
+
+        models.Task.objects.bulk_create(created, batch_size=500)
+        models.Task.objects.bulk_update(updated, sorted(fields), batch_size=500)
+        owner_ids = [task.owner_id for task in created + updated if task.owner_id]
+        if owner_ids:
+            record_access_changes(granted=add_project_participants(project_id, owner_ids))
+        publish_project_events(
+            project_id,
+            [("task.created", task_data(task)) for task in created]
+            + [("task.updated", task_data(task)) for task in updated],
+        )
+    return created, updated
+
+
+REORDER_TASKS = """
+    UPDATE {table}
+    SET priority = CASE id {whens} END, updated_at = %s, change_seq = %s
+    WHERE project_id = %s AND id IN ({ids})
+"""
+
+
+def reorder_tasks(project_id, task_ids, start=0, chunk_size=1000):
+    """Give the tasks of a project the priorities ``start``, ``start + 1``...
+    in the order of ``task_ids``, with one CASE UPDATE per chunk of ids and a
+    single touch of the project. Returns the number of tasks updated.
+
+    The statement is written out directly: building thousands of ORM ``When``
+    expressions costs far more than running the UPDATE.
+    """
+    now = connection.ops.adapt_datetimefield_value(timezone.now())
+    updated = 0
+    with atomic(), connection.cursor() as cursor:
+        change_seq = touch_projects([project_id]).get(project_id, 0)
+        for offset in range(0, len(task_ids), chunk_size):
+            chunk = task_ids[offset:offset + chunk_size]
+            sql = REORDER_TASKS.format(
+                table=models.Task._meta.db_table,
+                whens=" ".join(["WHEN %s THEN %s"] * len(chunk)),
+                ids=", ".join(["%s"] * len(chunk)),
+            )
+            params = []
+            for index, task_id in enumerate(chunk):
+                params += [task_id, start + offset + index]
+            cursor.execute(sql, [*params, now, change_seq, project_id, *chunk])
+            updated += cursor.rowcount
+        publish_project_events(project_id, [("task.reordered", {"ids": task_ids, "start": start})])
+    return updated
@@ -0,0 +1,89 @@
+"""
+Monthly rollups of a user's transactions, kept up to date on every write
+"""
+
+from . import models
+from .utilities import increment_or_create
+from django.db import IntegrityError
+from django.db.models import F
+from django.db.transaction import atomic
+
+
+def apply_rollup_deltas(user_id, deltas):
+    """Add ``(amount, count)`` deltas, keyed by ``(month, category_id,
+    transaction_type)``, to a user's monthly rollups.
+
+    A write of one or two transactions updates each row in place. Larger sets,
+    like imports spanning years, update the existing rows with one batched
+    UPDATE and insert the missing ones with one batched INSERT.
+    """
+    if len(deltas) > 2:
+        deltas = _bulk_apply_rollup_deltas(user_id, deltas)
+    for (month, category_id, transaction_type), (total, count) in deltas.items():
+        increment_or_create(
+            models.MonthlyRollup,
+            {
+                "user_id": user_id,
+                "month": month,
+                "category_id": category_id,
+                "transaction_type": transaction_type,
+            },
+            amount=total,
+            transaction_count=count,
+        )
+
+
+def _bulk_apply_rollup_deltas(user_id, deltas):
+    """Apply deltas with batched statements, returning those left to apply one
+    row at a time because another writer created their row concurrently"""
+    existing = []
+    missing = dict(deltas)
+    rollups = models.MonthlyRollup.objects.filter(
+        user_id=user_id, month__in={month for month, _, _ in deltas}
+    )
+    for rollup in rollups:
+        key = (rollup.month, rollup.category_id, rollup.transaction_type)
+        if key in missing:
+            total, count = missing.pop(key)
+            rollup.amount = F("amount") + total
+            rollup.transaction_count = F("transaction_count") + count
+            existing.append(rollup)
+    models.MonthlyRollup.objects.bulk_update(
+        existing, ["amount", "transaction_count"], batch_size=500
+    )
+    try:
+        with atomic():
+            models.MonthlyRollup.objects.bulk_create(
+                [
+                    models.MonthlyRollup(
+                        user_id=user_id,
+                        month=month,
+                        category_id=category_id,
+                        transaction_type=transaction_type,
+                        amount=total,
+                        transaction_count=count,
+                    )
+                    for (month, category_id, transaction_type), (total, count) in missing.items()
+                ],
+                batch_size=500,
+            )
+    except IntegrityError:
+        return missing
+    return {}
+
+
+def move_category_rollups_to_uncategorized(category):
+    """Fold the rollups of a category being deleted into the uncategorized
+    rollups, mirroring the SET_NULL on its transactions"""
+    for rollup in models.MonthlyRollup.objects.filter(category=category):
+        increment_or_create(
+            models.MonthlyRollup,
+            {
+                "user_id": rollup.user_id,
+                "month": rollup.month,
+                "category_id": None,
+                "transaction_type": rollup.transaction_type,
+            },
+            amount=rollup.amount,
+            transaction_count=rollup.transaction_count,
+        )
@@ -0,0 +1,68 @@
+"""
+Full-text search over transaction descriptions
+"""
+
+import re
+
+from django.db import connection
+
+from . import models
+
+POSTGRES_SEARCH = """
+    SELECT t.id
+    FROM tracker_transaction t, websearch_to_tsquery('simple', %s) query
+    WHERE t.user_id = %s AND t.search_vector @@ query
+    ORDER BY ts_rank(t.search_vector, query) DESC, t.created_at DESC, t.id DESC
+    LIMIT %s
+"""
+
+SQLITE_SEARCH = """
+    SELECT t.id
+    FROM tracker_transaction_fts f
+    JOIN tracker_transaction t ON t.id = f.rowid
+    WHERE tracker_transaction_fts MATCH %s AND t.user_id = %s
+    ORDER BY bm25(tracker_transaction_fts), t.created_at DESC, t.id DESC
+    LIMIT %s
+"""
+
+
+def search_transactions(user_id, query, limit=50):
+    """Transactions of a user whose description matches ``query``, most
+    relevant first.
+
+    Uses the index built by the ``0014_transaction_search`` migration: the GIN
+    indexed ``search_vector`` column on PostgreSQL and the FTS5 table on SQLite.
+    Other databases fall back to a case-insensitive scan.
+    """
+    if connection.vendor == "postgresql":
+        ids = _ranked_ids(POSTGRES_SEARCH, [query, user_id, limit])
+    elif connection.vendor == "sqlite":
+        match = fts5_query(query)
+        ids = _ranked_ids(SQLITE_SEARCH, [match, user_id, limit]) if match else []
+    else:
+        ids = list(
+            models.Transaction.objects.filter(user_id=user_id, description__icontains=query)
+            .order_by("-created_at", "-id")
+            .values_list("id", flat=True)[:limit]
+        )
+
+    transactions = models.Transaction.objects.filter(id__in=ids).select_related("category")
+    position = {pk: index for index, pk in enumerate(ids)}
+    return sorted(transactions, key=lambda transaction: position[transaction.pk])
+
+
+def fts5_query(query):
+    """Turn free text into an FTS5 query matching all of its words, the last
+    one as a prefix, with FTS5 operators and punctuation neutralised"""
+    words = re.findall(r"\w+", query)
+    if not words:
+        return ""
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _ranked_ids(sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [row[0] for row in cursor.fetchall()]
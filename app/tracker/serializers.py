@@ -2,11 +2,73 @@
 Serializers for Tracker
 """
 
+import calendar
+from datetime import date
+from decimal import Decimal
+
 from . import models
+from . import sync
 from rest_framework import serializers
+from django.utils import timezone
 from core.serializers import UserSerializer
 
 
+class SparseFieldsMixin:
+    """Lets a GET request trim the output to the comma separated ``?fields=``
+    and inline the relations of ``expandable_fields`` named in ``?expand=``.
+    Without ``?expand=`` the relations of ``expanded_by_default`` are inlined,
+    so ``?expand=`` with no names outputs them all as ids.
+
+    Only the top level serializer of a response reads the params. Views use
+    ``requested_fields`` to load just the relations that will be output.
+    """
+
+    # Relation name: (serializer class, its keyword arguments)
+    expandable_fields = {}
+    expanded_by_default = set()
+
+    @classmethod
+    def requested_fields(cls, request):
+        """``(fields, expand)`` of a request: the names to output, or None for
+        all of them, and the relations to inline"""
+        if request is None or request.method != "GET":
+            return None, set(cls.expanded_by_default)
+        fields = requested_names(request, "fields", cls.Meta.fields)
+        expand = requested_names(request, "expand", cls.expandable_fields)
+        if expand is None:
+            expand = set(cls.expanded_by_default)
+        if fields is not None:
+            expand &= fields
+        return fields, expand
+
+    def get_fields(self):
+        fields = super().get_fields()
+        parent = self.parent
+        if isinstance(parent, serializers.ListSerializer):
+            parent = parent.parent
+        if parent is not None:
+            return fields
+        only, expand = self.requested_fields(self.context.get("request"))
+        for name in expand:
+            serializer_class, kwargs = self.expandable_fields[name]
+            fields[name] = serializer_class(read_only=True, **kwargs)
+        if only is not None:
+            fields = {name: field for name, field in fields.items() if name in only}
+        return fields
+
+
+def requested_names(request, param, allowed):
+    """Names listed in a comma separated query param, None when it is absent"""
+    value = request.query_params.get(param)
+    if value is None:
+        return None
+    names = {name.strip() for name in value.split(",") if name.strip()}
+    unknown = names - set(allowed)
+    if unknown:
+        raise serializers.ValidationError({param: [f"Unknown: {', '.join(sorted(unknown))}."]})
+    return names
+
+
 class CategorySerializer(serializers.ModelSerializer):
     """Category serializer"""
 
@@ -28,8 +90,33 @@ class BalanceSerializer(serializers.ModelSerializer):
         fields = ["id", "amount"]
 
 
-class TransactionSerializer(serializers.ModelSerializer):
-    """Transaction serializer"""
+class BudgetSerializer(serializers.ModelSerializer):
+    """Budget serializer, with the spend of the requested month"""
+
+    spent = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    remaining = serializers.DecimalField(max_digits=14, decimal_places=2, read_only=True)
+    over_budget = serializers.BooleanField(read_only=True)
+
+    class Meta:
+        model = models.Budget
+        fields = ["id", "category", "amount", "spent", "remaining", "over_budget"]
+        extra_kwargs = {"amount": {"min_value": Decimal(0)}}
+
+    def validate_category(self, value):
+        """Only allow budgets on the user's own categories"""
+        if value.user_id != self.context["request"].user.id:
+            raise serializers.ValidationError("Invalid category.")
+        return value
+
+    def create(self, validated_data):
+        user = self.context["request"].user
+        return models.Budget.objects.create(user=user, **validated_data)
+
+
+class TransactionSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Transaction serializer, the category can be expanded"""
+
+    expandable_fields = {"category": (CategorySerializer, {})}
 
     class Meta:
         model = models.Transaction
@@ -47,13 +134,292 @@ class TransactionSerializer(serializers.ModelSerializer):
         """Crates a transaction using the user info in the request"""
         user = self.context["request"].user
         return models.Transaction.objects.create(user=user, **validated_data)
-    
-class GetProjectSerializer(serializers.ModelSerializer):
-    """Get Project serializer"""
+
+
+class RecurringTransactionSerializer(serializers.ModelSerializer):
+    """Recurring transaction serializer"""
+
+    class Meta:
+        model = models.RecurringTransaction
+        fields = [
+            "id",
+            "transaction_type",
+            "amount",
+            "category",
+            "description",
+            "frequency",
+            "interval",
+            "start_date",
+            "end_date",
+            "next_run",
+        ]
+        read_only_fields = ["next_run"]
+
+    def validate_category(self, value):
+        """Only allow the user's own categories"""
+        if value is not None and value.user_id != self.context["request"].user.id:
+            raise serializers.ValidationError("Invalid category.")
+        return value
+
+    def validate(self, attrs):
+        start_date = attrs.get("start_date", getattr(self.instance, "start_date", None))
+        end_date = attrs.get("end_date", getattr(self.instance, "end_date", None))
+        if end_date is not None and end_date < start_date:
+            raise serializers.ValidationError({"end_date": "Must not be before start_date."})
+        return attrs
+
+    def create(self, validated_data):
+        """Creates a recurring transaction starting at its start date"""
+        user = self.context["request"].user
+        return models.RecurringTransaction.objects.create(
+            user=user, next_run=validated_data["start_date"], **validated_data
+        )
+
+    def update(self, instance, validated_data):
+        """Restart the schedule when its start date changes. Occurrences that
+        already exist are not created again"""
+        if validated_data.get("start_date", instance.start_date) != instance.start_date:
+            instance.next_run = validated_data["start_date"]
+        return super().update(instance, validated_data)
+
+
+class ImportTransactionSerializer(serializers.ModelSerializer):
+    """Validates a single row of a transaction import"""
+
+    category = serializers.IntegerField(source="category_id", required=False, allow_null=True)
+
+    class Meta:
+        model = models.Transaction
+        fields = ["transaction_type", "amount", "created_at", "description", "category"]
+        extra_kwargs = {"created_at": {"required": True}}
+
+    def validate_category(self, value):
+        """Only accept categories owned by the importing user, checked against
+        the ids preloaded in the context instead of one query per row"""
+        if value is not None and value not in self.context["category_ids"]:
+            raise serializers.ValidationError("Invalid category.")
+        return value
+
+
+class TransactionSelectionSerializer(serializers.Serializer):
+    """Selects transactions of the user for a batch operation, either by ids
+    or by the filters of the transaction list"""
+
+    MAX_IDS = 1000
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), max_length=MAX_IDS, required=False
+    )
+    filter = serializers.DictField(child=serializers.CharField(), required=False)
+
+    def validate(self, attrs):
+        if bool(attrs.get("ids")) == bool(attrs.get("filter")):
+            raise serializers.ValidationError("Provide either a list of ids or a filter.")
+        return attrs
+
+
+class TransactionChangesSerializer(serializers.Serializer):
+    """Field changes applied to every transaction of a batch update"""
+
+    transaction_type = serializers.ChoiceField(
+        choices=models.Transaction.TRANSACTION_TYPE_COICES, required=False
+    )
+    amount = serializers.DecimalField(max_digits=10, decimal_places=2, required=False)
+    category = serializers.IntegerField(source="category_id", required=False, allow_null=True)
+
+    def validate_category(self, value):
+        user = self.context["request"].user
+        if value is not None and not models.Category.objects.filter(id=value, user=user).exists():
+            raise serializers.ValidationError("Invalid category.")
+        return value
+
+    def validate(self, attrs):
+        if not attrs:
+            raise serializers.ValidationError("No changes given.")
+        return attrs
+
+
+class TransactionBulkUpdateSerializer(TransactionSelectionSerializer):
+    """Selection and changes of a batch update"""
+
+    changes = TransactionChangesSerializer()
+
+
+class TransactionPeriodSerializer(serializers.Serializer):
+    """Validates the period of a transaction report: a month (YYYY-MM) or an
+    inclusive date range. Defaults to the current month"""
+
+    month = serializers.DateField(input_formats=["%Y-%m"], required=False)
+    date_from = serializers.DateField(required=False)
+    date_to = serializers.DateField(required=False)
+
+    def validate(self, attrs):
+        if "month" in attrs or not ("date_from" in attrs or "date_to" in attrs):
+            month = attrs.pop("month", None) or timezone.localdate()
+            last_day = calendar.monthrange(month.year, month.month)[1]
+            attrs["date_from"] = month.replace(day=1)
+            attrs["date_to"] = month.replace(day=last_day)
+            return attrs
+        if "date_from" not in attrs or "date_to" not in attrs:
+            raise serializers.ValidationError("Both date_from and date_to are required.")
+        if attrs["date_from"] > attrs["date_to"]:
+            raise serializers.ValidationError("date_from must be before date_to.")
+        return attrs
+
+
+class TransactionSearchSerializer(serializers.Serializer):
+    """Validates a transaction search"""
+
+    q = serializers.CharField(max_length=200)
+    limit = serializers.IntegerField(min_value=1, max_value=200, default=50)
+
+
+class TransactionExportSerializer(serializers.Serializer):
+    """Validates the options of a transaction export"""
+
+    output = serializers.ChoiceField(choices=["csv", "ndjson"], default="csv")
+    gzip = serializers.BooleanField(default=False)
+
+
+# Balances are computed from the day before a period up to the start of the
+# period after it, so dates at the ends of the calendar are refused
+FIRST_BALANCE_DATE = date(1, 1, 2)
+LAST_BALANCE_DATE = date(9999, 11, 30)
+
+
+def validate_balance_date(value):
+    if not FIRST_BALANCE_DATE <= value <= LAST_BALANCE_DATE:
+        raise serializers.ValidationError(
+            f"Dates must be between {FIRST_BALANCE_DATE} and {LAST_BALANCE_DATE}."
+        )
+    return value
+
+
+class BalanceHistorySerializer(TransactionPeriodSerializer):
+    """Validates the period and interval of a balance history, of at most
+    ``MAX_PERIODS`` periods"""
+
+    INTERVAL_CHOICES = ["day", "week", "month"]
+    MAX_PERIODS = {"day": 366, "week": 260, "month": 120}
+
+    interval = serializers.ChoiceField(choices=INTERVAL_CHOICES, default="day")
+
+    def validate(self, attrs):
+        attrs = super().validate(attrs)
+        date_from = validate_balance_date(attrs["date_from"])
+        date_to = validate_balance_date(attrs["date_to"])
+        interval = attrs["interval"]
+        if interval == "month":
+            periods = (date_to.year - date_from.year) * 12 + date_to.month - date_from.month + 1
+        elif interval == "week":
+            periods = ((date_to - date_from).days + date_from.weekday()) // 7 + 1
+        else:
+            periods = (date_to - date_from).days + 1
+        if periods > self.MAX_PERIODS[interval]:
+            raise serializers.ValidationError(
+                f"At most {self.MAX_PERIODS[interval]} periods of a {interval} can be requested."
+            )
+        return attrs
+
+
+class MonthSerializer(serializers.Serializer):
+    """Validates an optional month (YYYY-MM), defaulting to the current one"""
+
+    month = serializers.DateField(input_formats=["%Y-%m"], required=False)
+
+    def validate(self, attrs):
+        attrs["month"] = (attrs.get("month") or timezone.localdate()).replace(day=1)
+        return attrs
+
+
+class YearSerializer(serializers.Serializer):
+    """Validates an optional year, defaulting to the current one"""
+
+    year = serializers.IntegerField(min_value=1, max_value=9998, required=False)
+
+    def validate(self, attrs):
+        attrs["year"] = attrs.get("year") or timezone.localdate().year
+        return attrs
+
+
+class BalanceForecastSerializer(serializers.Serializer):
+    """Validates the horizon of a balance forecast"""
+
+    months = serializers.IntegerField(min_value=1, max_value=24, default=6)
+
+
+class BalanceAsOfSerializer(serializers.Serializer):
+    """Validates the date of a balance lookup"""
+
+    date = serializers.DateField(validators=[validate_balance_date])
+
+
+class GetProjectSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Get Project serializer, with the task progress annotated by
+    ``utilities.annotate_project_progress``. The owner and participants can be
+    expanded"""
+
+    PROGRESS_FIELDS = {
+        "task_count",
+        "completed_count",
+        "overdue_count",
+        "next_due_date",
+        "completion",
+    }
+    expandable_fields = {
+        "user": (UserSerializer, {}),
+        "participants": (UserSerializer, {"many": True}),
+    }
+
+    task_count = serializers.IntegerField(read_only=True)
+    completed_count = serializers.IntegerField(read_only=True)
+    overdue_count = serializers.IntegerField(read_only=True)
+    next_due_date = serializers.DateField(read_only=True)
+    completion = serializers.SerializerMethodField()
+
+    class Meta:
+        model = models.Project
+        fields = [
+            "id",
+            "name",
+            "description",
+            "end_date",
+            "created_at",
+            "updated_at",
+            "is_active",
+            "participants",
+            "user",
+            "task_count",
+            "completed_count",
+            "overdue_count",
+            "next_due_date",
+            "completion",
+        ]
+
+    def get_completion(self, obj):
+        """Percentage of completed tasks"""
+        if not obj.task_count:
+            return 0
+        return round(100 * obj.completed_count / obj.task_count, 1)
+
+
+class SyncProjectSerializer(serializers.ModelSerializer):
+    """Project serializer for delta sync, without the task progress"""
 
     class Meta:
         model = models.Project
-        fields = ["id", "name", "description", "end_date", "created_at", "updated_at", "is_active", "participants", "user"]
+        fields = [
+            "id",
+            "name",
+            "description",
+            "end_date",
+            "created_at",
+            "updated_at",
+            "is_active",
+            "participants",
+            "user",
+        ]
+
 
 class CreateProjectSerializer(serializers.ModelSerializer):
     """Project serializer"""
@@ -67,10 +433,11 @@ class CreateProjectSerializer(serializers.ModelSerializer):
         return models.Project.objects.create(user=user, **validated_data)
 
 
-class GetTaskSerializer(serializers.ModelSerializer):
-    """Get Task serializer"""
+class GetTaskSerializer(SparseFieldsMixin, serializers.ModelSerializer):
+    """Get Task serializer, the owner is expanded unless ``?expand=`` leaves it out"""
 
-    owner = UserSerializer()
+    expandable_fields = {"owner": (UserSerializer, {})}
+    expanded_by_default = {"owner"}
 
     class Meta:
         model = models.Task
@@ -105,10 +472,12 @@ class UpdateTaskSerializer(serializers.ModelSerializer):
             "created_at",
             "updated_at",
         ]
+        # Tasks stay in the project of the URL
+        read_only_fields = ["project"]
 
 
 class CreateTaskSerializer(serializers.ModelSerializer):
-    """Create Task serializer"""
+    """Create Task serializer, the project is the one of the URL"""
 
     class Meta:
         model = models.Task
@@ -120,12 +489,69 @@ class CreateTaskSerializer(serializers.ModelSerializer):
             "owner",
             "due_date",
         ]
+        read_only_fields = ["project"]
 
     def create(self, validated_data):
         user = self.context["request"].user
         return models.Task.objects.create(user=user, **validated_data)
 
 
+class TaskReorderSerializer(serializers.Serializer):
+    """Validates the ordered task ids of a reorder"""
+
+    MAX_IDS = 10000
+    # Largest value of the integer priority column
+    MAX_PRIORITY = 2**31 - 1
+
+    ids = serializers.ListField(
+        child=serializers.IntegerField(), min_length=1, max_length=MAX_IDS
+    )
+    start = serializers.IntegerField(min_value=0, max_value=MAX_PRIORITY - MAX_IDS, default=0)
+
+    def validate_ids(self, value):
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Duplicate ids.")
+        return value
+
+
+class BoardSerializer(serializers.Serializer):
+    """Validates the column size of a board, and the column to page through"""
+
+    limit = serializers.IntegerField(min_value=1, max_value=100, default=10)
+    status = serializers.ChoiceField(choices=models.Task.STATUS_CHOICES, required=False)
+
+
+class BulkTaskSerializer(serializers.ModelSerializer):
+    """Validates one task of a bulk create/update, new tasks have no ``id``"""
+
+    MAX_TASKS = 500
+
+    id = serializers.IntegerField(required=False)
+    owner = serializers.IntegerField(source="owner_id", required=False, allow_null=True)
+
+    class Meta:
+        model = models.Task
+        fields = ["id", "name", "description", "status", "priority", "owner", "due_date"]
+        extra_kwargs = {"name": {"required": False}}
+
+    def validate_id(self, value):
+        """Only accept tasks of the project, checked against the ids preloaded
+        in the context instead of one query per task"""
+        if value not in self.context["task_ids"]:
+            raise serializers.ValidationError("Invalid task.")
+        return value
+
+    def validate_owner(self, value):
+        if value is not None and value not in self.context["user_ids"]:
+            raise serializers.ValidationError("Invalid owner.")
+        return value
+
+    def validate(self, attrs):
+        if "id" not in attrs and "name" not in attrs:
+            raise serializers.ValidationError({"name": "This field is required."})
+        return attrs
+
+
 class GetTeamSerializer(serializers.ModelSerializer):
     """Get Team Serializer"""
 
@@ -150,3 +576,28 @@ class CreateTeamSerializer(serializers.ModelSerializer):
         team.members.set(members)
 
         return team
+
+
+class SyncSerializer(serializers.Serializer):
+    """Query params of a delta sync"""
+
+    cursor = serializers.CharField(required=False)
+    limit = serializers.IntegerField(min_value=1, max_value=2000, default=sync.SYNC_LIMIT)
+
+    def validate_cursor(self, value):
+        try:
+            return sync.decode_cursor(value)
+        except ValueError as error:
+            raise serializers.ValidationError(str(error))
+
+
+class SyncChangesSerializer(serializers.Serializer):
+    """Changed and deleted rows of a delta sync, with the cursor to continue from"""
+
+    cursor = serializers.CharField(allow_null=True)
+    has_more = serializers.BooleanField()
+    categories = CategorySerializer(many=True)
+    transactions = TransactionSerializer(many=True)
+    projects = SyncProjectSerializer(many=True)
+    tasks = GetTaskSerializer(many=True)
+    deleted = serializers.DictField(child=serializers.ListField(child=serializers.IntegerField()))
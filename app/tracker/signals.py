@@ -0,0 +1,67 @@
+"""
+Signal handlers for Tracker api
+"""
+
+from django.db.models.signals import m2m_changed, pre_delete
+from django.dispatch import receiver
+
+from . import models
+from .projects import (
+    grant_project_access,
+    lock_projects,
+    record_access_changes,
+    revoke_project_access,
+    touch_projects,
+)
+from .rollups import move_category_rollups_to_uncategorized
+
+
+@receiver(m2m_changed, sender=models.Project.participants.through)
+def sync_participant_access(sender, instance, action, reverse, pk_set, **kwargs):
+    """Mirror changes of ``Project.participants``, from either side, in
+    ``ProjectAccess``, touching the projects and recording the access changes.
+
+    The projects are locked before the membership rows, the same order as
+    the other project writes.
+    """
+    if action in ("pre_add", "pre_remove"):
+        lock_projects(pk_set if reverse else [instance.pk])
+    elif action == "pre_clear":
+        if reverse:
+            lock_projects(
+                sender.objects.filter(user_id=instance.pk).values_list("project_id", flat=True)
+            )
+        else:
+            lock_projects([instance.pk])
+    elif action == "post_add":
+        if reverse:
+            pairs = [(project_id, instance.pk) for project_id in pk_set]
+        else:
+            pairs = [(instance.pk, user_id) for user_id in pk_set]
+        touch_projects(project_id for project_id, _ in pairs)
+        record_access_changes(granted=grant_project_access(pairs))
+    elif action == "post_remove":
+        if reverse:
+            project_ids = pk_set
+            revoked = revoke_project_access(project_ids=pk_set, user_ids=[instance.pk])
+        else:
+            project_ids = [instance.pk]
+            revoked = revoke_project_access(project_ids=[instance.pk], user_ids=pk_set)
+        touch_projects(project_ids)
+        record_access_changes(revoked=revoked)
+    elif action == "post_clear":
+        if reverse:
+            revoked = revoke_project_access(user_ids=[instance.pk])
+            project_ids = [project_id for project_id, _ in revoked]
+        else:
+            revoked = revoke_project_access(project_ids=[instance.pk])
+            project_ids = [instance.pk]
+        touch_projects(project_ids)
+        record_access_changes(revoked=revoked)
+
+
+@receiver(pre_delete, sender=models.Category)
+def move_rollups_of_deleted_category(sender, instance, **kwargs):
+    """Fold the rollups of a category into the uncategorized ones before they
+    are deleted with it, also when a queryset or a user is deleted"""
+    move_category_rollups_to_uncategorized(instance)
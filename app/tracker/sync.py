@@ -0,0 +1,298 @@
+"""
+Delta sync of a user's data for offline clients
+"""
+
+import base64
+import binascii
+import json
+
+from django.db.models import Case, Q, Value, When
+
+from . import models
+from .pagination import KeysetPagination
+
+SYNC_LIMIT = 500
+
+TOMBSTONE_KEYS = {
+    models.Tombstone.CATEGORY: "categories",
+    models.Tombstone.TRANSACTION: "transactions",
+    models.Tombstone.TASK: "tasks",
+}
+
+LEDGER_START = (0, 0, 0)
+
+# Sources of a project, in the order they are synced
+PROJECT, DELETED_TASKS, TASKS = range(3)
+
+PROJECTS_START = (0, 0, 0, 0, 0)
+
+
+class CursorTooOld(Exception):
+    """Deletions after the cursor were pruned, the client has to sync again
+    from scratch"""
+
+
+def ledger_sources(user_id):
+    """The ledger of a user, in cursor order, as ``(name, queryset)`` pairs.
+    Rows are numbered with the ledger version of the user, see ``bump_version``"""
+    return [
+        ("categories", models.Category.objects.filter(user_id=user_id)),
+        ("transactions", models.Transaction.objects.filter(user_id=user_id)),
+        ("deleted", models.Tombstone.objects.filter(user_id=user_id)),
+    ]
+
+
+def sync_changes(user_id, cursor=None, limit=SYNC_LIMIT):
+    """Rows of a user changed after ``cursor``, at most ``limit`` of them.
+
+    The ledger and the projects are synced as two streams, each with its part
+    of the cursor, the ledger first. A warm client reads only what changed
+    and a cold one, without a cursor, pages through everything. Deleted rows
+    are listed by id under ``deleted``; clients apply those before the rows.
+    Raises ``CursorTooOld`` when deletions after the cursor were pruned.
+    """
+    ledger_cursor, position, synced = cursor or (LEDGER_START, PROJECTS_START, {})
+
+    ledger, ledger_cursor, has_more = ledger_changes(user_id, ledger_cursor, limit)
+    remaining = limit - sum(len(rows) for rows in ledger.values())
+    if remaining:
+        projects, position, synced, projects_more = project_changes(
+            user_id, position, synced, remaining
+        )
+        has_more = has_more or projects_more
+    else:
+        projects, has_more = {"projects": [], "tasks": [], "deleted": {}}, True
+
+    deleted = {key: [] for key in ("categories", "transactions", "projects", "tasks")}
+    for tombstone in ledger["deleted"]:
+        deleted[TOMBSTONE_KEYS[tombstone.kind]].append(tombstone.object_id)
+    for key, ids in projects["deleted"].items():
+        deleted[key] += ids
+    return {
+        "categories": ledger["categories"],
+        "transactions": ledger["transactions"],
+        "projects": projects["projects"],
+        "tasks": projects["tasks"],
+        "deleted": deleted,
+        "cursor": encode_cursor((ledger_cursor, position, synced)),
+        "has_more": has_more,
+    }
+
+
+def ledger_changes(user_id, cursor, limit):
+    """Ledger rows after the cursor ``(change_seq, source, id)``, taken in that
+    order. Returns the rows by source name, the next cursor and whether more
+    rows are left.
+
+    Once every row is read the cursor moves past all the sources of the
+    ledger version read first: the version row is locked until its writer
+    commits, so every change up to it was read, pruned deletions included.
+    """
+    sources = ledger_sources(user_id)
+    version, pruned = (
+        models.DataVersion.objects.filter(user_id=user_id, scope=models.DataVersion.LEDGER)
+        .values_list("version", "pruned_version")
+        .first()
+    ) or (0, 0)
+    if cursor[0] and tuple(cursor[:2]) < (pruned, len(sources)):
+        raise CursorTooOld()
+
+    names, fetched = [], []
+    for index, (name, queryset) in enumerate(sources):
+        names.append(name)
+        rows = queryset.filter(position_filter(index, cursor)).order_by("change_seq", "pk")
+        fetched += [((row.change_seq, index, row.pk), row) for row in rows[:limit + 1]]
+
+    fetched.sort(key=lambda item: item[0])
+    has_more = len(fetched) > limit
+    del fetched[limit:]
+
+    changes = {name: [] for name in names}
+    for (_, index, _), row in fetched:
+        changes[names[index]].append(row)
+    if has_more:
+        return changes, list(fetched[-1][0]), True
+    last = fetched[-1][0][0] if fetched else cursor[0]
+    return changes, [max(version, last), len(sources), 0], False
+
+
+def position_filter(index, cursor):
+    """Rows of ledger source ``index`` after the cursor ``(change_seq, source, id)``"""
+    change_seq, source, pk = cursor
+    if index < source:
+        return Q(change_seq__gt=change_seq)
+    if index > source:
+        return Q(change_seq__gte=change_seq)
+    return KeysetPagination.position_filter(("change_seq", "pk"), [change_seq, pk])
+
+
+def project_changes(user_id, position, synced, limit):
+    """Projects and tasks changed after the ``synced`` change number of each
+    project, at most ``limit`` rows.
+
+    The feed is read from the projects the user can access and their change
+    numbers, nothing is recorded per user on writes. ``synced`` maps each
+    project the client has to the change number it has everything up to;
+    projects missing from it are sent whole and those the user can no longer
+    access are listed as deleted. Projects are sent in id order, the one
+    ``position`` points into first, each with its task tombstones and tasks
+    found through the ``(project, change_seq)`` indexes. ``position`` is
+    ``(project_id, start, source, change_seq, id)`` of the last row sent,
+    ``start`` the change number of the project when it was first read, which
+    it is synced up to once done.
+
+    A participant only gets the tasks they own, the other changed tasks are
+    listed as deleted in case they owned them before. Returns the changes,
+    the next position and synced numbers and whether more rows are left.
+    """
+    access = {
+        project_id: (change_seq, pruned_seq, role)
+        for project_id, change_seq, pruned_seq, role in models.ProjectAccess.objects.filter(
+            user_id=user_id
+        ).values_list("project_id", "project__change_seq", "project__pruned_seq", "role")
+    }
+    changes = {"projects": [], "tasks": [], "deleted": {"projects": [], "tasks": []}}
+    changes["deleted"]["projects"] = sorted(set(synced) - set(access))
+    synced = {project_id: seq for project_id, seq in synced.items() if project_id in access}
+    if any(seq < access[project_id][1] for project_id, seq in synced.items()):
+        raise CursorTooOld()
+
+    resumed = position[0] if position[0] in access else None
+    projects = [
+        (project_id, synced.get(project_id, 0), change_seq)
+        for project_id, (change_seq, _, _) in sorted(access.items())
+        if project_id != resumed and synced.get(project_id, 0) < change_seq
+    ]
+    if resumed:
+        projects.insert(0, (resumed, synced.get(resumed, 0), position[1]))
+    has_more = len(projects) > limit + 1
+    del projects[limit + 1:]
+
+    participant_ids = {
+        project_id for project_id, (_, _, role) in access.items()
+        if role == models.ProjectAccess.PARTICIPANT
+    }
+    fetched = []
+    if projects:
+        order = Case(
+            *[
+                When(project_id=project_id, then=Value(index))
+                for index, (project_id, _, _) in enumerate(projects)
+            ]
+        )
+        index_of = {project_id: index for index, (project_id, _, _) in enumerate(projects)}
+        rows = models.Project.objects.filter(
+            pk__in=[project_id for project_id, _, _ in projects if project_id != resumed]
+        ).prefetch_related("participants")
+        fetched += [((index_of[row.pk], PROJECT, 0, row.pk), row) for row in rows]
+        for source, queryset in (
+            (DELETED_TASKS, models.Tombstone.objects.filter(kind=models.Tombstone.TASK)),
+            (TASKS, models.Task.objects.all()),
+        ):
+            condition = project_changes_filter(
+                projects,
+                position if resumed else PROJECTS_START,
+                source,
+                user_id,
+                participant_ids,
+            )
+            rows = (
+                queryset.filter(condition)
+                .annotate(project_order=order)
+                .order_by("project_order", "change_seq", "pk")[:limit + 1]
+            )
+            fetched += [
+                ((index_of[row.project_id], source, row.change_seq, row.pk), row) for row in rows
+            ]
+
+    fetched.sort(key=lambda item: item[0])
+    if len(fetched) > limit:
+        has_more = True
+        del fetched[limit:]
+        # The project of the last row sent may have more, the ones before are done
+        index, source, change_seq, pk = fetched[-1][0]
+        project_id, _, start = projects[index]
+        position = (project_id, start, source, change_seq, pk)
+        del projects[index:]
+    else:
+        position = PROJECTS_START
+    synced.update((project_id, start) for project_id, _, start in projects)
+
+    for (_, source, _, _), row in fetched:
+        if source == PROJECT:
+            changes["projects"].append(row)
+        elif source == DELETED_TASKS:
+            changes["deleted"]["tasks"].append(row.object_id)
+        elif row.project_id in participant_ids and row.owner_id != user_id:
+            changes["deleted"]["tasks"].append(row.pk)
+        else:
+            changes["tasks"].append(row)
+    return changes, position, synced, has_more
+
+
+def project_changes_filter(projects, position, source, user_id=None, participant_ids=()):
+    """Rows of ``source`` for ``(project_id, synced, start)`` projects: changed
+    after ``synced``, or after ``position`` in the project it points into.
+
+    Tombstones of a project the client does not have yet are only needed
+    from ``start`` on, for tasks it may have been sent since, and such a
+    project only sends the tasks a participant owns. One ``project_id = ...
+    AND change_seq > ...`` range per project, so each is served by the
+    ``(project, change_seq)`` index.
+    """
+    project_id, _, position_source, change_seq, pk = position
+    condition = Q(pk__in=[])
+    for project in projects:
+        synced, start = project[1:]
+        after = start if source == DELETED_TASKS and not synced else synced
+        if project[0] == project_id:
+            if position_source > source:
+                continue
+            if position_source == source:
+                after = None
+        if after is None:
+            rows = Q(project_id=project_id) & KeysetPagination.position_filter(
+                ("change_seq", "pk"), [change_seq, pk]
+            )
+        else:
+            rows = Q(project_id=project[0], change_seq__gt=after)
+        if source == TASKS and not synced and project[0] in participant_ids:
+            rows &= Q(owner_id=user_id)
+        condition |= rows
+    return condition
+
+
+def encode_cursor(cursor):
+    """Opaque cursor for ``(ledger, position, synced)``, with the synced
+    change numbers flattened to ``project_id, change_seq`` pairs"""
+    ledger, position, synced = cursor
+    pairs = [value for item in sorted(synced.items()) for value in item]
+    return base64.urlsafe_b64encode(
+        json.dumps([list(ledger), list(position), pairs], separators=(",", ":")).encode()
+    ).decode()
+
+
+def decode_cursor(encoded):
+    """``(ledger, position, synced)`` parts of a cursor, ValueError when it is
+    invalid"""
+    try:
+        cursor = json.loads(base64.urlsafe_b64decode(encoded.encode()))
+    except (ValueError, binascii.Error):
+        raise ValueError("Invalid cursor")
+    if (
+        not isinstance(cursor, list)
+        or len(cursor) != 3
+        or not all(isinstance(part, list) for part in cursor)
+        or [len(cursor[0]), len(cursor[1]), len(cursor[2]) % 2] != [3, 5, 0]
+        or not all(
+            isinstance(value, int) and value >= 0 for part in cursor for value in part
+        )
+        or cursor[0][1] > len(ledger_sources(0))
+        or cursor[1][2] > TASKS
+    ):
+        raise ValueError("Invalid cursor")
+    ledger, position, pairs = cursor
+    synced = dict(zip(pairs[::2], pairs[1::2]))
+    if len(synced) * 2 != len(pairs):
+        raise ValueError("Invalid cursor")
+    return tuple(ledger), tuple(position), synced
@@ -1,7 +1,16 @@
+import asyncio
 import pytest
+from django.core.cache import cache
 from model_bakery import baker
 from rest_framework.test import APIClient
 from core.models import User
+from moneyTracker.asgi import application
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Fixture to start every test with an empty cache."""
+    cache.clear()
 
 
 @pytest.fixture
@@ -34,3 +43,55 @@ def admin_user(api_client, create_admin_user):
     """Fixture to authenticate an admin user."""
     api_client.force_authenticate(user=create_admin_user)
     return api_client
+
+
+@pytest.fixture
+def asgi_get():
+    """Fixture to drive a GET through the ASGI application until
+    ``until(messages)`` is true or the response ends, then disconnect the
+    client. The function returns the messages sent."""
+
+    def get(path, headers, until):
+        async def run():
+            sent, disconnected = [], asyncio.Event()
+            received = asyncio.Queue()
+            requested = False
+
+            async def receive():
+                nonlocal requested
+                if not requested:
+                    requested = True
+                    return {"type": "http.request", "body": b"", "more_body": False}
+                await disconnected.wait()
+                return {"type": "http.disconnect"}
+
+            async def send(message):
+                sent.append(message)
+                await received.put(message)
+
+            scope = {
+                "type": "http",
+                "asgi": {"version": "3.0"},
+                "http_version": "1.1",
+                "method": "GET",
+                "scheme": "http",
+                "path": path,
+                "raw_path": path.encode(),
+                "query_string": b"",
+                "root_path": "",
+                "headers": [(b"host", b"testserver"), *headers],
+                "client": ("127.0.0.1", 50000),
+                "server": ("testserver", 80),
+            }
+            app = asyncio.create_task(application(scope, receive, send))
+            while not await until(sent):
+                message = await asyncio.wait_for(received.get(), 5)
+                if message["type"] == "http.response.body" and not message.get("more_body"):
+                    break
+            disconnected.set()
+            await asyncio.wait_for(app, 5)
+            return sent
+
+        return asyncio.run(run())
+
+    return get
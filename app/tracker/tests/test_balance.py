@@ -1,7 +1,15 @@
+import numpy as np
 import pytest
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from decimal import Decimal
+from django.db import connection
+from django.utils import timezone
 from rest_framework import status
 from model_bakery import baker
-from tracker.models import Balance
+from tracker.forecast import forecast_balance, project
+from tracker.models import Balance, Transaction
+from tracker.utilities import add_months
 
 
 @pytest.fixture
@@ -31,3 +39,235 @@ class TestBalance:
         response = authenticated_user.get("/api/balances/me/")
         assert response.status_code == status.HTTP_200_OK
         assert Balance.objects.filter(user=create_user).exists()
+
+
+@pytest.mark.django_db(transaction=True)
+class TestBalanceConcurrency:
+
+    def test_concurrent_transactions_keep_balance_consistent(self, create_user):
+        workers = 8
+        writes_per_worker = 25
+
+        def write_transactions(worker):
+            try:
+                for i in range(writes_per_worker):
+                    transaction = Transaction.objects.create(
+                        user=create_user,
+                        transaction_type="IN" if (worker + i) % 2 else "OUT",
+                        amount=Decimal("1.25"),
+                        created_at="2024-10-29",
+                    )
+                    if i % 5 == 0:
+                        transaction.amount = Decimal("2.50")
+                        transaction.save()
+                    if i % 7 == 0:
+                        transaction.delete()
+            finally:
+                connection.close()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            list(executor.map(write_transactions, range(workers)))
+
+        expected = sum(
+            t.amount if t.transaction_type == "IN" else -t.amount
+            for t in Transaction.objects.filter(user=create_user)
+        )
+        assert Balance.objects.get(user=create_user).amount == expected
+
+
+@pytest.mark.django_db
+class TestBalanceHistory:
+
+    @pytest.fixture
+    def create_history(self, create_user):
+        """Fixture to create transactions across three months."""
+        for transaction_type, amount, day in [
+            ("IN", "100.00", "2024-09-20"),
+            ("OUT", "30.00", "2024-10-02"),
+            ("IN", "10.00", "2024-10-02"),
+            ("OUT", "5.00", "2024-10-09"),
+            ("IN", "50.00", "2024-11-15"),
+        ]:
+            baker.make(
+                Transaction,
+                user=create_user,
+                transaction_type=transaction_type,
+                amount=Decimal(amount),
+                created_at=day,
+            )
+
+    @pytest.mark.parametrize(
+        "day, expected",
+        [
+            ("2024-09-19", 0),
+            ("2024-09-30", 100),
+            ("2024-10-02", 80),
+            ("2024-10-31", 75),
+            ("2025-01-01", 125),
+        ],
+    )
+    def test_balance_as_of_date(self, authenticated_user, create_history, day, expected):
+        response = authenticated_user.get(f"/api/balances/as-of/?date={day}")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["amount"] == expected
+
+    def test_balance_as_of_requires_date(self, authenticated_user):
+        response = authenticated_user.get("/api/balances/as-of/")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_daily_history(self, authenticated_user, create_history):
+        response = authenticated_user.get(
+            "/api/balances/history/?date_from=2024-10-01&date_to=2024-10-10"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["opening_balance"] == 100
+        balances = [point["balance"] for point in response.data["series"]]
+        assert balances == [100, 80, 80, 80, 80, 80, 80, 80, 75, 75]
+        assert response.data["series"][1]["change"] == -20
+
+    def test_weekly_history(self, authenticated_user, create_history):
+        response = authenticated_user.get(
+            "/api/balances/history/?date_from=2024-10-01&date_to=2024-10-20&interval=week"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        periods = [(p["period"], p["balance"]) for p in response.data["series"]]
+        assert periods == [
+            (date(2024, 9, 30), 80),
+            (date(2024, 10, 7), 75),
+            (date(2024, 10, 14), 75),
+        ]
+
+    def test_monthly_history(self, authenticated_user, create_history):
+        response = authenticated_user.get(
+            "/api/balances/history/?date_from=2024-09-01&date_to=2024-11-30&interval=month"
+        )
+        balances = [point["balance"] for point in response.data["series"]]
+        assert balances == [100, 75, 125]
+
+    @pytest.mark.parametrize(
+        "query",
+        [
+            "date_from=1000-01-01&date_to=9000-12-31",
+            "date_from=2024-01-01&date_to=2025-01-01",
+            "date_from=2000-01-01&date_to=2010-01-01&interval=week",
+            "date_from=2000-01-01&date_to=2010-01-01&interval=month",
+            "date_from=0001-01-01&date_to=0001-01-31",
+            "month=9999-12&interval=week",
+        ],
+    )
+    def test_history_rejects_long_or_out_of_range_periods(self, authenticated_user, query):
+        response = authenticated_user.get(f"/api/balances/history/?{query}")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_history_of_longest_periods(self, authenticated_user, create_history):
+        for query, count in [
+            ("date_from=2024-01-01&date_to=2024-12-31", 366),
+            ("date_from=2015-01-01&date_to=2024-12-31&interval=month", 120),
+        ]:
+            response = authenticated_user.get(f"/api/balances/history/?{query}")
+            assert response.status_code == status.HTTP_200_OK
+            assert len(response.data["series"]) == count
+
+    def test_balance_as_of_end_of_calendar_return_400(self, authenticated_user):
+        response = authenticated_user.get("/api/balances/as-of/?date=9999-12-31")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_history_rejects_unknown_interval(self, authenticated_user):
+        response = authenticated_user.get("/api/balances/history/?interval=year")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestBalanceConditionalGet:
+
+    def test_unchanged_balance_return_304(
+        self, authenticated_user, django_assert_max_num_queries
+    ):
+        first = authenticated_user.get("/api/balances/me/")
+        assert first.status_code == status.HTTP_200_OK
+        assert first["ETag"]
+
+        with django_assert_max_num_queries(1):
+            second = authenticated_user.get(
+                "/api/balances/me/", HTTP_IF_NONE_MATCH=first["ETag"]
+            )
+        assert second.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_new_transaction_changes_etag(self, authenticated_user, create_user):
+        first = authenticated_user.get("/api/balances/me/")
+        baker.make(
+            Transaction, user=create_user, transaction_type="IN", amount=5, created_at="2024-10-01"
+        )
+        second = authenticated_user.get("/api/balances/me/", HTTP_IF_NONE_MATCH=first["ETag"])
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data["amount"] == 5
+        assert second["ETag"] != first["ETag"]
+
+
+def make_monthly(user, transaction_type, amounts, first_month):
+    """One transaction per month from ``first_month``, skipping zero amounts"""
+    for index, amount in enumerate(amounts):
+        year, month = divmod(first_month.month - 1 + index, 12)
+        if amount:
+            baker.make(
+                Transaction,
+                user=user,
+                transaction_type=transaction_type,
+                amount=Decimal(amount),
+                created_at=date(first_month.year + year, month + 1, 10),
+                category=None,
+            )
+
+
+@pytest.mark.django_db
+class TestBalanceForecast:
+
+    def test_steady_history_continues(self, create_user):
+        make_monthly(create_user, "IN", [300] * 6, date(2024, 7, 1))
+        make_monthly(create_user, "OUT", [100] * 6, date(2024, 7, 1))
+        result = forecast_balance(create_user.id, months=3, today=date(2025, 1, 20))
+        assert result["balance"] == Decimal("1200.00")
+        assert [month["month"] for month in result["months"]] == [
+            date(2025, 2, 1),
+            date(2025, 3, 1),
+            date(2025, 4, 1),
+        ]
+        assert [month["net"] for month in result["months"]] == [Decimal("200.00")] * 3
+        assert [month["balance"] for month in result["months"]] == [
+            Decimal("1400.00"),
+            Decimal("1600.00"),
+            Decimal("1800.00"),
+        ]
+
+    def test_moving_average_follows_recent_months(self, create_user):
+        make_monthly(create_user, "OUT", [500, 500, 500, 100, 200, 300], date(2024, 7, 1))
+        result = forecast_balance(create_user.id, months=1, today=date(2025, 1, 5))
+        assert result["months"][0]["expense"] == Decimal("200.00")
+
+    def test_seasonality_of_whole_years(self, create_user):
+        bonus = [100] * 11 + [1300]
+        make_monthly(create_user, "IN", bonus * 2, date(2023, 1, 1))
+        result = forecast_balance(create_user.id, months=12, today=date(2025, 1, 15))
+        income = {month["month"].month: month["income"] for month in result["months"]}
+        assert income[12] == Decimal("1300.00")
+        assert {income[month] for month in range(1, 12)} == {Decimal("100.00")}
+
+    def test_projection_never_goes_negative(self):
+        history = np.array([[0.0] * 11 + [1200.0]])
+        assert (project(history, 12) >= 0).all()
+
+    def test_no_history_keeps_balance(self, create_user, create_balance):
+        result = forecast_balance(create_user.id, months=2)
+        assert [month["balance"] for month in result["months"]] == [Decimal("100.50")] * 2
+
+    def test_forecast_endpoint(self, authenticated_user, create_user):
+        first_month = add_months(timezone.localdate().replace(day=1), -3)
+        make_monthly(create_user, "OUT", [50] * 3, first_month)
+        response = authenticated_user.get("/api/balances/forecast/", {"months": 4})
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data["months"]) == 4
+        assert response.data["months"][0]["expense"] == Decimal("50.00")
+
+    def test_forecast_rejects_long_horizon(self, authenticated_user):
+        response = authenticated_user.get("/api/balances/forecast/", {"months": 100})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
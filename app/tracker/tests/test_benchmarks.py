@@ -0,0 +1,346 @@
+import asyncio
+import base64
+import json
+import time
+import tracemalloc
+from datetime import date, timedelta
+from decimal import Decimal
+
+import pytest
+from model_bakery import baker
+from tracker.events import EventStream, LocalHub, project_channel
+from tracker.forecast import forecast_balance
+from django.test import RequestFactory
+from rest_framework.request import Request
+from tracker.models import (
+    Balance,
+    Category,
+    Project,
+    ProjectAccess,
+    Task,
+    Transaction,
+)
+from tracker.pagination import TransactionPagination
+from tracker.search import search_transactions
+from tracker.sync import TASKS, encode_cursor, project_changes_filter
+from tracker.permissions import project_role
+from tracker.ledger import bulk_create_transactions
+from tracker.views import ProjectViewSet
+from core.models import User
+
+
+@pytest.mark.benchmark
+@pytest.mark.django_db
+class TestBenchmarks:
+
+    def test_import_10k_transactions(
+        self, authenticated_user, create_user, django_assert_max_num_queries
+    ):
+        rows = [
+            {
+                "transaction_type": "IN" if i % 3 else "OUT",
+                "amount": "10.00",
+                "created_at": f"2024-{i % 12 + 1:02d}-{i % 28 + 1:02d}",
+                "description": f"Row {i}",
+            }
+            for i in range(10_000)
+        ]
+
+        start = time.perf_counter()
+        # One INSERT per batch (SQLite caps a batch at ~140 rows), never one per row
+        with django_assert_max_num_queries(150):
+            response = authenticated_user.post("/api/transactions/import/", rows, format="json")
+        elapsed = time.perf_counter() - start
+
+        assert response.status_code == 201
+        assert Transaction.objects.filter(user=create_user).count() == 10_000
+        assert Balance.objects.get(user=create_user).amount == 10 * (6666 - 3334)
+        print(f"\nimported 10k transactions in {elapsed:.2f}s")
+
+    def test_deep_transaction_page_costs_the_same_as_the_first(
+        self, authenticated_user, create_user
+    ):
+        Transaction.objects.bulk_create(
+            Transaction(
+                user=create_user,
+                transaction_type="IN",
+                amount=1,
+                created_at=date(2010, 1, 1) + timedelta(days=i // 20),
+            )
+            for i in range(20_000)
+        )
+        deepest = Transaction.objects.filter(user=create_user).order_by("created_at", "id")[10]
+        cursor = base64.urlsafe_b64encode(
+            json.dumps([0, [deepest.created_at.isoformat(), str(deepest.id)]]).encode()
+        ).decode()
+
+        timings = {}
+        for name, url in [
+            ("first", "/api/transactions/"),
+            ("deep", f"/api/transactions/?cursor={cursor}"),
+        ]:
+            start = time.perf_counter()
+            response = authenticated_user.get(url)
+            timings[name] = time.perf_counter() - start
+            assert response.status_code == 200
+            assert response.data["results"]
+
+        position = TransactionPagination.position_filter(
+            TransactionPagination.ordering, [deepest.created_at, deepest.id]
+        )
+        plan = Transaction.objects.filter(position, user=create_user).order_by(
+            "-created_at", "-id"
+        )[:51].explain()
+        assert "transaction_user_created_idx" in plan
+        print(f"\nfirst page {timings['first']:.4f}s, page ~400 {timings['deep']:.4f}s")
+
+    def test_export_memory_does_not_grow_with_rows(self, authenticated_user, create_user):
+        def export_peak(rows):
+            Transaction.objects.filter(user=create_user).delete()
+            Transaction.objects.bulk_create(
+                Transaction(
+                    user=create_user,
+                    transaction_type="OUT",
+                    amount=1,
+                    created_at=date(2024, 1, 1),
+                    description="x" * 40,
+                )
+                for _ in range(rows)
+            )
+            response = authenticated_user.get("/api/transactions/export/")
+            tracemalloc.start()
+            size = sum(len(block) for block in response.streaming_content)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            return size, peak
+
+        small_size, small_peak = export_peak(5_000)
+        large_size, large_peak = export_peak(40_000)
+
+        assert large_size > 7 * small_size
+        assert large_peak < 2 * small_peak
+        print(
+            f"\nexport peak memory: 5k rows {small_peak / 1024:.0f}KB, "
+            f"40k rows {large_peak / 1024:.0f}KB"
+        )
+
+    def test_search_100k_descriptions(self, create_user):
+        words = ["coffee", "rent", "salary", "grocery", "fuel", "gym", "pharmacy", "taxi"]
+        Transaction.objects.bulk_create(
+            (
+                Transaction(
+                    user=create_user,
+                    transaction_type="OUT",
+                    amount=1,
+                    created_at=date(2024, 1, 1),
+                    description=f"{words[i % 8]} {words[i * 7 % 8]} receipt {i}",
+                )
+                for i in range(100_000)
+            ),
+            batch_size=5000,
+        )
+
+        start = time.perf_counter()
+        results = search_transactions(create_user.id, "receipt 99999")
+        elapsed = time.perf_counter() - start
+
+        assert [t.description.split()[-1] for t in results] == ["99999"]
+        assert elapsed < 0.5
+        print(f"\nsearch over 100k descriptions in {elapsed * 1000:.1f}ms")
+
+    def test_forecast_over_100k_transactions(self, authenticated_user, create_user):
+        categories = baker.make(Category, user=create_user, _quantity=20)
+        current = date.today().replace(day=1)
+        bulk_create_transactions(
+            create_user.id,
+            [
+                Transaction(
+                    user=create_user,
+                    transaction_type="IN" if i % 10 == 0 else "OUT",
+                    amount=Decimal(5 + i % 50),
+                    category=categories[i % 20],
+                    created_at=current - timedelta(days=1 + i % 1000),
+                )
+                for i in range(100_000)
+            ],
+            batch_size=5000,
+        )
+
+        timings = []
+        for _ in range(5):
+            start = time.perf_counter()
+            result = forecast_balance(create_user.id, months=12)
+            timings.append(time.perf_counter() - start)
+
+        assert len(result["months"]) == 12
+        assert result["months"][0]["expense"] > result["months"][0]["income"]
+        assert min(timings) < 0.05
+        print(f"\nforecast over 100k transactions in {min(timings) * 1000:.1f}ms")
+
+    def test_project_access_with_10k_projects(self, authenticated_user, create_user):
+        others = baker.make(User, _quantity=10)
+        projects = Project.objects.bulk_create(
+            Project(name=f"Project {i}", user=create_user if i % 2 else others[i % 10])
+            for i in range(20_000)
+        )
+        ProjectAccess.objects.bulk_create(
+            (
+                ProjectAccess(project=project, user=project.user, role=ProjectAccess.OWNER)
+                for project in projects
+            ),
+            batch_size=5000,
+        )
+        # The user owns 10k projects and participates in 5k more
+        ProjectAccess.objects.bulk_create(
+            (
+                ProjectAccess(project=project, user=create_user, role=ProjectAccess.PARTICIPANT)
+                for project in projects[:10_000:2]
+            ),
+            batch_size=5000,
+        )
+        target = projects[-1]
+        Task.objects.bulk_create(
+            Task(project=target, user=create_user, name=f"Task {i}") for i in range(50)
+        )
+        request = Request(RequestFactory().get("/"))
+        request.user = create_user
+
+        start = time.perf_counter()
+        visible = ProjectViewSet(request=request).get_queryset().count()
+        list_elapsed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(100):
+            # A new request each time, the role is memoized per request
+            check = RequestFactory().get("/")
+            check.user = create_user
+            assert project_role(check, target.id) == ProjectAccess.OWNER
+        check_elapsed = (time.perf_counter() - start) / 100
+
+        start = time.perf_counter()
+        response = authenticated_user.get(f"/api/projects/{target.id}/tasks/")
+        tasks_elapsed = time.perf_counter() - start
+
+        assert visible == 15_000
+        assert len(response.data["results"]) == 50
+        assert check_elapsed < 0.005
+        assert list_elapsed < 0.5
+        print(
+            f"\nproject access over 15k projects: count {list_elapsed * 1000:.1f}ms, "
+            f"check {check_elapsed * 1000:.2f}ms, task list {tasks_elapsed * 1000:.1f}ms"
+        )
+
+    def test_reorder_5k_tasks(self, authenticated_user, create_user):
+        project = Project.objects.create(name="Board", user=create_user)
+        tasks = Task.objects.bulk_create(
+            Task(project=project, user=create_user, name=f"Task {i}") for i in range(5000)
+        )
+        ids = [task.id for task in tasks[::-1]]
+
+        start = time.perf_counter()
+        response = authenticated_user.post(
+            f"/api/projects/{project.id}/tasks/reorder/", {"ids": ids}, format="json"
+        )
+        elapsed = time.perf_counter() - start
+
+        assert response.data == {"updated": 5000}
+        assert elapsed < 0.5
+        print(f"\nreordered 5k tasks in {elapsed * 1000:.0f}ms")
+
+    def test_5k_idle_event_subscribers(self):
+        hub = LocalHub()
+        channels = [project_channel(project_id) for project_id in range(50)]
+
+        async def listen():
+            tracemalloc.start()
+            baseline = tracemalloc.get_traced_memory()[0]
+            received = [0]
+
+            async def subscriber(channel):
+                async for chunk in EventStream(hub.subscribe(channel)):
+                    if chunk.startswith(b"id:"):
+                        received[0] += 1
+                        return
+
+            tasks = [
+                asyncio.create_task(subscriber(channel))
+                for channel in channels
+                for _ in range(100)
+            ]
+            # Let every stream send its preamble and wait for events
+            await asyncio.sleep(0.1)
+            per_subscriber = (tracemalloc.get_traced_memory()[0] - baseline) / len(tasks)
+            tracemalloc.stop()
+
+            start = time.perf_counter()
+            for channel in channels:
+                hub.publish(channel, "task.updated", '{"id":1}')
+            await asyncio.gather(*tasks)
+            return received[0], per_subscriber, time.perf_counter() - start
+
+        received, per_subscriber, elapsed = asyncio.run(listen())
+
+        assert received == 5000
+        assert sum(hub.subscriber_count(channel) for channel in channels) == 0
+        # An idle stream holds a few small objects, no thread or buffer
+        assert per_subscriber < 10_000
+        assert elapsed < 1
+        print(
+            f"\n5k idle subscribers, {per_subscriber / 1024:.1f}KB each, "
+            f"fan-out in {elapsed * 1000:.0f}ms"
+        )
+
+    def test_warm_sync_over_100k_transactions(self, authenticated_user, create_user):
+        Transaction.objects.bulk_create(
+            (
+                Transaction(
+                    user=create_user,
+                    transaction_type="OUT",
+                    amount=1,
+                    created_at=date(2024, 1, 1) + timedelta(days=i % 365),
+                )
+                for i in range(100_000)
+            ),
+            batch_size=5000,
+        )
+        # Where a client that synced everything so far stands
+        cursor = encode_cursor(((0, 3, 0), (0, 0, 0, 0, 0), {}))
+        assert authenticated_user.get("/api/sync/", {"cursor": cursor}).data["cursor"] == cursor
+        changed = Transaction.objects.filter(user=create_user)[:3]
+        for transaction in changed:
+            transaction.save()
+
+        start = time.perf_counter()
+        data = authenticated_user.get("/api/sync/", {"cursor": cursor}).data
+        elapsed = time.perf_counter() - start
+
+        assert len(data["transactions"]) == 3
+        assert elapsed < 0.05
+        print(f"\nwarm sync over 100k transactions in {elapsed * 1000:.1f}ms")
+
+    def test_warm_sync_over_100k_tasks(self, authenticated_user, create_user):
+        project = baker.make(Project, user=create_user)
+        Task.objects.bulk_create(
+            (Task(project=project, user=create_user, name=f"Task {i}") for i in range(100_000)),
+            batch_size=5000,
+        )
+        # Where a client that synced everything so far stands
+        cursor = encode_cursor(((0, 3, 0), (0, 0, 0, 0, 0), {project.pk: project.change_seq}))
+        assert authenticated_user.get("/api/sync/", {"cursor": cursor}).data["cursor"] == cursor
+        changed = Task.objects.filter(project=project)[:3]
+        for task in changed:
+            task.save()
+
+        start = time.perf_counter()
+        data = authenticated_user.get("/api/sync/", {"cursor": cursor}).data
+        elapsed = time.perf_counter() - start
+
+        assert len(data["projects"]) == 1
+        assert len(data["tasks"]) == 3
+        assert elapsed < 0.05
+        # Each project range of the tasks query is read through the index
+        plan = Task.objects.filter(
+            project_changes_filter([(project.pk, 1, 2)], (0, 0, 0, 0, 0), TASKS)
+        ).explain()
+        assert "task_project_change_idx" in plan
+        print(f"\nwarm sync over 100k tasks in {elapsed * 1000:.1f}ms")
@@ -0,0 +1,125 @@
+import pytest
+from decimal import Decimal
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework import status
+from tracker.models import Budget, Category, Transaction
+from core.models import User
+
+
+@pytest.fixture
+def create_category(create_user):
+    """Fixture to create a category for the authenticated user."""
+    return baker.make(Category, user=create_user)
+
+
+@pytest.fixture
+def create_budget(create_user, create_category):
+    """Fixture to create a budget of 100 for the category."""
+    return baker.make(Budget, user=create_user, category=create_category, amount=Decimal("100"))
+
+
+def spend(user, category, amount, created_at=None, transaction_type="OUT"):
+    return baker.make(
+        Transaction,
+        user=user,
+        category=category,
+        transaction_type=transaction_type,
+        amount=Decimal(amount),
+        created_at=created_at or timezone.localdate(),
+    )
+
+
+@pytest.mark.django_db
+class TestBudget:
+
+    def test_budget_list_unauthenticated_return_401(self, api_client):
+        response = api_client.get("/api/budgets/")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_create_budget_return_201(self, authenticated_user, create_user, create_category):
+        spend(create_user, create_category, "30")
+        payload = {"category": create_category.id, "amount": "50.00"}
+        response = authenticated_user.post("/api/budgets/", payload)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["spent"] == Decimal("30.00")
+        assert response.data["remaining"] == Decimal("20.00")
+        assert Budget.objects.get(category=create_category).user == create_user
+
+    def test_create_budget_for_other_users_category_return_400(self, authenticated_user):
+        other_category = baker.make(Category, user=baker.make(User))
+        payload = {"category": other_category.id, "amount": "50.00"}
+        response = authenticated_user.post("/api/budgets/", payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "category" in response.data
+
+    def test_second_budget_for_category_return_400(
+        self, authenticated_user, create_category, create_budget
+    ):
+        payload = {"category": create_category.id, "amount": "50.00"}
+        response = authenticated_user.post("/api/budgets/", payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_spent_remaining_and_over_budget(
+        self, authenticated_user, create_user, create_category, create_budget
+    ):
+        spend(create_user, create_category, "60")
+        spend(create_user, create_category, "15", transaction_type="IN")
+        response = authenticated_user.get("/api/budgets/")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data[0]["spent"] == Decimal("60.00")
+        assert response.data[0]["remaining"] == Decimal("40.00")
+        assert response.data[0]["over_budget"] is False
+
+        spend(create_user, create_category, "50")
+        response = authenticated_user.get("/api/budgets/")
+        assert response.data[0]["spent"] == Decimal("110.00")
+        assert response.data[0]["remaining"] == Decimal("-10.00")
+        assert response.data[0]["over_budget"] is True
+
+    def test_spend_follows_updates_and_deletes(
+        self, authenticated_user, create_user, create_category, create_budget
+    ):
+        transaction = spend(create_user, create_category, "60")
+        transaction.amount = Decimal("25")
+        transaction.save()
+        spend(create_user, create_category, "5").delete()
+        response = authenticated_user.get("/api/budgets/")
+        assert response.data[0]["spent"] == Decimal("25.00")
+
+    def test_spend_of_requested_month(
+        self, authenticated_user, create_user, create_category, create_budget
+    ):
+        spend(create_user, create_category, "70", created_at="2024-03-31")
+        spend(create_user, create_category, "20", created_at="2024-04-01")
+        response = authenticated_user.get("/api/budgets/", {"month": "2024-03"})
+        assert response.data[0]["spent"] == Decimal("70.00")
+        response = authenticated_user.get("/api/budgets/", {"month": "2024-05"})
+        assert response.data[0]["spent"] == Decimal("0.00")
+
+    def test_invalid_month_return_400(self, authenticated_user):
+        response = authenticated_user.get("/api/budgets/", {"month": "March"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_other_users_budgets_are_hidden(self, authenticated_user, create_budget):
+        baker.make(Budget, user=baker.make(User), amount=Decimal("10"))
+        response = authenticated_user.get("/api/budgets/")
+        assert [budget["id"] for budget in response.data] == [create_budget.id]
+
+    def test_list_does_not_read_transactions(
+        self, authenticated_user, create_user, create_budget, django_assert_num_queries
+    ):
+        for _ in range(3):
+            category = baker.make(Category, user=create_user)
+            baker.make(Budget, user=create_user, category=category, amount=Decimal("10"))
+            spend(create_user, category, "4")
+        with django_assert_num_queries(1) as context:
+            response = authenticated_user.get("/api/budgets/")
+        assert len(response.data) == 4
+        assert "tracker_transaction" not in context.captured_queries[0]["sql"]
+
+    def test_deleting_category_deletes_budget(
+        self, authenticated_user, create_category, create_budget
+    ):
+        authenticated_user.delete(f"/api/categories/{create_category.id}/")
+        assert not Budget.objects.exists()
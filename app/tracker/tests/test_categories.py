@@ -79,3 +79,46 @@ class TestCategory:
         other_user_category = baker.make(Category, user=other_user)
         response = authenticated_user.delete(f"/api/categories/{other_user_category.id}/")
         assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestCategoryCache:
+
+    def test_second_list_is_served_from_cache(
+        self, authenticated_user, create_category, django_assert_max_num_queries
+    ):
+        first = authenticated_user.get("/api/categories/")
+        assert first["X-Cache"] == "MISS"
+        with django_assert_max_num_queries(1):
+            second = authenticated_user.get("/api/categories/")
+        assert second["X-Cache"] == "HIT"
+        assert second.data == first.data
+
+    def test_create_invalidates_cached_list(self, authenticated_user, create_category):
+        authenticated_user.get("/api/categories/")
+        authenticated_user.post("/api/categories/", {"name": "Travel"})
+        response = authenticated_user.get("/api/categories/")
+        assert response["X-Cache"] == "MISS"
+        assert len(response.data) == 2
+
+    def test_cache_is_per_user(self, api_client, authenticated_user, create_category):
+        authenticated_user.get("/api/categories/")
+        api_client.force_authenticate(user=baker.make(User))
+        response = api_client.get("/api/categories/")
+        assert response["X-Cache"] == "MISS"
+        assert response.data == []
+
+    def test_cache_stats_for_admin(self, admin_user):
+        admin_user.get("/api/categories/")
+        admin_user.get("/api/categories/")
+        response = admin_user.get("/api/cache-stats/")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["CategoryViewSet.list"] == {
+            "hits": 1,
+            "misses": 1,
+            "hit_rate": 0.5,
+        }
+
+    def test_cache_stats_forbidden_for_users(self, authenticated_user):
+        response = authenticated_user.get("/api/cache-stats/")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
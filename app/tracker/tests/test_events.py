@@ -0,0 +1,205 @@
+import asyncio
+import json
+import pytest
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from model_bakery import baker
+from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
+from tracker import events, models
+from tracker.events import EventStream, LocalHub, get_hub, project_channel
+from core.models import User
+
+
+@pytest.fixture
+def create_project(create_user):
+    """Fixture to create a project for the authenticated user."""
+    return baker.make(models.Project, user=create_user)
+
+
+@pytest.fixture
+def subscription(create_project):
+    """Fixture to subscribe to the events of the project."""
+    subscription = get_hub().subscribe(project_channel(create_project.id))
+    yield subscription
+    subscription.close()
+
+
+def received(subscription):
+    """Events waiting in a subscription as ``(type, data)`` pairs."""
+
+    async def drain():
+        messages = []
+        while subscription._pending:
+            _, event_type, data = await subscription.get()
+            messages.append((event_type, json.loads(data)))
+        return messages
+
+    return asyncio.run(drain())
+
+
+def read(stream, count):
+    """The first ``count`` chunks of an asynchronous stream."""
+
+    async def take():
+        chunks = []
+        async for chunk in stream:
+            chunks.append(chunk)
+            if len(chunks) == count:
+                break
+        return chunks
+
+    return asyncio.run(take())
+
+
+class TestLocalHub:
+
+    def test_publish_reaches_channel_subscribers_only(self):
+        hub = LocalHub()
+        first, second = hub.subscribe("a"), hub.subscribe("a")
+        other = hub.subscribe("b")
+        hub.publish("a", "ping", "{}")
+        assert asyncio.run(first.get()) == (1, "ping", "{}")
+        assert asyncio.run(second.get()) == (1, "ping", "{}")
+        assert not other._pending
+
+    def test_close_unsubscribes_and_ends_stream(self):
+        hub = LocalHub()
+        subscription = hub.subscribe("a")
+        subscription.close()
+        assert hub.subscriber_count("a") == 0
+        assert asyncio.run(subscription.get()) is None
+
+    def test_slow_subscriber_is_closed(self):
+        hub = LocalHub()
+        subscription = hub.subscribe("a")
+        for _ in range(events.MAX_PENDING_EVENTS + 1):
+            hub.publish("a", "ping", "{}")
+        assert subscription.closed
+        assert hub.subscriber_count("a") == 0
+        assert asyncio.run(subscription.get()) is None
+
+    def test_stream_format_and_heartbeat(self):
+        hub = LocalHub()
+        subscription = hub.subscribe("a")
+        hub.publish("a", "task.deleted", '{"id":1}')
+        chunks = read(EventStream(subscription, heartbeat=0.01), 3)
+        assert chunks == [
+            b"retry: 3000\n\n",
+            b'id: 1\nevent: task.deleted\ndata: {"id":1}\n\n',
+            b": keep-alive\n\n",
+        ]
+        assert hub.subscriber_count("a") == 0
+
+
+@pytest.mark.django_db
+class TestTaskEvents:
+
+    def test_save_and_delete_publish_after_commit(
+        self, create_project, create_user, subscription, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            task = baker.make(models.Task, project=create_project, user=create_user, name="A")
+            task.status = "P"
+            task.save()
+            task_id = task.id
+            task.delete()
+        messages = received(subscription)
+        assert [event_type for event_type, _ in messages] == [
+            "task.created",
+            "task.updated",
+            "task.deleted",
+        ]
+        assert messages[0][1]["name"] == "A"
+        assert messages[0][1]["project"] == create_project.id
+        assert messages[1][1]["status"] == "P"
+        assert messages[2][1] == {"id": task_id, "project": create_project.id}
+
+    def test_rolled_back_changes_are_not_published(
+        self, create_project, create_user, subscription, django_capture_on_commit_callbacks
+    ):
+        with django_capture_on_commit_callbacks(execute=True):
+            with pytest.raises(RuntimeError), transaction.atomic():
+                baker.make(models.Task, project=create_project, user=create_user)
+                raise RuntimeError
+        assert received(subscription) == []
+
+    def test_bulk_and_reorder_publish(
+        self,
+        authenticated_user,
+        create_project,
+        subscription,
+        django_capture_on_commit_callbacks,
+    ):
+        url = f"/api/projects/{create_project.id}/tasks/"
+        with django_capture_on_commit_callbacks(execute=True):
+            response = authenticated_user.post(
+                f"{url}bulk/", [{"name": "A"}, {"name": "B"}], format="json"
+            )
+            ids = response.data["created"]
+            authenticated_user.post(f"{url}reorder/", {"ids": ids[::-1]}, format="json")
+        messages = received(subscription)
+        assert [event_type for event_type, _ in messages] == [
+            "task.created",
+            "task.created",
+            "task.reordered",
+        ]
+        assert messages[2][1] == {"ids": ids[::-1], "start": 0}
+
+
+@pytest.mark.django_db
+class TestProjectEventStream:
+
+    def url(self, project):
+        return f"/api/projects/{project.id}/events/"
+
+    def test_unauthenticated_return_401(self, api_client, create_project):
+        response = api_client.get(self.url(create_project))
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_without_access_return_404(self, api_client, create_project):
+        api_client.force_authenticate(user=baker.make(User))
+        response = api_client.get(self.url(create_project), HTTP_ACCEPT="text/event-stream")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_wsgi_request_return_501(self, authenticated_user, create_project):
+        response = authenticated_user.get(
+            self.url(create_project), HTTP_ACCEPT="text/event-stream"
+        )
+        assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+        assert get_hub().subscriber_count(project_channel(create_project.id)) == 0
+
+
+@pytest.mark.django_db(transaction=True)
+class TestProjectEventStreamOverASGI:
+
+    def test_participant_receives_task_changes(self, asgi_get, create_project, create_user):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        token = AccessToken.for_user(participant)
+        headers = [
+            (b"accept", b"text/event-stream"),
+            (b"authorization", f"JWT {token}".encode()),
+        ]
+        tasks = []
+
+        async def until(messages):
+            bodies = [m.get("body", b"") for m in messages if m["type"] == "http.response.body"]
+            if bodies and not tasks:
+                # The stream is open, announce a change
+                tasks.append(
+                    await sync_to_async(baker.make)(
+                        models.Task, project=create_project, user=create_user
+                    )
+                )
+            return any(b"event: task.created" in body for body in bodies)
+
+        messages = asgi_get(f"/api/projects/{create_project.id}/events/", headers, until)
+        start = messages[0]
+        assert start["type"] == "http.response.start"
+        assert start["status"] == status.HTTP_200_OK
+        assert (b"Content-Type", b"text/event-stream") in start["headers"]
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        assert body.startswith(b"retry:")
+        assert f'"id":{tasks[0].id},'.encode() in body
+        assert get_hub().subscriber_count(project_channel(create_project.id)) == 0
@@ -1,4 +1,6 @@
 import pytest
+from datetime import timedelta
+from django.utils import timezone
 from model_bakery import baker
 from rest_framework import status
 from tracker import models
@@ -107,3 +109,293 @@ class TestProject:
         )
         create_project.refresh_from_db()
         assert create_user_owner in create_project.participants.all()
+
+
+@pytest.mark.django_db
+class TestProjectConditionalGet:
+
+    def test_unchanged_list_return_304(self, authenticated_user, create_projects):
+        first = authenticated_user.get("/api/projects/")
+        assert first["Last-Modified"]
+        second = authenticated_user.get("/api/projects/", HTTP_IF_NONE_MATCH=first["ETag"])
+        assert second.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_new_project_changes_etag(self, authenticated_user, create_projects, create_user):
+        first = authenticated_user.get("/api/projects/")
+        baker.make(models.Project, user=create_user)
+        second = authenticated_user.get("/api/projects/", HTTP_IF_NONE_MATCH=first["ETag"])
+        assert second.status_code == status.HTTP_200_OK
+        assert len(second.data) == 6
+
+    def test_deleted_project_changes_etag(self, authenticated_user, create_projects):
+        first = authenticated_user.get("/api/projects/")
+        create_projects[0].delete()
+        second = authenticated_user.get("/api/projects/", HTTP_IF_NONE_MATCH=first["ETag"])
+        assert second.status_code == status.HTTP_200_OK
+
+
+@pytest.mark.django_db
+class TestProjectCache:
+
+    def test_owner_update_invalidates_participant_list(self, api_client, create_project):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        create_project.save()
+        api_client.force_authenticate(user=participant)
+        api_client.get("/api/projects/")
+        assert api_client.get("/api/projects/")["X-Cache"] == "HIT"
+
+        create_project.name = "Renamed"
+        create_project.save()
+        response = api_client.get("/api/projects/")
+        assert response["X-Cache"] == "MISS"
+        assert response.data[0]["name"] == "Renamed"
+
+
+def access_of(project):
+    return dict(
+        models.ProjectAccess.objects.filter(project=project).values_list("user_id", "role")
+    )
+
+
+@pytest.mark.django_db
+class TestProjectAccess:
+
+    def test_owner_gets_access_on_create(self, create_project, create_user):
+        assert access_of(create_project) == {create_user.id: "owner"}
+
+    def test_participant_changes_are_mirrored(self, create_project, create_user):
+        first, second = baker.make(User, _quantity=2)
+        create_project.participants.add(first, second, create_user)
+        assert access_of(create_project) == {
+            create_user.id: "owner",
+            first.id: "participant",
+            second.id: "participant",
+        }
+        create_project.participants.remove(first, create_user)
+        assert access_of(create_project) == {create_user.id: "owner", second.id: "participant"}
+        second.projects.clear()
+        assert access_of(create_project) == {create_user.id: "owner"}
+        first.projects.add(create_project)
+        assert access_of(create_project) == {create_user.id: "owner", first.id: "participant"}
+
+    def test_owner_change(self, create_project, create_user):
+        participant, new_owner = baker.make(User, _quantity=2)
+        create_project.participants.add(participant)
+        create_project.user = participant
+        create_project.save()
+        assert access_of(create_project) == {participant.id: "owner"}
+        create_project.user = new_owner
+        create_project.save()
+        assert access_of(create_project) == {participant.id: "participant", new_owner.id: "owner"}
+
+    def test_task_owner_gets_access(self, create_project, create_user_owner):
+        baker.make(models.Task, project=create_project, owner=create_user_owner)
+        assert access_of(create_project)[create_user_owner.id] == "participant"
+
+    def test_list_without_distinct(
+        self, api_client, create_project, create_projects, django_assert_num_queries
+    ):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        baker.make(models.Project, user=participant)
+        api_client.force_authenticate(user=participant)
+        # Version, projects and their participants
+        with django_assert_num_queries(3) as context:
+            response = api_client.get("/api/projects/")
+        assert len(response.data) == 2
+        assert not any("DISTINCT" in query["sql"] for query in context.captured_queries)
+
+    def test_participant_sees_own_tasks_but_cannot_delete(self, api_client, create_project):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        task = baker.make(models.Task, project=create_project, owner=participant)
+        baker.make(models.Task, project=create_project)
+        api_client.force_authenticate(user=participant)
+        response = api_client.get(f"/api/projects/{create_project.id}/tasks/")
+        assert [item["id"] for item in response.data["results"]] == [task.id]
+        response = api_client.delete(f"/api/projects/{create_project.id}/tasks/{task.id}/")
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_outsider_cannot_create_tasks(self, api_client, create_project):
+        api_client.force_authenticate(user=baker.make(User))
+        response = api_client.post(
+            f"/api/projects/{create_project.id}/tasks/", {"name": "Task"}
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+        response = api_client.get(f"/api/projects/{create_project.id}/tasks/")
+        assert response.data["results"] == []
+
+
+@pytest.mark.django_db
+class TestProjectBoard:
+
+    @pytest.fixture
+    def create_board(self, create_project, create_user):
+        """Five not started tasks, two in progress and one completed."""
+        statuses = ["N"] * 5 + ["P"] * 2 + ["C"]
+        return [
+            baker.make(
+                models.Task,
+                project=create_project,
+                user=create_user,
+                owner=create_user,
+                status=task_status,
+                priority=10 - i,
+                name=f"Task {i}",
+            )
+            for i, task_status in enumerate(statuses)
+        ]
+
+    def test_board_columns(
+        self, authenticated_user, create_project, create_board, django_assert_num_queries
+    ):
+        # Access check, counts and the ranked tasks with their owners
+        with django_assert_num_queries(3):
+            response = authenticated_user.get(
+                f"/api/projects/{create_project.id}/board/", {"limit": 3}
+            )
+        assert response.status_code == status.HTTP_200_OK
+        columns = {column["status"]: column for column in response.data["columns"]}
+        assert list(columns) == ["N", "P", "R", "C"]
+        assert {key: column["count"] for key, column in columns.items()} == {
+            "N": 5,
+            "P": 2,
+            "R": 0,
+            "C": 1,
+        }
+        assert [task["name"] for task in columns["N"]["tasks"]] == ["Task 4", "Task 3", "Task 2"]
+        assert columns["N"]["next"]
+        assert columns["P"]["next"] is None
+        assert columns["R"]["tasks"] == []
+
+    def test_column_paging(self, authenticated_user, create_project, create_board):
+        response = authenticated_user.get(
+            f"/api/projects/{create_project.id}/board/", {"limit": 2}
+        )
+        url = response.data["columns"][0]["next"]
+        response = authenticated_user.get(url)
+        assert [task["name"] for task in response.data["results"]] == ["Task 2", "Task 1"]
+        response = authenticated_user.get(response.data["next"])
+        assert [task["name"] for task in response.data["results"]] == ["Task 0"]
+        assert response.data["next"] is None
+
+    def test_expand_owner(self, authenticated_user, create_project, create_board, create_user):
+        response = authenticated_user.get(
+            f"/api/projects/{create_project.id}/board/", {"expand": "owner", "fields": "id,owner"}
+        )
+        task = response.data["columns"][0]["tasks"][0]
+        assert set(task) == {"id", "owner"}
+        assert task["owner"]["username"] == create_user.username
+
+    def test_participant_sees_board(self, api_client, create_project, create_board):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        api_client.force_authenticate(user=participant)
+        response = api_client.get(f"/api/projects/{create_project.id}/board/")
+        assert response.status_code == status.HTTP_200_OK
+
+    def test_outsider_gets_404(self, api_client, create_project):
+        api_client.force_authenticate(user=baker.make(User))
+        response = api_client.get(f"/api/projects/{create_project.id}/board/")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_invalid_status_return_400(self, authenticated_user, create_project):
+        response = authenticated_user.get(
+            f"/api/projects/{create_project.id}/board/", {"status": "X"}
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestProjectProgress:
+
+    def make_tasks(self, project, user, statuses_and_days):
+        today = timezone.localdate()
+        for task_status, days in statuses_and_days:
+            baker.make(
+                models.Task,
+                project=project,
+                user=user,
+                status=task_status,
+                due_date=None if days is None else today + timedelta(days=days),
+            )
+
+    def test_progress_fields(self, authenticated_user, create_project, create_user):
+        self.make_tasks(
+            create_project,
+            create_user,
+            [
+                ("C", -3),
+                ("C", 5),
+                ("N", -1),
+                ("P", 2),
+                ("R", 9),
+                ("N", None),
+                ("C", -10),
+                ("N", -2),
+            ],
+        )
+        response = authenticated_user.get(f"/api/projects/{create_project.id}/")
+        assert response.data["task_count"] == 8
+        assert response.data["completed_count"] == 3
+        assert response.data["overdue_count"] == 2
+        assert response.data["completion"] == 37.5
+        assert response.data["next_due_date"] == str(timezone.localdate() + timedelta(days=2))
+
+    def test_project_without_tasks(self, authenticated_user, create_project):
+        response = authenticated_user.get("/api/projects/")
+        assert response.data[0]["task_count"] == 0
+        assert response.data[0]["completion"] == 0
+        assert response.data[0]["next_due_date"] is None
+
+    def test_list_query_count_does_not_grow_with_projects(
+        self, authenticated_user, create_user, django_assert_num_queries
+    ):
+        for _ in range(50):
+            project = baker.make(models.Project, user=create_user)
+            self.make_tasks(project, create_user, [("C", 1), ("N", -1)])
+        # Version, projects with their progress, and participants
+        with django_assert_num_queries(3):
+            response = authenticated_user.get("/api/projects/")
+        assert len(response.data) == 50
+        assert {project["completion"] for project in response.data} == {50.0}
+        assert {project["overdue_count"] for project in response.data} == {1}
+
+    def test_task_change_refreshes_cached_progress(
+        self, authenticated_user, create_project, create_user
+    ):
+        authenticated_user.get("/api/projects/")
+        self.make_tasks(create_project, create_user, [("C", None)])
+        response = authenticated_user.get("/api/projects/")
+        assert response["X-Cache"] == "MISS"
+        assert response.data[0]["completion"] == 100.0
+
+
+@pytest.mark.django_db
+class TestProjectSparseFields:
+
+    def test_fields_skip_progress_and_participants(
+        self, authenticated_user, create_projects, django_assert_num_queries
+    ):
+        # Version and the projects, without progress or participants
+        with django_assert_num_queries(2) as context:
+            response = authenticated_user.get("/api/projects/", {"fields": "id,name"})
+        assert "COUNT" not in context.captured_queries[-1]["sql"]
+        assert {tuple(project) for project in response.data} == {("id", "name")}
+        assert len(response.data) == len(create_projects)
+
+    def test_expand_owner_and_participants(
+        self, authenticated_user, create_project, create_user, create_user_owner
+    ):
+        create_project.participants.add(create_user_owner)
+        response = authenticated_user.get(
+            f"/api/projects/{create_project.id}/", {"expand": "user,participants"}
+        )
+        assert response.data["user"]["id"] == create_user.id
+        assert {user["id"] for user in response.data["participants"]} == {create_user_owner.id}
+        assert response.data["completion"] == 0
+
+    def test_unknown_field_return_400(self, authenticated_user, create_project):
+        response = authenticated_user.get("/api/projects/", {"fields": "id,budget"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -0,0 +1,204 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from io import StringIO
+from django.core.management import call_command
+from model_bakery import baker
+from rest_framework import status
+from tracker.models import Balance, Category, RecurringTransaction, Transaction
+from tracker.utilities import next_occurrence
+from core.models import User
+
+
+def make_recurring(user, frequency="MONTH", start_date=date(2024, 1, 31), **kwargs):
+    kwargs.setdefault("transaction_type", "OUT")
+    kwargs.setdefault("amount", Decimal("100.00"))
+    return baker.make(
+        RecurringTransaction,
+        user=user,
+        frequency=frequency,
+        interval=kwargs.pop("interval", 1),
+        start_date=start_date,
+        next_run=start_date,
+        category=None,
+        **kwargs,
+    )
+
+
+def run(until, *args):
+    out = StringIO()
+    call_command("run_recurring_transactions", "--until", until, *args, stdout=out)
+    return out.getvalue()
+
+
+def dates_of(recurring):
+    return list(
+        Transaction.objects.filter(recurring=recurring)
+        .order_by("created_at")
+        .values_list("created_at", flat=True)
+    )
+
+
+class TestNextOccurrence:
+
+    def test_monthly_stays_on_anchor_day(self):
+        assert next_occurrence(date(2024, 1, 31), "MONTH", 1, 31) == date(2024, 2, 29)
+        assert next_occurrence(date(2024, 2, 29), "MONTH", 1, 31) == date(2024, 3, 31)
+
+    def test_intervals(self):
+        assert next_occurrence(date(2024, 1, 1), "DAY", 3) == date(2024, 1, 4)
+        assert next_occurrence(date(2024, 1, 1), "WEEK", 2) == date(2024, 1, 15)
+        assert next_occurrence(date(2024, 11, 15), "MONTH", 3) == date(2025, 2, 15)
+        assert next_occurrence(date(2024, 2, 29), "YEAR", 1, 29) == date(2025, 2, 28)
+
+
+@pytest.mark.django_db
+class TestRunRecurringTransactions:
+
+    def test_materializes_missed_periods_and_updates_balance(self, create_user):
+        recurring = make_recurring(create_user)
+        output = run("2024-05-15")
+        assert dates_of(recurring) == [
+            date(2024, 1, 31),
+            date(2024, 2, 29),
+            date(2024, 3, 31),
+            date(2024, 4, 30),
+        ]
+        assert Balance.objects.get(user=create_user).amount == Decimal("-400.00")
+        recurring.refresh_from_db()
+        assert recurring.next_run == date(2024, 5, 31)
+        assert "Created 4 transactions for 1 users" in output
+
+    def test_rerun_creates_no_duplicates(self, create_user):
+        recurring = make_recurring(create_user, frequency="WEEK", start_date=date(2024, 1, 1))
+        run("2024-01-31")
+        run("2024-01-31")
+        assert len(dates_of(recurring)) == 5
+        assert Balance.objects.get(user=create_user).amount == Decimal("-500.00")
+
+    def test_stale_next_run_skips_existing_occurrences(self, create_user):
+        recurring = make_recurring(create_user, frequency="DAY", start_date=date(2024, 1, 1))
+        run("2024-01-03")
+        RecurringTransaction.objects.filter(pk=recurring.pk).update(next_run=date(2024, 1, 1))
+        run("2024-01-05")
+        assert dates_of(recurring) == [date(2024, 1, day) for day in range(1, 6)]
+
+    def test_deleted_occurrence_is_not_recreated(self, create_user):
+        recurring = make_recurring(create_user, frequency="DAY", start_date=date(2024, 1, 1))
+        run("2024-01-02")
+        Transaction.objects.get(recurring=recurring, created_at=date(2024, 1, 1)).delete()
+        run("2024-01-03")
+        assert dates_of(recurring) == [date(2024, 1, 2), date(2024, 1, 3)]
+
+    def test_stops_at_end_date(self, create_user):
+        recurring = make_recurring(
+            create_user, frequency="DAY", start_date=date(2024, 1, 1), end_date=date(2024, 1, 3)
+        )
+        run("2024-01-10")
+        assert len(dates_of(recurring)) == 3
+        assert "Created 0 transactions for 0 users" in run("2024-01-20")
+
+    def test_materialized_transactions_copy_the_rule(self, create_user):
+        category = baker.make(Category, user=create_user)
+        recurring = make_recurring(
+            create_user, transaction_type="IN", description="Salary", start_date=date(2024, 1, 1)
+        )
+        RecurringTransaction.objects.filter(pk=recurring.pk).update(category=category)
+        run("2024-01-01")
+        transaction = Transaction.objects.get(recurring=recurring)
+        assert transaction.transaction_type == "IN"
+        assert transaction.amount == Decimal("100.00")
+        assert transaction.category == category
+        assert transaction.description == "Salary"
+
+    def test_batches_of_users(self):
+        users = baker.make(User, _quantity=3)
+        for user in users:
+            make_recurring(user, frequency="DAY", start_date=date(2024, 1, 1))
+            make_recurring(user, transaction_type="IN", start_date=date(2024, 1, 1))
+        run("2024-01-10", "--batch-size", "2")
+        for user in users:
+            assert Transaction.objects.filter(user=user).count() == 11
+            assert Balance.objects.get(user=user).amount == Decimal("-900.00")
+
+    def test_queries_do_not_grow_with_missed_periods(
+        self, create_user, django_assert_max_num_queries
+    ):
+        make_recurring(create_user, frequency="DAY", start_date=date(2020, 1, 1))
+        make_recurring(create_user, frequency="WEEK", start_date=date(2020, 1, 1))
+        # SQLite inserts about 100 transactions per statement
+        with django_assert_max_num_queries(45):
+            run("2024-12-31")
+        assert Transaction.objects.filter(user=create_user).count() == 1827 + 261
+
+
+@pytest.mark.django_db
+class TestRecurringTransactionApi:
+
+    def test_list_unauthenticated_return_401(self, api_client):
+        response = api_client.get("/api/recurring-transactions/")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_create_starts_at_start_date(self, authenticated_user, create_user):
+        payload = {
+            "transaction_type": "OUT",
+            "amount": "850.00",
+            "description": "Rent",
+            "frequency": "MONTH",
+            "start_date": "2024-03-01",
+        }
+        response = authenticated_user.post("/api/recurring-transactions/", payload)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["next_run"] == "2024-03-01"
+        assert RecurringTransaction.objects.get().user == create_user
+
+    def test_create_with_other_users_category_return_400(self, authenticated_user):
+        category = baker.make(Category, user=baker.make(User))
+        payload = {
+            "transaction_type": "OUT",
+            "amount": "10.00",
+            "category": category.id,
+            "frequency": "WEEK",
+            "start_date": "2024-03-01",
+        }
+        response = authenticated_user.post("/api/recurring-transactions/", payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "category" in response.data
+
+    def test_end_before_start_return_400(self, authenticated_user):
+        payload = {
+            "transaction_type": "OUT",
+            "amount": "10.00",
+            "frequency": "WEEK",
+            "start_date": "2024-03-01",
+            "end_date": "2024-02-01",
+        }
+        response = authenticated_user.post("/api/recurring-transactions/", payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "end_date" in response.data
+
+    def test_zero_interval_return_400(self, authenticated_user):
+        payload = {
+            "transaction_type": "OUT",
+            "amount": "10.00",
+            "frequency": "DAY",
+            "interval": 0,
+            "start_date": "2024-03-01",
+        }
+        response = authenticated_user.post("/api/recurring-transactions/", payload)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_changing_start_date_restarts_schedule(self, authenticated_user, create_user):
+        recurring = make_recurring(create_user, frequency="DAY", start_date=date(2024, 1, 1))
+        run("2024-01-05")
+        response = authenticated_user.patch(
+            f"/api/recurring-transactions/{recurring.id}/", {"start_date": "2024-01-03"}
+        )
+        assert response.data["next_run"] == "2024-01-03"
+        run("2024-01-06")
+        assert len(dates_of(recurring)) == 6
+
+    def test_other_users_recurring_transactions_are_hidden(self, authenticated_user):
+        recurring = make_recurring(baker.make(User))
+        response = authenticated_user.get(f"/api/recurring-transactions/{recurring.id}/")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,129 @@
+import pytest
+from datetime import date
+from decimal import Decimal
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from model_bakery import baker
+from rest_framework import status
+from tracker.models import Category, MonthlyRollup, Transaction
+
+
+def rollups_for(user):
+    return {
+        (r.month, r.category_id, r.transaction_type): (r.amount, r.transaction_count)
+        for r in MonthlyRollup.objects.filter(user=user, transaction_count__gt=0)
+    }
+
+
+@pytest.fixture
+def create_category(create_user):
+    """Fixture to create a category for the transactions."""
+    return baker.make(Category, user=create_user)
+
+
+@pytest.fixture
+def create_transaction(create_user, create_category):
+    """Fixture to create an October expense."""
+    return baker.make(
+        Transaction,
+        user=create_user,
+        category=create_category,
+        transaction_type="OUT",
+        amount=Decimal("40.00"),
+        created_at="2024-10-10",
+    )
+
+
+@pytest.mark.django_db
+class TestMonthlyRollup:
+
+    def test_create_transaction_adds_to_rollup(
+        self, create_user, create_category, create_transaction
+    ):
+        baker.make(
+            Transaction,
+            user=create_user,
+            category=create_category,
+            transaction_type="OUT",
+            amount=Decimal("2.50"),
+            created_at="2024-10-31",
+        )
+        assert rollups_for(create_user) == {
+            (date(2024, 10, 1), create_category.id, "OUT"): (Decimal("42.50"), 2)
+        }
+
+    def test_update_transaction_moves_between_rollups(
+        self, create_user, create_category, create_transaction
+    ):
+        create_transaction.created_at = "2024-11-02"
+        create_transaction.transaction_type = "IN"
+        create_transaction.amount = Decimal("15.00")
+        create_transaction.save()
+        assert rollups_for(create_user) == {
+            (date(2024, 11, 1), create_category.id, "IN"): (Decimal("15.00"), 1)
+        }
+
+    def test_delete_transaction_removes_from_rollup(self, create_user, create_transaction):
+        create_transaction.delete()
+        assert rollups_for(create_user) == {}
+
+    @pytest.mark.parametrize(
+        "delete",
+        [
+            lambda category: category.delete(),
+            lambda category: Category.objects.filter(pk=category.pk).delete(),
+        ],
+        ids=["instance", "queryset"],
+    )
+    def test_delete_category_moves_rollups_to_uncategorized(
+        self, create_user, create_category, create_transaction, delete
+    ):
+        baker.make(
+            Transaction,
+            user=create_user,
+            transaction_type="OUT",
+            amount=Decimal("10.00"),
+            created_at="2024-10-01",
+        )
+        delete(create_category)
+        assert rollups_for(create_user) == {
+            (date(2024, 10, 1), None, "OUT"): (Decimal("50.00"), 2)
+        }
+
+    def test_delete_user_deletes_rollups(self, create_user, create_transaction):
+        create_user.delete()
+        assert not MonthlyRollup.objects.exists()
+
+    def test_report_reads_months_of_year(self, authenticated_user, create_transaction):
+        response = authenticated_user.get("/api/transactions/report/?year=2024")
+        assert response.status_code == status.HTTP_200_OK
+        assert len(response.data["months"]) == 12
+        october = response.data["months"][9]
+        assert october["month"] == date(2024, 10, 1)
+        assert october["expense"] == 40
+        assert october["net"] == -40
+
+    @pytest.mark.parametrize("year", ["abc", "0", "99999"])
+    def test_report_rejects_invalid_year(self, authenticated_user, year):
+        response = authenticated_user.get("/api/transactions/report/", {"year": year})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestRebuildRollupsCommand:
+
+    def test_verify_passes_for_maintained_rollups(self, create_transaction):
+        call_command("rebuild_rollups", "--verify")
+
+    def test_verify_detects_and_rebuild_fixes_stale_rollups(
+        self, create_user, create_transaction
+    ):
+        expected = rollups_for(create_user)
+        MonthlyRollup.objects.filter(user=create_user).update(amount=Decimal("1.00"))
+
+        with pytest.raises(CommandError):
+            call_command("rebuild_rollups", "--verify")
+
+        call_command("rebuild_rollups", "--batch-size", "1")
+        assert rollups_for(create_user) == expected
+        call_command("rebuild_rollups", "--verify")
@@ -0,0 +1,367 @@
+import pytest
+from datetime import date, timedelta
+from decimal import Decimal
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.utils import timezone
+from model_bakery import baker
+from rest_framework import status
+from tracker import models
+from tracker.ledger import bulk_create_transactions
+from core.models import User
+
+
+def sync(client, cursor=None, **params):
+    if cursor:
+        params["cursor"] = cursor
+    response = client.get("/api/sync/", params)
+    assert response.status_code == status.HTTP_200_OK
+    return response.data
+
+
+def ids(rows):
+    return sorted(row["id"] for row in rows)
+
+
+@pytest.fixture
+def create_project(create_user):
+    """Fixture to create a project for the authenticated user."""
+    return baker.make(models.Project, user=create_user)
+
+
+@pytest.fixture
+def create_ledger(create_user):
+    """Fixture to create a category with two transactions."""
+    category = baker.make(models.Category, user=create_user)
+    transactions = [
+        baker.make(
+            models.Transaction,
+            user=create_user,
+            category=category,
+            transaction_type="OUT",
+            amount=Decimal("10"),
+            created_at=date(2024, 1, 1),
+        )
+        for _ in range(2)
+    ]
+    return category, transactions
+
+
+@pytest.mark.django_db
+class TestSync:
+
+    def test_unauthenticated_return_401(self, api_client):
+        response = api_client.get("/api/sync/")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_invalid_cursor_return_400(self, authenticated_user):
+        for cursor in ["nope", "WzEsMl0=", "WyJhIiwxLDJd"]:
+            response = authenticated_user.get("/api/sync/", {"cursor": cursor})
+            assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_first_sync_returns_everything_of_the_user(
+        self, authenticated_user, create_user, create_ledger, create_project
+    ):
+        category, transactions = create_ledger
+        task = baker.make(models.Task, project=create_project, user=create_user)
+        other = baker.make(User)
+        baker.make(models.Category, user=other)
+        baker.make(models.Task, project=baker.make(models.Project, user=other), user=other)
+
+        data = sync(authenticated_user)
+        assert ids(data["categories"]) == [category.id]
+        assert ids(data["transactions"]) == sorted(t.id for t in transactions)
+        assert ids(data["projects"]) == [create_project.id]
+        assert ids(data["tasks"]) == [task.id]
+        assert data["has_more"] is False
+        assert data["cursor"]
+
+    def test_warm_sync_returns_only_changes(
+        self, authenticated_user, create_user, create_ledger, create_project
+    ):
+        category, transactions = create_ledger
+        task = baker.make(models.Task, project=create_project, user=create_user)
+        cursor = sync(authenticated_user)["cursor"]
+
+        data = sync(authenticated_user, cursor)
+        assert data["cursor"] == cursor
+        assert not any(data[name] for name in ["categories", "transactions", "projects", "tasks"])
+
+        transactions[0].amount = Decimal("20")
+        transactions[0].save()
+        task.status = "P"
+        task.save()
+        data = sync(authenticated_user, cursor)
+        assert ids(data["transactions"]) == [transactions[0].id]
+        assert ids(data["tasks"]) == [task.id]
+        assert data["tasks"][0]["status"] == "P"
+        assert data["categories"] == []
+        # The task write touched its project
+        assert ids(data["projects"]) == [create_project.id]
+        assert data["cursor"] != cursor
+
+    def test_deletions_are_sent_as_tombstones(
+        self, authenticated_user, create_user, create_ledger, create_project
+    ):
+        category, transactions = create_ledger
+        task = baker.make(models.Task, project=create_project, user=create_user)
+        deleted = {
+            "categories": [category.id],
+            "transactions": [transactions[0].id],
+            "projects": [],
+            "tasks": [task.id],
+        }
+        cursor = sync(authenticated_user)["cursor"]
+
+        transactions[0].delete()
+        task.delete()
+        category.delete()
+        data = sync(authenticated_user, cursor)
+        assert data["deleted"] == deleted
+
+        project_id = create_project.id
+        create_project.delete()
+        data = sync(authenticated_user, data["cursor"])
+        assert data["deleted"]["projects"] == [project_id]
+
+    def test_bulk_writes_are_synced(self, authenticated_user, create_user, create_ledger):
+        _, transactions = create_ledger
+        cursor = sync(authenticated_user)["cursor"]
+
+        authenticated_user.patch(
+            "/api/transactions/bulk-update/",
+            {"ids": [transactions[0].id], "changes": {"amount": "12.50"}},
+            format="json",
+        )
+        authenticated_user.post(
+            "/api/transactions/bulk-delete/", {"ids": [transactions[1].id]}, format="json"
+        )
+        data = sync(authenticated_user, cursor)
+        assert ids(data["transactions"]) == [transactions[0].id]
+        assert data["transactions"][0]["amount"] == Decimal("12.50")
+        assert data["deleted"]["transactions"] == [transactions[1].id]
+
+    def test_new_participant_gets_project_with_own_tasks(
+        self, api_client, create_user, create_project
+    ):
+        participant = baker.make(User)
+        api_client.force_authenticate(user=participant)
+        cursor = sync(api_client)["cursor"]
+        baker.make(models.Category, user=participant)
+        cursor = sync(api_client, cursor)["cursor"]
+
+        tasks = baker.make(
+            models.Task, project=create_project, user=create_user, owner=participant, _quantity=2
+        )
+        baker.make(models.Task, project=create_project, user=create_user)
+        data = sync(api_client, cursor)
+        assert ids(data["projects"]) == [create_project.id]
+        assert ids(data["tasks"]) == sorted(task.id for task in tasks)
+        assert data["deleted"]["tasks"] == []
+
+        create_project.participants.remove(participant)
+        data = sync(api_client, data["cursor"])
+        assert data["deleted"]["projects"] == [create_project.id]
+        assert data["projects"] == []
+
+    def test_reorder_is_synced(self, authenticated_user, create_user, create_project):
+        tasks = baker.make(models.Task, project=create_project, user=create_user, _quantity=3)
+        cursor = sync(authenticated_user)["cursor"]
+        authenticated_user.post(
+            f"/api/projects/{create_project.id}/tasks/reorder/",
+            {"ids": [tasks[2].id, tasks[0].id]},
+            format="json",
+        )
+        data = sync(authenticated_user, cursor)
+        assert ids(data["tasks"]) == sorted([tasks[0].id, tasks[2].id])
+
+    def test_pages_split_changes_written_together(
+        self, authenticated_user, create_user, create_project
+    ):
+        baker.make(models.Task, project=create_project, user=create_user, _quantity=4)
+        # One change number for the whole import
+        bulk_create_transactions(
+            create_user.id,
+            [
+                models.Transaction(
+                    user=create_user,
+                    transaction_type="IN",
+                    amount=Decimal("1"),
+                    created_at=date(2024, 1, 1),
+                )
+                for _ in range(12)
+            ],
+        )
+        seen, cursor, pages = [], None, 0
+        while True:
+            data = sync(authenticated_user, cursor, limit=5)
+            pages += 1
+            for name in ["categories", "transactions", "projects", "tasks"]:
+                seen += [(name, row["id"]) for row in data[name]]
+            cursor = data["cursor"]
+            if not data["has_more"]:
+                break
+        assert pages == 4
+        assert len(seen) == len(set(seen)) == 1 + 4 + 12
+        assert sync(authenticated_user, cursor)["transactions"] == []
+
+    def test_warm_pages_go_through_every_changed_project(
+        self, authenticated_user, create_user
+    ):
+        projects = baker.make(models.Project, user=create_user, _quantity=3)
+        for project in projects:
+            baker.make(models.Task, project=project, user=create_user, _quantity=3)
+        cursor = sync(authenticated_user)["cursor"]
+        for project in projects:
+            for task in project.tasks.all():
+                task.save()
+
+        seen, pages = [], 0
+        while True:
+            data = sync(authenticated_user, cursor, limit=2)
+            pages += 1
+            for name in ["projects", "tasks"]:
+                seen += [(name, row["id"]) for row in data[name]]
+            cursor = data["cursor"]
+            if not data["has_more"]:
+                break
+        assert len(seen) == len(set(seen)) == 3 + 9
+        assert pages == 6
+        assert sync(authenticated_user, cursor)["tasks"] == []
+
+    def test_changes_are_numbered_per_user(self, authenticated_user, create_user, create_ledger):
+        category, _ = create_ledger
+        cursor = sync(authenticated_user)["cursor"]
+        other = baker.make(User)
+        baker.make(models.Category, user=other)
+        baker.make(models.Project, user=other)
+        assert sync(authenticated_user, cursor)["cursor"] == cursor
+
+        category.save()
+        category.refresh_from_db()
+        assert category.change_seq == models.DataVersion.objects.get(
+            user=create_user, scope=models.DataVersion.LEDGER
+        ).version
+
+    def test_regranted_participant_gets_changes_made_meanwhile(
+        self, api_client, create_user, create_project
+    ):
+        participant = baker.make(User)
+        tasks = baker.make(
+            models.Task, project=create_project, user=create_user, owner=participant, _quantity=2
+        )
+        api_client.force_authenticate(user=participant)
+        cursor = sync(api_client)["cursor"]
+
+        create_project.participants.remove(participant)
+        tasks[0].save()
+        create_project.participants.add(participant)
+        data = sync(api_client, cursor)
+        assert ids(data["projects"]) == [create_project.id]
+        assert ids(data["tasks"]) == [tasks[0].id]
+        assert data["deleted"]["projects"] == []
+
+    def test_participant_drops_tasks_given_to_someone_else(
+        self, api_client, create_user, create_project
+    ):
+        participant = baker.make(User)
+        task = baker.make(
+            models.Task, project=create_project, user=create_user, owner=participant
+        )
+        api_client.force_authenticate(user=participant)
+        cursor = sync(api_client)["cursor"]
+
+        task.owner = create_user
+        task.save()
+        data = sync(api_client, cursor)
+        assert data["tasks"] == []
+        assert data["deleted"]["tasks"] == [task.id]
+
+    def test_warm_sync_queries_do_not_grow_with_data(
+        self, authenticated_user, create_user, create_project, django_assert_max_num_queries
+    ):
+        baker.make(models.Task, project=create_project, user=create_user, _quantity=50)
+        for _ in range(5):
+            baker.make(models.Project, user=create_user)
+        cursor = sync(authenticated_user)["cursor"]
+        baker.make(models.Task, project=create_project, user=create_user)
+        # The pruned ledger version and one query per kind of ledger row, then
+        # the projects of the user, the changed ones, their participants, their
+        # deleted tasks and their tasks
+        with django_assert_max_num_queries(9):
+            data = sync(authenticated_user, cursor)
+        assert len(data["tasks"]) == 1
+
+
+def age_tombstones(days):
+    models.Tombstone.objects.update(deleted_at=timezone.now() - timedelta(days=days))
+
+
+@pytest.mark.django_db
+class TestPruneTombstones:
+
+    def test_prunes_old_tombstones_only(
+        self, create_user, create_ledger, create_project
+    ):
+        _, transactions = create_ledger
+        task = baker.make(models.Task, project=create_project, user=create_user)
+        transactions[0].delete()
+        task.delete()
+        age_tombstones(100)
+        kept = transactions[1].id
+        transactions[1].delete()
+
+        call_command("prune_tombstones", "--days", "90")
+        assert list(models.Tombstone.objects.values_list("object_id", flat=True)) == [kept]
+        create_project.refresh_from_db()
+        assert create_project.pruned_seq == create_project.change_seq
+        version = models.DataVersion.objects.get(
+            user=create_user, scope=models.DataVersion.LEDGER
+        )
+        assert 0 < version.pruned_version < version.version
+
+    def test_cursor_before_pruned_deletions_gets_410(
+        self, authenticated_user, create_user, create_ledger
+    ):
+        _, transactions = create_ledger
+        cursor = sync(authenticated_user)["cursor"]
+        transactions[0].delete()
+        age_tombstones(100)
+        call_command("prune_tombstones", "--days", "90")
+
+        response = authenticated_user.get("/api/sync/", {"cursor": cursor})
+        assert response.status_code == status.HTTP_410_GONE
+        data = sync(authenticated_user)
+        assert ids(data["transactions"]) == [transactions[1].id]
+        assert sync(authenticated_user, data["cursor"])["cursor"] == data["cursor"]
+
+    def test_cursor_before_pruned_task_deletions_gets_410(
+        self, authenticated_user, create_user, create_project
+    ):
+        tasks = baker.make(models.Task, project=create_project, user=create_user, _quantity=2)
+        cursor = sync(authenticated_user)["cursor"]
+        tasks[0].delete()
+        age_tombstones(100)
+        call_command("prune_tombstones", "--days", "90")
+
+        response = authenticated_user.get("/api/sync/", {"cursor": cursor})
+        assert response.status_code == status.HTTP_410_GONE
+        assert ids(sync(authenticated_user)["tasks"]) == [tasks[1].id]
+
+    def test_cursor_past_pruned_deletions_keeps_working(
+        self, authenticated_user, create_user, create_ledger, create_project
+    ):
+        _, transactions = create_ledger
+        task = baker.make(models.Task, project=create_project, user=create_user)
+        transactions[0].delete()
+        task.delete()
+        cursor = sync(authenticated_user)["cursor"]
+        age_tombstones(100)
+        call_command("prune_tombstones", "--days", "90")
+
+        assert sync(authenticated_user, cursor)["cursor"] == cursor
+
+    @pytest.mark.parametrize("option", ["--days=-1", "--batch-size=0"])
+    def test_invalid_options_raise(self, option):
+        with pytest.raises(CommandError):
+            call_command("prune_tombstones", option)
@@ -1,7 +1,11 @@
 import pytest
+from datetime import timedelta
+from django.utils import timezone
 from model_bakery import baker
 from rest_framework import status
 from tracker import models
+from tracker.filters import TaskFilter
+from core.models import User
 
 
 @pytest.fixture
@@ -87,7 +91,7 @@ class TestTask:
     ):
         response = authenticated_user.get(f"/api/projects/{create_project.id}/tasks/")
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data) == 5
+        assert len(response.data["results"]) == 5
 
     def test_get_tasks_for_projects_admin_can_access_all_tasks(
         self,
@@ -210,3 +214,472 @@ class TestTask:
         )
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert not models.Task.objects.filter(id=create_task.id).exists()
+
+
+@pytest.mark.django_db
+class TestTaskWritePath:
+
+    def test_save_does_not_load_participants_or_resave_project(
+        self, create_project, create_user, django_assert_num_queries
+    ):
+        baker.make(User, _quantity=5)
+        create_project.participants.add(*User.objects.all())
+        task = baker.make(models.Task, project=create_project, user=create_user, owner=create_user)
+        task.name = "Renamed"
+        # Touch the project, write the task, then the owner's membership and access
+        with django_assert_num_queries(6) as context:
+            task.save()
+        sql = [query["sql"].strip() for query in context.captured_queries]
+        assert not any("tracker_dataversion" in query for query in sql)
+        project_writes = [query for query in sql if query.startswith('UPDATE "tracker_project"')]
+        assert len(project_writes) == 1
+        assert project_writes[0].startswith('UPDATE "tracker_project" SET "updated_at" = ')
+        assert not any('"tracker_project_participants"."user_id" =' in query for query in sql)
+
+    def test_owner_is_added_once(self, create_project, create_user):
+        owner = baker.make(User)
+        baker.make(models.Task, project=create_project, user=create_user, owner=owner)
+        baker.make(models.Task, project=create_project, user=create_user, owner=owner)
+        assert list(create_project.participants.all()) == [owner]
+
+    def test_task_write_invalidates_participant_project_list(
+        self, api_client, create_project, create_user
+    ):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        api_client.force_authenticate(user=participant)
+        api_client.get("/api/projects/")
+        baker.make(models.Task, project=create_project, user=create_user)
+        assert api_client.get("/api/projects/")["X-Cache"] == "MISS"
+
+
+def access_reads(context):
+    return [
+        query["sql"] for query in context.captured_queries
+        if query["sql"].startswith("SELECT") and '"tracker_projectaccess"' in query["sql"]
+    ]
+
+
+@pytest.mark.django_db
+class TestTaskAccessQueries:
+
+    def url(self, project, task=None):
+        url = f"/api/projects/{project.id}/tasks/"
+        return f"{url}{task.id}/" if task else url
+
+    def test_retrieve_resolves_access_once(
+        self, authenticated_user, create_project, create_task, django_assert_num_queries
+    ):
+        # Access, then the task, without reading the project
+        with django_assert_num_queries(2) as context:
+            response = authenticated_user.get(self.url(create_project, create_task))
+        assert response.status_code == status.HTTP_200_OK
+        assert len(access_reads(context)) == 1
+        assert '"tracker_projectaccess"' in context.captured_queries[0]["sql"]
+
+    def test_delete_shares_access_between_permission_checks_and_queryset(
+        self, authenticated_user, create_project, create_task, django_assert_max_num_queries
+    ):
+        with django_assert_max_num_queries(12) as context:
+            response = authenticated_user.delete(self.url(create_project, create_task))
+        assert response.status_code == status.HTTP_204_NO_CONTENT
+        assert len(access_reads(context)) == 1
+        assert not any(
+            query["sql"].startswith('SELECT "tracker_project"."id"')
+            for query in context.captured_queries
+        )
+
+    def test_create_resolves_access_once(
+        self, authenticated_user, create_project, task_data, django_assert_max_num_queries
+    ):
+        with django_assert_max_num_queries(12) as context:
+            response = authenticated_user.post(self.url(create_project), task_data)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(access_reads(context)) == 1
+
+    def test_participant_reads_own_task_but_cannot_delete(
+        self, api_client, create_project, create_task, django_assert_num_queries
+    ):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        create_task.owner = participant
+        create_task.save()
+        api_client.force_authenticate(user=participant)
+        assert api_client.get(self.url(create_project, create_task)).status_code == 200
+        with django_assert_num_queries(1):
+            response = api_client.delete(self.url(create_project, create_task))
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_participant_cannot_get_task_of_another_member(
+        self, api_client, create_project, create_task
+    ):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        other = baker.make(User)
+        create_project.participants.add(other)
+        task = baker.make(models.Task, project=create_project, owner=other)
+        api_client.force_authenticate(user=participant)
+        response = api_client.get(self.url(create_project, task))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = api_client.get(self.url(create_project, create_task))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        assert api_client.get(self.url(create_project)).data["results"] == []
+
+    def test_without_access_return_404(self, api_client, create_project, create_task):
+        api_client.force_authenticate(user=baker.make(User))
+        response = api_client.get(self.url(create_project, create_task))
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+    def test_create_uses_project_of_url(self, authenticated_user, create_project, task_data):
+        other_project = baker.make(models.Project)
+        task_data["project"] = other_project.id
+        response = authenticated_user.post(self.url(create_project), task_data)
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["project"] == create_project.id
+        assert not other_project.tasks.exists()
+
+    def test_update_cannot_move_task(self, authenticated_user, create_project, create_task):
+        other_project = baker.make(models.Project)
+        response = authenticated_user.patch(
+            self.url(create_project, create_task), {"project": other_project.id, "name": "B"}
+        )
+        assert response.status_code == status.HTTP_200_OK
+        create_task.refresh_from_db()
+        assert create_task.project_id == create_project.id
+        assert create_task.name == "B"
+
+    def test_participant_edits_own_tasks_only(
+        self, api_client, create_project, create_user, create_task
+    ):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        own_task = baker.make(
+            models.Task, project=create_project, user=create_user, owner=participant
+        )
+        api_client.force_authenticate(user=participant)
+        response = api_client.patch(self.url(create_project, create_task), {"name": "B"})
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+        response = api_client.patch(self.url(create_project, own_task), {"status": "P"})
+        assert response.status_code == status.HTTP_200_OK
+        own_task.refresh_from_db()
+        assert own_task.status == "P"
+
+
+@pytest.mark.django_db
+class TestBulkTasks:
+
+    def test_bulk_create_and_update(
+        self, authenticated_user, create_project, create_tasks, django_assert_max_num_queries
+    ):
+        owner = baker.make(User)
+        payload = [
+            {"name": f"new {i}", "priority": i, "owner": owner.id} for i in range(20)
+        ] + [{"id": task.id, "status": "C"} for task in create_tasks]
+        initial_updated_at = create_project.updated_at
+
+        # Constant: access, lookups, one INSERT, one UPDATE, memberships, touch, versions
+        with django_assert_max_num_queries(17):
+            response = authenticated_user.post(
+                f"/api/projects/{create_project.id}/tasks/bulk/", payload, format="json"
+            )
+
+        assert response.status_code == status.HTTP_201_CREATED
+        assert len(response.data["created"]) == 20
+        assert sorted(response.data["updated"]) == sorted(task.id for task in create_tasks)
+        assert models.Task.objects.filter(project=create_project, status="C").count() == 5
+        assert models.Task.objects.filter(project=create_project, owner=owner).count() == 20
+        create_project.refresh_from_db()
+        assert create_project.updated_at > initial_updated_at
+        assert owner in create_project.participants.all()
+
+    def test_bulk_update_only_return_200(self, authenticated_user, create_project, create_task):
+        response = authenticated_user.post(
+            f"/api/projects/{create_project.id}/tasks/bulk/",
+            [{"id": create_task.id, "name": "Renamed"}],
+            format="json",
+        )
+        assert response.status_code == status.HTTP_200_OK
+        create_task.refresh_from_db()
+        assert create_task.name == "Renamed"
+
+    def test_task_of_other_project_is_rejected(
+        self, authenticated_user, create_user, create_project
+    ):
+        other_task = baker.make(models.Task, user=create_user)
+        response = authenticated_user.post(
+            f"/api/projects/{create_project.id}/tasks/bulk/",
+            [{"name": "ok"}, {"id": other_task.id, "name": "Moved"}],
+            format="json",
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "id" in response.data[1]
+        assert not models.Task.objects.filter(name="ok").exists()
+
+    def test_new_task_requires_name(self, authenticated_user, create_project):
+        response = authenticated_user.post(
+            f"/api/projects/{create_project.id}/tasks/bulk/", [{"priority": 1}], format="json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_unknown_owner_is_rejected(self, authenticated_user, create_project):
+        response = authenticated_user.post(
+            f"/api/projects/{create_project.id}/tasks/bulk/",
+            [{"name": "Task", "owner": 999_999}],
+            format="json",
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "owner" in response.data[0]
+
+    def test_other_users_project_return_403(self, authenticated_user):
+        project = baker.make(models.Project)
+        response = authenticated_user.post(
+            f"/api/projects/{project.id}/tasks/bulk/", [{"name": "Task"}], format="json"
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
+
+    def test_expects_a_list(self, authenticated_user, create_project):
+        response = authenticated_user.post(
+            f"/api/projects/{create_project.id}/tasks/bulk/", {"name": "Task"}, format="json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestTaskList:
+
+    @pytest.fixture
+    def create_board(self, create_user, create_project):
+        """Tasks with every status, two owners and due dates around today."""
+        other = baker.make(User)
+        today = timezone.localdate()
+        tasks = []
+        for i in range(12):
+            tasks.append(
+                baker.make(
+                    models.Task,
+                    project=create_project,
+                    user=create_user,
+                    name=f"Task {i}",
+                    status="NPRC"[i % 4],
+                    priority=i,
+                    owner=create_user if i % 2 else other,
+                    due_date=today + timedelta(days=i - 6),
+                )
+            )
+        return tasks
+
+    def get(self, client, project, **params):
+        return client.get(f"/api/projects/{project.id}/tasks/", params)
+
+    def test_list_is_paginated(self, authenticated_user, create_project, create_board):
+        response = self.get(authenticated_user, create_project, page_size=5)
+        assert [task["name"] for task in response.data["results"]] == [
+            f"Task {i}" for i in range(11, 6, -1)
+        ]
+        seen = [task["id"] for task in response.data["results"]]
+        while response.data["next"]:
+            response = authenticated_user.get(response.data["next"])
+            seen += [task["id"] for task in response.data["results"]]
+        assert sorted(seen) == sorted(task.id for task in create_board)
+
+    def test_filter_by_status(self, authenticated_user, create_project, create_board):
+        response = self.get(authenticated_user, create_project, status="C")
+        assert {task["name"] for task in response.data["results"]} == {
+            "Task 3",
+            "Task 7",
+            "Task 11",
+        }
+
+    def test_filter_by_priority_range_and_owner(
+        self, authenticated_user, create_project, create_board, create_user
+    ):
+        response = self.get(
+            authenticated_user,
+            create_project,
+            priority_min=2,
+            priority_max=8,
+            owner=create_user.id,
+        )
+        assert {task["priority"] for task in response.data["results"]} == {3, 5, 7}
+
+    def test_filter_by_due_date_range(self, authenticated_user, create_project, create_board):
+        today = timezone.localdate()
+        response = self.get(
+            authenticated_user,
+            create_project,
+            due_date_from=today.isoformat(),
+            due_date_to=(today + timedelta(days=2)).isoformat(),
+        )
+        assert {task["name"] for task in response.data["results"]} == {
+            "Task 6",
+            "Task 7",
+            "Task 8",
+        }
+
+    def test_overdue(self, authenticated_user, create_project, create_board):
+        response = self.get(authenticated_user, create_project, overdue="true")
+        # Due before today (tasks 0-5) and not completed (3 is)
+        assert {task["name"] for task in response.data["results"]} == {
+            f"Task {i}" for i in (0, 1, 2, 4, 5)
+        }
+        response = self.get(authenticated_user, create_project, overdue="false")
+        assert len(response.data["results"]) == 7
+
+    def test_invalid_status_return_400(self, authenticated_user, create_project):
+        response = self.get(authenticated_user, create_project, status="X")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_filtered_page_query_count(
+        self, authenticated_user, create_project, create_board, django_assert_num_queries
+    ):
+        # Project access and tasks, no per-row queries
+        with django_assert_num_queries(2):
+            response = self.get(authenticated_user, create_project, status="N", page_size=2)
+        assert len(response.data["results"]) == 2
+        assert response.data["next"]
+
+    @pytest.mark.parametrize(
+        "params, index",
+        [
+            ({}, "task_project_updated_idx"),
+            ({"status": "P"}, "task_project_status_idx"),
+        ],
+    )
+    def test_project_filters_use_matching_index(
+        self, create_project, create_board, params, index
+    ):
+        queryset = TaskFilter(
+            params, queryset=models.Task.objects.filter(project=create_project)
+        ).qs.order_by("-updated_at", "-id")
+        assert index in queryset.explain()
+
+    def test_owner_due_date_filter_uses_index(self, create_board, create_user):
+        queryset = TaskFilter(
+            {"owner": create_user.id, "overdue": "true"}, queryset=models.Task.objects.all()
+        ).qs
+        assert "task_owner_due_idx" in queryset.explain()
+
+
+@pytest.mark.django_db
+class TestTaskSparseFields:
+
+    def url(self, project):
+        return f"/api/projects/{project.id}/tasks/"
+
+    def test_owner_is_nested_by_default(self, authenticated_user, create_project, create_task):
+        response = authenticated_user.get(self.url(create_project))
+        assert response.data["results"][0]["owner"]["id"] == create_task.owner_id
+        response = authenticated_user.get(f"{self.url(create_project)}{create_task.id}/")
+        assert response.data["owner"]["id"] == create_task.owner_id
+
+    def test_empty_expand_returns_owner_id(
+        self, authenticated_user, create_project, create_task, django_assert_num_queries
+    ):
+        # Project access, then the tasks without their owners
+        with django_assert_num_queries(2):
+            response = authenticated_user.get(self.url(create_project), {"expand": ""})
+        assert response.data["results"][0]["owner"] == create_task.owner_id
+
+    def test_fields_trims_output(self, authenticated_user, create_project, create_task):
+        response = authenticated_user.get(self.url(create_project), {"fields": "id,name"})
+        assert response.data["results"] == [{"id": create_task.id, "name": create_task.name}]
+        response = authenticated_user.get(
+            f"{self.url(create_project)}{create_task.id}/", {"fields": "status"}
+        )
+        assert response.data == {"status": create_task.status}
+
+    def test_expand_owner_joins_users(
+        self, authenticated_user, create_project, create_tasks, django_assert_num_queries
+    ):
+        # Project access, then the tasks joined with their owners
+        with django_assert_num_queries(2):
+            response = authenticated_user.get(self.url(create_project), {"expand": "owner"})
+        owners = {task["owner"]["id"] for task in response.data["results"]}
+        assert owners == {task.owner_id for task in create_tasks}
+        assert set(response.data["results"][0]["owner"]) >= {"id", "username"}
+
+    def test_expand_outside_fields_is_ignored(
+        self, authenticated_user, create_project, create_task
+    ):
+        response = authenticated_user.get(
+            self.url(create_project), {"fields": "id", "expand": "owner"}
+        )
+        assert response.data["results"] == [{"id": create_task.id}]
+
+    @pytest.mark.parametrize("query", [{"fields": "id,secret"}, {"expand": "project"}])
+    def test_unknown_names_return_400(self, authenticated_user, create_project, query):
+        response = authenticated_user.get(self.url(create_project), query)
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestTaskReorder:
+
+    def url(self, project):
+        return f"/api/projects/{project.id}/tasks/reorder/"
+
+    def test_reorder_sets_priorities(self, authenticated_user, create_project, create_tasks):
+        ids = [task.id for task in reversed(create_tasks)]
+        initial_updated_at = create_project.updated_at
+        response = authenticated_user.post(
+            self.url(create_project), {"ids": ids, "start": 10}, format="json"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data == {"updated": 5}
+        priorities = dict(
+            models.Task.objects.filter(project=create_project).values_list("id", "priority")
+        )
+        assert [priorities[task_id] for task_id in ids] == [10, 11, 12, 13, 14]
+        create_project.refresh_from_db()
+        assert create_project.updated_at > initial_updated_at
+
+    def test_reorder_queries_do_not_grow_with_tasks(
+        self, authenticated_user, create_project, create_user, django_assert_max_num_queries
+    ):
+        tasks = models.Task.objects.bulk_create(
+            models.Task(project=create_project, user=create_user, name=f"Task {i}")
+            for i in range(2500)
+        )
+        ids = [task.id for task in reversed(tasks)]
+        # Access, lookup, three chunked UPDATEs, then the project touch
+        with django_assert_max_num_queries(12):
+            response = authenticated_user.post(
+                self.url(create_project), {"ids": ids}, format="json"
+            )
+        assert response.data == {"updated": 2500}
+        first = models.Task.objects.filter(project=create_project).order_by("priority").first()
+        assert first.id == tasks[-1].id
+
+    def test_task_of_other_project_return_400(
+        self, authenticated_user, create_project, create_task, create_user
+    ):
+        other_task = baker.make(models.Task, user=create_user)
+        response = authenticated_user.post(
+            self.url(create_project), {"ids": [create_task.id, other_task.id]}, format="json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        other_task.refresh_from_db()
+        assert other_task.priority == 0
+
+    def test_duplicate_ids_return_400(self, authenticated_user, create_project, create_task):
+        response = authenticated_user.post(
+            self.url(create_project), {"ids": [create_task.id, create_task.id]}, format="json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_start_past_priority_range_return_400(
+        self, authenticated_user, create_project, create_task
+    ):
+        response = authenticated_user.post(
+            self.url(create_project), {"ids": [create_task.id], "start": 2**31}, format="json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_participant_cannot_reorder(self, api_client, create_project, create_task):
+        participant = baker.make(User)
+        create_project.participants.add(participant)
+        api_client.force_authenticate(user=participant)
+        response = api_client.post(
+            self.url(create_project), {"ids": [create_task.id]}, format="json"
+        )
+        assert response.status_code == status.HTTP_403_FORBIDDEN
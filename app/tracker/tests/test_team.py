@@ -85,3 +85,17 @@ class TestTeam:
         response = authenticated_user.delete(f"/api/teams/{create_team.id}/")
         assert response.status_code == status.HTTP_204_NO_CONTENT
         assert not models.Team.objects.filter(id=create_team.id).exists()
+
+
+@pytest.mark.django_db
+class TestTeamCache:
+
+    def test_member_update_invalidates_cached_team(self, authenticated_user, create_team):
+        authenticated_user.get("/api/teams/me/")
+        assert authenticated_user.get("/api/teams/me/")["X-Cache"] == "HIT"
+
+        member = baker.make(User)
+        authenticated_user.patch(f"/api/teams/{create_team.id}/", {"members": [member.id]})
+        response = authenticated_user.get("/api/teams/me/")
+        assert response["X-Cache"] == "MISS"
+        assert [m["id"] for m in response.data["members"]] == [member.id]
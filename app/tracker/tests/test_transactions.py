@@ -1,7 +1,18 @@
+import csv
+import gzip
+import io
+import json
 import pytest
+import warnings
+from decimal import Decimal
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
 from rest_framework import status
+from rest_framework_simplejwt.tokens import AccessToken
 from model_bakery import baker
-from tracker.models import Transaction, Balance, Category
+from tracker.filters import TransactionFilter
+from tracker.models import Transaction, Balance, Category, MonthlyRollup
 
 
 @pytest.fixture
@@ -57,8 +68,8 @@ class TestTransaction:
     ):
         response = authenticated_user.get("/api/transactions/")
         assert response.status_code == status.HTTP_200_OK
-        assert len(response.data) == 1
-        assert response.data[0]["id"] == create_transaction.id
+        assert len(response.data["results"]) == 1
+        assert response.data["results"][0]["id"] == create_transaction.id
 
     def test_create_transaction_unauthenticated_return_401(self, api_client, transaction_data):
         response = api_client.post("/api/transactions/", transaction_data)
@@ -126,3 +137,588 @@ class TestTransaction:
         create_balance.refresh_from_db()
 
         assert create_balance.amount == initial_balance - transaction_amount
+
+
+@pytest.mark.django_db
+class TestTransactionSparseFields:
+
+    def test_category_is_an_id_by_default(self, authenticated_user, create_transaction):
+        response = authenticated_user.get("/api/transactions/")
+        assert response.data["results"][0]["category"] == create_transaction.category_id
+
+    def test_fields_and_expand(
+        self, authenticated_user, create_transaction, create_category, django_assert_num_queries
+    ):
+        # Version, then the transactions joined with their categories
+        with django_assert_num_queries(2):
+            response = authenticated_user.get(
+                "/api/transactions/", {"fields": "id,category", "expand": "category"}
+            )
+        assert response.data["results"] == [
+            {
+                "id": create_transaction.id,
+                "category": {"id": create_category.id, "name": create_category.name},
+            }
+        ]
+
+    def test_unknown_expand_return_400(self, authenticated_user):
+        response = authenticated_user.get("/api/transactions/", {"expand": "user"})
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestTransactionImport:
+
+    def test_import_unauthenticated_return_401(self, api_client):
+        response = api_client.post("/api/transactions/import/", [], format="json")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_import_json_creates_transactions_and_updates_balance(
+        self, authenticated_user, create_balance, create_category
+    ):
+        rows = [
+            {"transaction_type": "IN", "amount": "30.00", "created_at": "2024-10-01"},
+            {
+                "transaction_type": "OUT",
+                "amount": "12.50",
+                "created_at": "2024-10-02",
+                "category": create_category.id,
+                "description": "Groceries",
+            },
+        ]
+        response = authenticated_user.post("/api/transactions/import/", rows, format="json")
+        assert response.status_code == status.HTTP_201_CREATED
+        assert response.data["created"] == 2
+        assert Transaction.objects.filter(category=create_category).count() == 1
+        create_balance.refresh_from_db()
+        assert create_balance.amount == Decimal("117.50")
+
+    def test_import_csv_creates_transactions(self, authenticated_user, create_user):
+        content = (
+            "transaction_type,amount,created_at,description,category\n"
+            "IN,100.00,2024-10-01,Salary,\n"
+            "OUT,40.00,2024-10-03,,\n"
+        )
+        upload = SimpleUploadedFile("statement.csv", content.encode(), content_type="text/csv")
+        response = authenticated_user.post(
+            "/api/transactions/import/", {"file": upload}, format="multipart"
+        )
+        assert response.status_code == status.HTTP_201_CREATED
+        assert Transaction.objects.filter(user=create_user).count() == 2
+        assert Balance.objects.get(user=create_user).amount == Decimal("60.00")
+
+    def test_import_rejects_file_that_is_not_utf8(self, authenticated_user, create_user):
+        content = "transaction_type,amount,created_at\nOUT,4.00,2024-10-01,Caf\xe9\n"
+        upload = SimpleUploadedFile(
+            "statement.csv", content.encode("cp1252"), content_type="text/csv"
+        )
+        response = authenticated_user.post(
+            "/api/transactions/import/", {"file": upload}, format="multipart"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert "UTF-8" in response.data["detail"]
+        assert not Transaction.objects.filter(user=create_user).exists()
+
+    def test_import_reports_row_errors_and_writes_nothing(
+        self, authenticated_user, create_user
+    ):
+        other_category = baker.make(Category)
+        rows = [
+            {"transaction_type": "IN", "amount": "10.00", "created_at": "2024-10-01"},
+            {"transaction_type": "XX", "amount": "10.00", "created_at": "2024-10-01"},
+            {
+                "transaction_type": "OUT",
+                "amount": "5.00",
+                "created_at": "2024-10-01",
+                "category": other_category.id,
+            },
+        ]
+        response = authenticated_user.post("/api/transactions/import/", rows, format="json")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+        assert [error["row"] for error in response.data["errors"]] == [2, 3]
+        assert "transaction_type" in response.data["errors"][0]["errors"]
+        assert "category" in response.data["errors"][1]["errors"]
+        assert not Transaction.objects.filter(user=create_user).exists()
+
+    def test_import_rejects_non_list_payload(self, authenticated_user):
+        response = authenticated_user.post(
+            "/api/transactions/import/", {"amount": "1.00"}, format="json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestTransactionPagination:
+
+    @pytest.fixture
+    def create_history(self, create_user):
+        """Fixture to create 25 transactions sharing a handful of dates."""
+        return [
+            baker.make(
+                Transaction,
+                user=create_user,
+                transaction_type="IN",
+                amount=1,
+                created_at=f"2024-10-{i % 4 + 1:02d}",
+            )
+            for i in range(25)
+        ]
+
+    def test_pages_walk_history_newest_first_without_gaps(
+        self, authenticated_user, create_history
+    ):
+        expected = sorted(create_history, key=lambda t: (t.created_at, t.id), reverse=True)
+        seen = []
+        url = "/api/transactions/?page_size=10"
+        while url:
+            response = authenticated_user.get(url)
+            assert response.status_code == status.HTTP_200_OK
+            seen.extend(row["id"] for row in response.data["results"])
+            url = response.data["next"]
+        assert seen == [t.id for t in expected]
+
+    def test_previous_link_returns_previous_page(self, authenticated_user, create_history):
+        first = authenticated_user.get("/api/transactions/?page_size=10")
+        assert first.data["previous"] is None
+        second = authenticated_user.get(first.data["next"])
+        previous = authenticated_user.get(second.data["previous"])
+        assert previous.data["results"] == first.data["results"]
+        assert previous.data["previous"] is None
+
+    def test_page_query_count_is_constant(
+        self, authenticated_user, create_history, django_assert_num_queries
+    ):
+        first = authenticated_user.get("/api/transactions/?page_size=5")
+        # The version stamp lookup and the page itself
+        with django_assert_num_queries(2):
+            authenticated_user.get(first.data["next"])
+
+    def test_invalid_cursor_return_404(self, authenticated_user):
+        response = authenticated_user.get("/api/transactions/?cursor=not-a-cursor")
+        assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+@pytest.mark.django_db
+class TestTransactionSummary:
+
+    @pytest.fixture
+    def create_month(self, create_user, create_category):
+        """Fixture to create October transactions plus one outside the month."""
+        for transaction_type, amount, category, day in [
+            ("IN", 1000, None, "2024-10-01"),
+            ("OUT", 30, create_category, "2024-10-05"),
+            ("OUT", 20, create_category, "2024-10-31"),
+            ("IN", 5, create_category, "2024-10-15"),
+            ("OUT", 999, create_category, "2024-11-01"),
+        ]:
+            baker.make(
+                Transaction,
+                user=create_user,
+                transaction_type=transaction_type,
+                amount=amount,
+                category=category,
+                created_at=day,
+            )
+        baker.make(Transaction, transaction_type="IN", amount=50, created_at="2024-10-02")
+
+    def test_summary_unauthenticated_return_401(self, api_client):
+        response = api_client.get("/api/transactions/summary/")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_summary_for_month(
+        self, authenticated_user, create_month, create_category, django_assert_num_queries
+    ):
+        with django_assert_num_queries(1):
+            response = authenticated_user.get("/api/transactions/summary/?month=2024-10")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["totals"] == {
+            "income": 1005,
+            "expense": 50,
+            "count": 4,
+            "net": 955,
+        }
+        by_category = {row["id"]: row for row in response.data["categories"]}
+        assert by_category[None]["income"] == 1000
+        assert by_category[create_category.id]["name"] == create_category.name
+        assert by_category[create_category.id]["expense"] == 50
+        assert by_category[create_category.id]["income"] == 5
+
+    def test_summary_for_date_range(self, authenticated_user, create_month):
+        response = authenticated_user.get(
+            "/api/transactions/summary/?date_from=2024-10-05&date_to=2024-11-01"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["totals"]["expense"] == 1049
+        assert response.data["totals"]["income"] == 5
+
+    def test_summary_at_end_of_calendar(self, authenticated_user):
+        for month in ["0001-01", "9999-12"]:
+            response = authenticated_user.get("/api/transactions/summary/", {"month": month})
+            assert response.status_code == status.HTTP_200_OK
+            assert response.data["totals"]["count"] == 0
+
+    def test_summary_rejects_incomplete_range(self, authenticated_user):
+        response = authenticated_user.get("/api/transactions/summary/?date_from=2024-10-05")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_summary_rejects_invalid_month(self, authenticated_user):
+        response = authenticated_user.get("/api/transactions/summary/?month=2024-13")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db
+class TestTransactionExport:
+
+    def test_export_unauthenticated_return_401(self, api_client):
+        response = api_client.get("/api/transactions/export/")
+        assert response.status_code == status.HTTP_401_UNAUTHORIZED
+
+    def test_export_csv_streams_own_transactions(
+        self, authenticated_user, create_transaction, create_category
+    ):
+        baker.make(Transaction, transaction_type="IN", amount=1, created_at="2024-10-01")
+        response = authenticated_user.get("/api/transactions/export/")
+        assert response.status_code == status.HTTP_200_OK
+        assert response.streaming
+        assert response["Content-Type"] == "text/csv"
+        rows = list(csv.reader(io.StringIO(b"".join(response.streaming_content).decode())))
+        assert rows[0][:4] == ["id", "created_at", "transaction_type", "amount"]
+        assert len(rows) == 2
+        assert rows[1][0] == str(create_transaction.id)
+        assert rows[1][5] == create_category.name
+
+    def test_export_gzipped_ndjson(self, authenticated_user, create_transaction):
+        response = authenticated_user.get("/api/transactions/export/?output=ndjson&gzip=true")
+        assert response.status_code == status.HTTP_200_OK
+        assert response["Content-Type"] == "application/gzip"
+        assert 'filename="transactions.ndjson.gz"' in response["Content-Disposition"]
+        lines = gzip.decompress(b"".join(response.streaming_content)).decode().splitlines()
+        assert [json.loads(line)["id"] for line in lines] == [create_transaction.id]
+
+    def test_export_rejects_unknown_output(self, authenticated_user):
+        response = authenticated_user.get("/api/transactions/export/?output=xml")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+@pytest.mark.django_db(transaction=True)
+class TestTransactionExportOverASGI:
+
+    def test_export_is_sent_block_by_block(self, asgi_get, create_user):
+        Transaction.objects.bulk_create(
+            Transaction(
+                user=create_user,
+                transaction_type="IN",
+                amount=1,
+                created_at="2024-10-01",
+                description="x" * 50,
+            )
+            for _ in range(5000)
+        )
+        headers = [(b"authorization", f"JWT {AccessToken.for_user(create_user)}".encode())]
+
+        async def until(messages):
+            return False
+
+        with warnings.catch_warnings(record=True) as caught:
+            warnings.simplefilter("always")
+            messages = asgi_get("/api/transactions/export/", headers, until)
+
+        assert messages[0]["status"] == status.HTTP_200_OK
+        bodies = [m.get("body", b"") for m in messages if m["type"] == "http.response.body"]
+        # One message per block of about 64KB, not the whole export at once
+        assert len([body for body in bodies if body]) > 3
+        rows = list(csv.reader(io.StringIO(b"".join(bodies).decode())))
+        assert len(rows) == 5001
+        assert not any("synchronous iterators" in str(warning.message) for warning in caught)
+
+
+@pytest.mark.django_db
+class TestTransactionFilters:
+
+    @pytest.fixture
+    def create_transactions(self, create_user, create_category):
+        """Fixture to create a mix of transactions for the filters."""
+        specs = [
+            ("IN", "1000.00", None, "2024-10-01", "October salary"),
+            ("OUT", "45.90", create_category, "2024-10-12", "Supermarket"),
+            ("OUT", "12.00", create_category, "2024-11-03", "Coffee beans"),
+            ("OUT", "300.00", None, "2024-11-20", "Rent share"),
+        ]
+        return [
+            baker.make(
+                Transaction,
+                user=create_user,
+                transaction_type=transaction_type,
+                amount=Decimal(amount),
+                category=category,
+                created_at=day,
+                description=description,
+            )
+            for transaction_type, amount, category, day, description in specs
+        ]
+
+    def ids(self, client, query):
+        response = client.get(f"/api/transactions/?{query}")
+        assert response.status_code == status.HTTP_200_OK
+        return {row["id"] for row in response.data["results"]}
+
+    @pytest.mark.parametrize(
+        "query, expected",
+        [
+            ("created_at=2024-10-20", [0, 1]),
+            ("date_from=2024-10-10&date_to=2024-11-03", [1, 2]),
+            ("transaction_type=IN", [0]),
+            ("category=uncategorized", [0, 3]),
+            ("amount_min=40&amount_max=400", [1, 3]),
+            ("description=COFFEE", [2]),
+            ("transaction_type=OUT&category=uncategorized", [3]),
+        ],
+    )
+    def test_filters(self, authenticated_user, create_transactions, query, expected):
+        expected_ids = {create_transactions[i].id for i in expected}
+        assert self.ids(authenticated_user, query) == expected_ids
+
+    def test_filter_by_category_id(
+        self, authenticated_user, create_transactions, create_category
+    ):
+        assert self.ids(authenticated_user, f"category={create_category.id}") == {
+            create_transactions[1].id,
+            create_transactions[2].id,
+        }
+
+    @pytest.mark.parametrize(
+        "query", ["category=groceries", "created_at=2024-13-01", "transaction_type=XX"]
+    )
+    def test_invalid_filter_return_400(self, authenticated_user, query):
+        response = authenticated_user.get(f"/api/transactions/?{query}")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    @pytest.mark.parametrize(
+        "params, index",
+        [
+            ({"date_from": "2024-10-01"}, "transaction_user_created_idx"),
+            ({"transaction_type": "OUT"}, "transaction_user_type_idx"),
+            ({"category": "uncategorized"}, "transaction_user_category_idx"),
+            ({"amount_min": "100"}, "transaction_user_amount_idx"),
+        ],
+    )
+    def test_filters_use_matching_index(self, create_user, create_transactions, params, index):
+        queryset = TransactionFilter(
+            params, queryset=Transaction.objects.filter(user=create_user)
+        ).qs.order_by("-created_at", "-id")
+        assert index in queryset.explain()
+
+
+@pytest.mark.django_db
+class TestTransactionConditionalGet:
+
+    def test_unchanged_list_return_304(self, authenticated_user, create_transaction):
+        first = authenticated_user.get("/api/transactions/")
+        second = authenticated_user.get(
+            "/api/transactions/", HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+        assert second.status_code == status.HTTP_304_NOT_MODIFIED
+
+    def test_etag_depends_on_query(self, authenticated_user, create_transaction):
+        first = authenticated_user.get("/api/transactions/")
+        filtered = authenticated_user.get(
+            "/api/transactions/?transaction_type=OUT", HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+        assert filtered.status_code == status.HTTP_200_OK
+
+    def test_update_invalidates_list(self, authenticated_user, create_transaction):
+        first = authenticated_user.get("/api/transactions/")
+        authenticated_user.patch(
+            f"/api/transactions/{create_transaction.id}/", {"description": "Changed"}
+        )
+        second = authenticated_user.get(
+            "/api/transactions/", HTTP_IF_NONE_MATCH=first["ETag"]
+        )
+        assert second.status_code == status.HTTP_200_OK
+        assert second.data["results"][0]["description"] == "Changed"
+
+
+@pytest.mark.django_db
+class TestTransactionBulkOperations:
+
+    @pytest.fixture
+    def create_transactions(self, create_user, create_category):
+        """Fixture to create 30 October expenses of 2.00 each."""
+        return [
+            baker.make(
+                Transaction,
+                user=create_user,
+                category=create_category,
+                transaction_type="OUT",
+                amount=Decimal("2.00"),
+                created_at=f"2024-10-{i % 28 + 1:02d}",
+            )
+            for i in range(30)
+        ]
+
+    def test_bulk_delete_by_ids_adjusts_balance(
+        self, authenticated_user, create_user, create_transactions
+    ):
+        ids = [t.id for t in create_transactions[:10]]
+        response = authenticated_user.post(
+            "/api/transactions/bulk-delete/", {"ids": ids}, format="json"
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["deleted"] == 10
+        assert Transaction.objects.filter(user=create_user).count() == 20
+        assert Balance.objects.get(user=create_user).amount == Decimal("-40.00")
+
+    def test_bulk_delete_by_filter(self, authenticated_user, create_user, create_transactions):
+        response = authenticated_user.post(
+            "/api/transactions/bulk-delete/",
+            {"filter": {"date_from": "2024-10-15"}},
+            format="json",
+        )
+        assert response.data["deleted"] == 14
+        assert Balance.objects.get(user=create_user).amount == Decimal("-32.00")
+
+    def test_bulk_delete_ignores_other_users_transactions(self, authenticated_user):
+        other = baker.make(
+            Transaction, transaction_type="IN", amount=5, created_at="2024-10-01"
+        )
+        response = authenticated_user.post(
+            "/api/transactions/bulk-delete/", {"ids": [other.id]}, format="json"
+        )
+        assert response.data["deleted"] == 0
+        assert Transaction.objects.filter(id=other.id).exists()
+
+    @pytest.mark.parametrize(
+        "payload",
+        [{}, {"ids": [1], "filter": {"transaction_type": "IN"}}, {"filter": {"unknown": "1"}}],
+    )
+    def test_bulk_delete_requires_a_valid_selection(self, authenticated_user, payload):
+        response = authenticated_user.post(
+            "/api/transactions/bulk-delete/", payload, format="json"
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_bulk_update_changes_type_and_amount(
+        self, authenticated_user, create_user, create_transactions
+    ):
+        ids = [t.id for t in create_transactions[:5]]
+        response = authenticated_user.patch(
+            "/api/transactions/bulk-update/",
+            {"ids": ids, "changes": {"transaction_type": "IN", "amount": "10.00"}},
+            format="json",
+        )
+        assert response.status_code == status.HTTP_200_OK
+        assert response.data["updated"] == 5
+        # 25 expenses of 2.00 and 5 incomes of 10.00
+        assert Balance.objects.get(user=create_user).amount == Decimal("0.00")
+        rollups = {
+            r.transaction_type: (r.amount, r.transaction_count)
+            for r in MonthlyRollup.objects.filter(user=create_user, transaction_count__gt=0)
+        }
+        assert rollups == {"IN": (Decimal("50.00"), 5), "OUT": (Decimal("50.00"), 25)}
+
+    def test_bulk_update_recategorizes_by_filter(
+        self, authenticated_user, create_user, create_category, create_transactions
+    ):
+        response = authenticated_user.patch(
+            "/api/transactions/bulk-update/",
+            {"filter": {"category": str(create_category.id)}, "changes": {"category": None}},
+            format="json",
+        )
+        assert response.data["updated"] == 30
+        assert not Transaction.objects.filter(category=create_category).exists()
+        assert Balance.objects.get(user=create_user).amount == Decimal("-60.00")
+
+    def test_bulk_update_rejects_foreign_category(self, authenticated_user, create_transactions):
+        response = authenticated_user.patch(
+            "/api/transactions/bulk-update/",
+            {
+                "ids": [create_transactions[0].id],
+                "changes": {"category": baker.make(Category).id},
+            },
+            format="json",
+        )
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+    def test_statement_count_does_not_depend_on_batch_size(
+        self, authenticated_user, create_transactions
+    ):
+        def delete(transactions):
+            with CaptureQueriesContext(connection) as queries:
+                authenticated_user.post(
+                    "/api/transactions/bulk-delete/",
+                    {"ids": [t.id for t in transactions]},
+                    format="json",
+                )
+            return len(queries)
+
+        assert delete(create_transactions[:2]) == delete(create_transactions[2:])
+
+
+@pytest.mark.django_db
+class TestTransactionSearch:
+
+    @pytest.fixture
+    def create_transactions(self, create_user):
+        """Fixture to create transactions with searchable descriptions."""
+        descriptions = [
+            "Coffee at the airport",
+            "Coffee beans and coffee filters",
+            "Monthly rent",
+            None,
+        ]
+        return [
+            baker.make(
+                Transaction,
+                user=create_user,
+                transaction_type="OUT",
+                amount=1,
+                created_at="2024-10-01",
+                description=description,
+            )
+            for description in descriptions
+        ]
+
+    def search(self, client, query):
+        response = client.get("/api/transactions/search/", {"q": query})
+        assert response.status_code == status.HTTP_200_OK
+        return [row["id"] for row in response.data["results"]]
+
+    def test_search_ranks_by_relevance(self, authenticated_user, create_transactions):
+        assert self.search(authenticated_user, "coffee") == [
+            create_transactions[1].id,
+            create_transactions[0].id,
+        ]
+
+    def test_search_matches_all_words_and_prefixes(
+        self, authenticated_user, create_transactions
+    ):
+        assert self.search(authenticated_user, "coffee airp") == [create_transactions[0].id]
+        assert self.search(authenticated_user, '"rent* (') == [create_transactions[2].id]
+
+    def test_search_follows_updates_and_deletes(
+        self, authenticated_user, create_transactions
+    ):
+        create_transactions[2].description = "Rent and coffee"
+        create_transactions[2].save()
+        create_transactions[0].delete()
+        assert set(self.search(authenticated_user, "coffee")) == {
+            create_transactions[1].id,
+            create_transactions[2].id,
+        }
+        assert self.search(authenticated_user, "airport") == []
+
+    def test_search_only_returns_own_transactions(
+        self, authenticated_user, create_transactions
+    ):
+        baker.make(
+            Transaction,
+            transaction_type="OUT",
+            amount=1,
+            created_at="2024-10-01",
+            description="coffee",
+        )
+        assert len(self.search(authenticated_user, "coffee")) == 2
+
+    def test_search_requires_query(self, authenticated_user):
+        response = authenticated_user.get("/api/transactions/search/")
+        assert response.status_code == status.HTTP_400_BAD_REQUEST
@@ -9,9 +9,15 @@ router = routers.DefaultRouter()
 
 router.register("categories", views.CategoryViewSet, basename="categories")
 router.register("transactions", views.TransactionViewSet, basename="transactions")
+router.register("budgets", views.BudgetViewSet, basename="budgets")
+router.register(
+    "recurring-transactions", views.RecurringTransactionViewSet, basename="recurring-transactions"
+)
 router.register("balances", views.BalanceViewSet, basename="balances")
 router.register("projects", views.ProjectViewSet, basename="projects")
 router.register("teams", views.TeamViewSet, basename="teams")
+router.register("sync", views.SyncViewSet, basename="sync")
+router.register("cache-stats", views.CacheStatsViewSet, basename="cache-stats")
 
 projects_router = routers.NestedDefaultRouter(router, "projects", lookup="projects")
 projects_router.register("tasks", views.TaskViewSet, basename="tasks")
@@ -2,17 +2,569 @@
 Utilities functions
 """
 
+import calendar
+import csv
+import io
+import json
+import zlib
+from collections import defaultdict
+from datetime import date, datetime, time, timedelta
+from decimal import Decimal
+
+from asgiref.sync import sync_to_async
+
 from . import models
-from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import IntegrityError, connection
+from django.db.models import (
+    BooleanField,
+    Case,
+    Count,
+    DecimalField,
+    ExpressionWrapper,
+    F,
+    Max,
+    Min,
+    OuterRef,
+    Q,
+    Subquery,
+    Sum,
+    Value,
+    When,
+    Window,
+)
+from django.db.models.functions import Coalesce, RowNumber, Trunc
+from django.db.transaction import atomic
+from django.utils import timezone
+
+
+def ledger_version(request):
+    """Version stamp of the transactions and balance of the request user"""
+    return get_version(request.user.id, models.DataVersion.LEDGER)
+
+
+def project_list_version(request):
+    """Version stamp of the projects and tasks visible to the request user,
+    read with one grouped query.
+
+    The projects version of the user moves when access is granted or revoked
+    and the change number of a project on every other write, so their sum
+    over the projects of the user moves on every change. Overdue counts
+    change at midnight, so the date is part of it.
+    """
+    access_version = models.DataVersion.objects.filter(
+        user_id=OuterRef("user_id"), scope=models.DataVersion.PROJECTS
+    )
+    totals = (
+        models.ProjectAccess.objects.filter(user_id=request.user.id)
+        .values("user_id")
+        .annotate(
+            changes=Sum("project__change_seq"),
+            updated_at=Max("project__updated_at"),
+            version=Subquery(access_version.values("version")[:1]),
+            access_updated_at=Subquery(access_version.values("updated_at")[:1]),
+        )
+        .order_by("user_id")
+        .first()
+    ) or {"changes": 0, "updated_at": None, "version": 0, "access_updated_at": None}
+    today = timezone.localdate()
+    midnight = timezone.make_aware(datetime.combine(today, time.min))
+    updated_at = max(
+        [value for value in (totals["updated_at"], totals["access_updated_at"]) if value],
+        default=None,
+    )
+    return (
+        f"{totals['version'] or 0}-{totals['changes']}-{today:%Y%m%d}",
+        max(updated_at, midnight) if updated_at else None,
+    )
+
+
+def team_version(request):
+    """Version stamp of the team of the request user"""
+    return get_version(request.user.id, models.DataVersion.TEAM)
+
+
+def signed_amount(transaction_type, amount):
+    """Return the effect of a transaction on the balance: positive for income,
+    negative for expenses"""
+    return amount if transaction_type == "IN" else -amount
+
+
+def month_start(day):
+    """First day of the month of a date"""
+    return day.replace(day=1)
+
+
+def period_start(day, interval):
+    """First day of the day, week (Monday) or month containing a date"""
+    if interval == "month":
+        return month_start(day)
+    if interval == "week":
+        return day - timedelta(days=day.weekday())
+    return day
+
+
+def next_period(day, interval):
+    """First day of the period following the one starting at ``day``"""
+    if interval == "month":
+        return (day + timedelta(days=32)).replace(day=1)
+    return day + timedelta(days=7 if interval == "week" else 1)
+
+
+def add_months(day, months, anchor_day=None):
+    """``day`` moved by a number of months, on ``anchor_day`` (the day of
+    ``day`` by default) clipped to the length of the target month"""
+    month_index = day.year * 12 + day.month - 1 + months
+    year, month = divmod(month_index, 12)
+    last_day = calendar.monthrange(year, month + 1)[1]
+    return date(year, month + 1, min(anchor_day or day.day, last_day))
+
+
+def next_occurrence(day, frequency, interval=1, anchor_day=None):
+    """Occurrence following ``day`` of a schedule repeating every ``interval``
+    days, weeks, months or years. Monthly and yearly schedules stay on
+    ``anchor_day`` where the month is long enough."""
+    if frequency == "DAY":
+        return day + timedelta(days=interval)
+    if frequency == "WEEK":
+        return day + timedelta(weeks=interval)
+    months = interval * 12 if frequency == "YEAR" else interval
+    return add_months(day, months, anchor_day)
+
+
+def signed_amount_expression(amount="amount"):
+    """SQL expression of the balance effect of a row: +amount for income and
+    -amount for expenses"""
+    return Case(
+        When(transaction_type="IN", then=F(amount)),
+        default=-F(amount),
+        output_field=DecimalField(max_digits=14, decimal_places=2),
+    )
+
+
+def increment_or_create(model, lookup, values=None, **deltas):
+    """Add deltas to the columns of the row matching ``lookup`` with a single
+    UPDATE statement, creating the row when it doesn't exist yet. ``values``
+    are plain assignments made in the same statement.
+
+    The arithmetic runs in the database, so concurrent writers serialize on the
+    row instead of overwriting each other.
+    """
+    values = values or {}
+    rows = model.objects.filter(**lookup)
+    increments = {field: F(field) + delta for field, delta in deltas.items()}
+    if rows.update(**increments, **values):
+        return
+    try:
+        with atomic():
+            model.objects.create(**lookup, **values, **deltas)
+    except IntegrityError:
+        # Another writer created the row in the meantime
+        rows.update(**increments, **values)
+
+
+BUMP_VERSION = """
+    UPDATE {table} SET version = version + 1, updated_at = %s
+    WHERE user_id = %s AND scope = %s
+    RETURNING version
+"""
+
+
+def bump_version(user_id, scope):
+    """Mark the data of a user in ``scope`` as changed, returning the new version.
+
+    The version row stays locked until the writing transaction commits, so
+    versions are handed out in commit order and also number the synced
+    changes of the user: a sync cursor never skips a change that commits
+    later. Ledger writes take it before any other row.
+    """
+    now = timezone.now()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            BUMP_VERSION.format(table=models.DataVersion._meta.db_table),
+            [connection.ops.adapt_datetimefield_value(now), user_id, scope],
+        )
+        row = cursor.fetchone()
+    if row is None:
+        # First change of the user in this scope
+        models.DataVersion.objects.bulk_create(
+            [models.DataVersion(user_id=user_id, scope=scope, updated_at=now)],
+            ignore_conflicts=True,
+        )
+        return bump_version(user_id, scope)
+    return row[0]
+
+
+BUMP_VERSIONS = """
+    UPDATE {table} SET version = version + 1, updated_at = %s
+    WHERE scope = %s AND user_id IN ({user_ids})
+    RETURNING user_id, version
+"""
+
+
+def bump_versions(user_ids, scope):
+    """``bump_version`` for many users with one UPDATE, after locking the rows
+    in user id order so concurrent writers wait on each other in the same
+    order. Returns the new versions by user id"""
+    user_ids = sorted(set(user_ids))
+    if len(user_ids) <= 1:
+        return {user_id: bump_version(user_id, scope) for user_id in user_ids}
+    now = timezone.now()
+    rows = models.DataVersion.objects.filter(user_id__in=user_ids, scope=scope)
+    locked = set(rows.select_for_update().order_by("user_id").values_list("user_id", flat=True))
+    if len(locked) < len(user_ids):
+        models.DataVersion.objects.bulk_create(
+            [
+                models.DataVersion(user_id=user_id, scope=scope, updated_at=now)
+                for user_id in user_ids
+                if user_id not in locked
+            ],
+            ignore_conflicts=True,
+        )
+        list(rows.select_for_update().order_by("user_id").values_list("user_id", flat=True))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            BUMP_VERSIONS.format(
+                table=models.DataVersion._meta.db_table,
+                user_ids=", ".join(["%s"] * len(user_ids)),
+            ),
+            [connection.ops.adapt_datetimefield_value(now), scope, *user_ids],
+        )
+        return dict(cursor.fetchall())
+
+
+def record_deletions(kind, rows, change_seq):
+    """Leave tombstones for deleted rows given as ``(object_id, user_id,
+    project_id)``, numbered with ``change_seq``: the ledger version of the
+    user for categories and transactions, the project change number for tasks"""
+    models.Tombstone.objects.bulk_create(
+        [
+            models.Tombstone(
+                kind=kind,
+                object_id=object_id,
+                user_id=user_id,
+                project_id=project_id,
+                change_seq=change_seq,
+            )
+            for object_id, user_id, project_id in rows
+        ],
+        batch_size=500,
+    )
+
 
+def annotate_project_progress(queryset):
+    """Annotate projects with the counts of their tasks, completed tasks and
+    overdue tasks, and the next due date of their open tasks, in one grouped
+    query"""
+    today = timezone.localdate()
+    done = Q(tasks__status=models.Task.COMPLETED)
+    return queryset.annotate(
+        task_count=Count("tasks"),
+        completed_count=Count("tasks", filter=done),
+        overdue_count=Count("tasks", filter=Q(tasks__due_date__lt=today) & ~done),
+        next_due_date=Min("tasks__due_date", filter=Q(tasks__due_date__gte=today) & ~done),
+    )
 
-# Utility class to normalize balance
-def normalize_balance(balance, transaction_pk, user):
-    """Normalize the balance before any new update to transaction"""
-    prev_transaction = models.Transaction.objects.get(pk=transaction_pk)
-    if prev_transaction.user != user:
-        raise ValidationError("Transaction does not belong to the user")
-    if prev_transaction.transaction_type == "IN":
-        balance.amount -= prev_transaction.amount
+
+def board_columns(project_id, limit, related=()):
+    """Task count and first ``limit`` tasks by priority of each status of a
+    project, with one grouped count and one windowed query. ``related`` are
+    the relations of the tasks to load with them"""
+    counts = dict(
+        models.Task.objects.filter(project_id=project_id)
+        .values_list("status")
+        .annotate(count=Count("id"))
+        .order_by()
+    )
+    ranked = (
+        models.Task.objects.filter(project_id=project_id)
+        .select_related(*related)
+        .annotate(
+            position=Window(
+                RowNumber(), partition_by=F("status"), order_by=[F("priority"), F("id")]
+            )
+        )
+        .filter(position__lte=limit)
+        .order_by("priority", "id")
+    )
+    tasks = defaultdict(list)
+    for task in ranked:
+        tasks[task.status].append(task)
+    return [
+        {"status": status, "label": label, "count": counts.get(status, 0), "tasks": tasks[status]}
+        for status, label in models.Task.STATUS_CHOICES
+    ]
+
+
+def get_version(user_id, scope):
+    """Current ``(version, updated_at)`` of the data of a user in ``scope``"""
+    return (
+        models.DataVersion.objects.filter(user_id=user_id, scope=scope)
+        .values_list("version", "updated_at")
+        .first()
+    ) or (0, None)
+
+
+EXPORT_COLUMNS = [
+    ("id", "id"),
+    ("created_at", "created_at"),
+    ("transaction_type", "transaction_type"),
+    ("amount", "amount"),
+    ("category", "category_id"),
+    ("category_name", "category__name"),
+    ("description", "description"),
+    ("updated_at", "updated_at"),
+]
+
+
+def export_transactions(queryset, output="csv", compress=False, chunk_size=2000):
+    """Yield a queryset of transactions as CSV or NDJSON, optionally gzipped.
+
+    Rows are read with a chunked (server-side on PostgreSQL) cursor and written
+    out in blocks of about 64KB, so memory use doesn't depend on the number of
+    rows exported.
+    """
+    rows = queryset.values_list(*(field for _, field in EXPORT_COLUMNS)).iterator(
+        chunk_size=chunk_size
+    )
+    lines = _csv_lines(rows) if output == "csv" else _ndjson_lines(rows)
+    blocks = _join_blocks(lines)
+    return _gzip_blocks(blocks) if compress else blocks
+
+
+async def iterate_in_thread(iterator):
+    """Async iterator over a sync one, each step run in the sync thread of the
+    request. The ASGI handler then sends every block as it is produced,
+    instead of reading a sync iterator into a list before the first byte"""
+    iterator = iter(iterator)
+    step = sync_to_async(next, thread_sensitive=True)
+    while (block := await step(iterator, None)) is not None:
+        yield block
+
+
+def _csv_lines(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(name for name, _ in EXPORT_COLUMNS)
+    for row in rows:
+        writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+def _ndjson_lines(rows):
+    names = [name for name, _ in EXPORT_COLUMNS]
+    for row in rows:
+        yield json.dumps(dict(zip(names, row)), cls=DjangoJSONEncoder) + "\n"
+
+
+def _join_blocks(lines, block_size=64 * 1024):
+    block = []
+    size = 0
+    for line in lines:
+        block.append(line)
+        size += len(line)
+        if size >= block_size:
+            yield "".join(block).encode()
+            block = []
+            size = 0
+    if block:
+        yield "".join(block).encode()
+
+
+def _gzip_blocks(blocks):
+    compressor = zlib.compressobj(wbits=zlib.MAX_WBITS | 16)
+    for block in blocks:
+        compressed = compressor.compress(block)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def read_csv_rows(file, optional_fields=()):
+    """Read an uploaded CSV file into a list of dicts keyed by the header row.
+    Empty cells of optional fields are returned as None. Raises ValueError
+    when the file is not UTF-8 encoded CSV"""
+    reader = csv.DictReader(io.TextIOWrapper(file, encoding="utf-8-sig"))
+    rows = []
+    try:
+        for row in reader:
+            row = {key.strip(): (value or "").strip() for key, value in row.items() if key}
+            for field in optional_fields:
+                if row.get(field) == "":
+                    row[field] = None
+            rows.append(row)
+    except (UnicodeDecodeError, csv.Error):
+        raise ValueError("The file must be UTF-8 encoded CSV.")
+    return rows
+
+
+def covers_whole_months(date_from, date_to):
+    """Whether a date range starts and ends on month boundaries"""
+    return date_from.day == 1 and date_to.day == calendar.monthrange(date_to.year, date_to.month)[1]
+
+
+def summarize_transactions(user_id, date_from, date_to):
+    """Totals by type and by category for a period, from one grouped query.
+
+    Periods made of whole months are answered from the monthly rollups, other
+    ranges aggregate the transactions themselves.
+    """
+    if covers_whole_months(date_from, date_to):
+        rows = (
+            models.MonthlyRollup.objects.filter(
+                user_id=user_id, month__range=(date_from, date_to), transaction_count__gt=0
+            )
+            .values("category_id", "category__name", "transaction_type")
+            .annotate(total=Sum("amount"), count=Sum("transaction_count"))
+        )
     else:
-        balance.amount += prev_transaction.amount
+        rows = (
+            models.Transaction.objects.filter(
+                user_id=user_id, created_at__range=(date_from, date_to)
+            )
+            .values("category_id", "category__name", "transaction_type")
+            .annotate(total=Sum("amount"), count=Count("id"))
+        )
+    rows = rows.order_by("category_id", "transaction_type")
+
+    totals = {"income": Decimal(0), "expense": Decimal(0), "count": 0}
+    categories = {}
+    for row in rows:
+        key = "income" if row["transaction_type"] == "IN" else "expense"
+        totals[key] += row["total"]
+        totals["count"] += row["count"]
+        category = categories.setdefault(
+            row["category_id"],
+            {
+                "id": row["category_id"],
+                "name": row["category__name"],
+                "income": Decimal(0),
+                "expense": Decimal(0),
+                "count": 0,
+            },
+        )
+        category[key] += row["total"]
+        category["count"] += row["count"]
+
+    totals["net"] = totals["income"] - totals["expense"]
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "totals": totals,
+        "categories": list(categories.values()),
+    }
+
+
+def monthly_report(user_id, year):
+    """Income, expense and net per month of a year, read from the rollups"""
+    rows = (
+        models.MonthlyRollup.objects.filter(
+            user_id=user_id, month__year=year, transaction_count__gt=0
+        )
+        .values("month", "transaction_type")
+        .annotate(total=Sum("amount"))
+        .order_by("month")
+    )
+    months = {
+        month: {"month": date(year, month, 1), "income": Decimal(0), "expense": Decimal(0)}
+        for month in range(1, 13)
+    }
+    for row in rows:
+        key = "income" if row["transaction_type"] == "IN" else "expense"
+        months[row["month"].month][key] += row["total"]
+    for month in months.values():
+        month["net"] = month["income"] - month["expense"]
+    return {"year": year, "months": list(months.values())}
+
+
+def budgets_with_spend(queryset, month):
+    """Annotate budgets with the spend of their category in ``month``.
+
+    The spend is the category's expense rollup for the month, kept up to date
+    by ``apply_transaction_changes``, so no transaction row is read.
+    """
+    spent = models.MonthlyRollup.objects.filter(
+        user_id=OuterRef("user_id"),
+        category_id=OuterRef("category_id"),
+        month=month_start(month),
+        transaction_type="OUT",
+    ).values("amount")[:1]
+    money = DecimalField(max_digits=14, decimal_places=2)
+    return queryset.annotate(
+        spent=Coalesce(Subquery(spent, output_field=money), Value(0), output_field=money)
+    ).annotate(
+        remaining=ExpressionWrapper(F("amount") - F("spent"), output_field=money),
+        over_budget=ExpressionWrapper(Q(spent__gt=F("amount")), output_field=BooleanField()),
+    )
+
+
+def balance_as_of(user_id, day):
+    """The user's balance at the end of a day.
+
+    Works backwards from the current balance: whole months after ``day`` are
+    subtracted using their rollups and only the rest of ``day``'s month is read
+    from the transactions, so the cost doesn't grow with the length of the history.
+    """
+    current = (
+        models.Balance.objects.filter(user_id=user_id).values_list("amount", flat=True).first()
+        or Decimal(0)
+    )
+    zero = Value(Decimal(0), output_field=DecimalField(max_digits=14, decimal_places=2))
+    later_months = models.MonthlyRollup.objects.filter(
+        user_id=user_id, month__gt=month_start(day)
+    ).aggregate(total=Coalesce(Sum(signed_amount_expression()), zero))["total"]
+    rest_of_month = models.Transaction.objects.filter(
+        user_id=user_id,
+        created_at__gt=day,
+        created_at__lt=next_period(month_start(day), "month"),
+    ).aggregate(total=Coalesce(Sum(signed_amount_expression()), zero))["total"]
+    return current - later_months - rest_of_month
+
+
+def balance_series(user_id, date_from, date_to, interval="day"):
+    """Closing balance of every day, week or month between two dates.
+
+    A window function computes the running total of the transactions in the
+    range, and the last row of each period gives its closing balance relative
+    to the opening balance.
+    """
+    opening = balance_as_of(user_id, date_from - timedelta(days=1))
+    period = Trunc("created_at", interval)
+    rows = (
+        models.Transaction.objects.filter(
+            user_id=user_id, created_at__range=(date_from, date_to)
+        )
+        .annotate(
+            period=period,
+            running=Window(
+                Sum(signed_amount_expression()),
+                order_by=[F("created_at").asc(), F("id").asc()],
+            ),
+            position=Window(
+                RowNumber(),
+                partition_by=[period],
+                order_by=[F("created_at").desc(), F("id").desc()],
+            ),
+        )
+        .filter(position=1)
+        .values_list("period", "running")
+    )
+    closing = {row_period: running for row_period, running in rows}
+
+    series = []
+    balance = opening
+    start = period_start(date_from, interval)
+    while start <= date_to:
+        previous = balance
+        balance = opening + closing[start] if start in closing else balance
+        series.append({"period": start, "balance": balance, "change": balance - previous})
+        start = next_period(start, interval)
+    return {
+        "date_from": date_from,
+        "date_to": date_to,
+        "interval": interval,
+        "opening_balance": opening,
+        "series": series,
+    }
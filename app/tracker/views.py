@@ -2,21 +2,37 @@
 Tracker Views
 """
 
-from rest_framework.viewsets import ModelViewSet
+from rest_framework.viewsets import ModelViewSet, ViewSet
 from rest_framework import permissions
+from rest_framework import status
 from rest_framework.decorators import action
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.parsers import JSONParser, MultiPartParser
+from rest_framework.renderers import JSONRenderer
 from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
-
-
-from django.utils.timezone import make_aware
-from datetime import datetime
-import calendar
-
+from django.contrib.auth import get_user_model
+from django.core.handlers.asgi import ASGIRequest
+from django.http import StreamingHttpResponse
+
+from . import caching
+from . import events
+from . import filters
+from . import forecast
+from . import ledger
 from . import models
 from . import serializers
+from . import pagination
 from . import permissions as own_permissions
+from . import projects
+from . import search
+from . import sync
+from . import utilities
+
+IMPORT_CHUNK_SIZE = 500
+EXPORT_CONTENT_TYPES = {"csv": "text/csv", "ndjson": "application/x-ndjson"}
+
 
 class CategoryViewSet(ModelViewSet):
     """Category viewset"""
@@ -31,6 +47,30 @@ class CategoryViewSet(ModelViewSet):
         #     return models.Category.objects.select_related("user")
         return models.Category.objects.filter(user=self.request.user).select_related("user")
 
+    @caching.cached(utilities.ledger_version)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+
+class BudgetViewSet(ModelViewSet):
+    """Budget viewset. Spend figures are for ``?month=YYYY-MM``, the current
+    month by default"""
+
+    serializer_class = serializers.BudgetSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        params = serializers.MonthSerializer(data=self.request.query_params)
+        params.is_valid(raise_exception=True)
+        budgets = models.Budget.objects.filter(user=self.request.user).order_by("category_id")
+        return utilities.budgets_with_spend(budgets, params.validated_data["month"])
+
+    def perform_create(self, serializer):
+        serializer.instance = self.get_queryset().get(pk=serializer.save().pk)
+
+    def perform_update(self, serializer):
+        serializer.instance = self.get_queryset().get(pk=serializer.save().pk)
+
 
 class BalanceViewSet(ModelViewSet):
     """Balance viewset"""
@@ -43,6 +83,8 @@ class BalanceViewSet(ModelViewSet):
         return models.Balance.objects.none()
 
     @action(detail=False, methods=["get"], url_path="me")
+    @caching.conditional(utilities.ledger_version)
+    @caching.cached(utilities.ledger_version)
     def get_balance_for_authenticated_user(self, request):
         """Return the balance of the authenticated user
         or create one if it doesn't exist"""
@@ -53,50 +95,220 @@ class BalanceViewSet(ModelViewSet):
         serializer = serializers.BalanceSerializer(balance)
         return Response(serializer.data)
 
+    @action(detail=False, methods=["get"])
+    def history(self, request):
+        """Closing balance per ``?interval=day|week|month`` over a month
+        (``?month=YYYY-MM``) or a date range (``?date_from=&date_to=``)"""
+        params = serializers.BalanceHistorySerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(utilities.balance_series(request.user.id, **params.validated_data))
+
+    @action(detail=False, methods=["get"])
+    @caching.cached(utilities.ledger_version)
+    def forecast(self, request):
+        """Projected income, expense and balance for the next ``?months=``
+        months, from moving averages and seasonality of each category"""
+        params = serializers.BalanceForecastSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(forecast.forecast_balance(request.user.id, **params.validated_data))
+
+    @action(detail=False, methods=["get"], url_path="as-of")
+    def as_of(self, request):
+        """Balance of the authenticated user at the end of ``?date=``"""
+        params = serializers.BalanceAsOfSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        day = params.validated_data["date"]
+        return Response({"date": day, "amount": utilities.balance_as_of(request.user.id, day)})
+
 
 class TransactionViewSet(ModelViewSet):
     """Transaction viewset"""
 
     serializer_class = serializers.TransactionSerializer
     permission_classes = [permissions.IsAuthenticated]
+    pagination_class = pagination.TransactionPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = filters.TransactionFilter
 
     def get_queryset(self):
         """Retrieves filtered transactions for authenticated users,
         and all for superuser"""
-        queryset = (
-            models.Transaction.objects.filter(user=self.request.user)
-            .select_related("user", "category")
-            .order_by("-created_at", "-id")
+        queryset = models.Transaction.objects.filter(user=self.request.user).order_by(
+            "-created_at", "-id"
         )
+        _, expand = serializers.TransactionSerializer.requested_fields(self.request)
+        if "category" in expand:
+            queryset = queryset.select_related("category")
+        return queryset
 
-        created_at = self.request.query_params.get("created_at")
+    @caching.conditional(utilities.ledger_version)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=False, methods=["get"])
+    def summary(self, request):
+        """Income and expense totals by type and category for a month
+        (``?month=YYYY-MM``) or a date range (``?date_from=&date_to=``)"""
+        period = serializers.TransactionPeriodSerializer(data=request.query_params)
+        period.is_valid(raise_exception=True)
+        return Response(
+            utilities.summarize_transactions(
+                request.user.id,
+                period.validated_data["date_from"],
+                period.validated_data["date_to"],
+            )
+        )
 
-        if created_at:
+    @action(detail=False, methods=["get"])
+    def report(self, request):
+        """Income, expense and net for every month of ``?year=`` (default: this year)"""
+        params = serializers.YearSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        return Response(utilities.monthly_report(request.user.id, params.validated_data["year"]))
+
+    @action(detail=False, methods=["get"])
+    def search(self, request):
+        """Transactions whose description matches ``?q=``, most relevant first"""
+        params = serializers.TransactionSearchSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        transactions = search.search_transactions(
+            request.user.id, params.validated_data["q"], params.validated_data["limit"]
+        )
+        return Response({"results": self.get_serializer(transactions, many=True).data})
+
+    @action(detail=False, methods=["get"])
+    def export(self, request):
+        """Stream the transactions as ``?output=csv|ndjson``, gzipped with ``?gzip=true``.
+        Accepts the same filters as the list"""
+        options = serializers.TransactionExportSerializer(data=request.query_params)
+        options.is_valid(raise_exception=True)
+        output = options.validated_data["output"]
+        compress = options.validated_data["gzip"]
+
+        filename = f"transactions.{output}" + (".gz" if compress else "")
+        content = utilities.export_transactions(
+            self.filter_queryset(self.get_queryset()), output, compress
+        )
+        if isinstance(request._request, ASGIRequest):
+            # The ASGI handler would read a sync iterator whole before sending
+            content = utilities.iterate_in_thread(content)
+        response = StreamingHttpResponse(
+            content,
+            content_type="application/gzip" if compress else EXPORT_CONTENT_TYPES[output],
+        )
+        response["Content-Disposition"] = f'attachment; filename="{filename}"'
+        return response
+
+    @action(detail=False, methods=["post"], url_path="bulk-delete")
+    def bulk_delete(self, request):
+        """Delete the transactions selected by ``ids`` or ``filter`` with a
+        single balance adjustment"""
+        selection = serializers.TransactionSelectionSerializer(data=request.data)
+        selection.is_valid(raise_exception=True)
+        deleted = ledger.bulk_delete_transactions(
+            request.user.id, self.get_selection(selection.validated_data)
+        )
+        return Response({"deleted": deleted})
+
+    @action(detail=False, methods=["patch"], url_path="bulk-update")
+    def bulk_update(self, request):
+        """Apply ``changes`` to the transactions selected by ``ids`` or
+        ``filter`` with a single balance adjustment"""
+        serializer = serializers.TransactionBulkUpdateSerializer(
+            data=request.data, context=self.get_serializer_context()
+        )
+        serializer.is_valid(raise_exception=True)
+        updated = ledger.bulk_update_transactions(
+            request.user.id,
+            self.get_selection(serializer.validated_data),
+            serializer.validated_data["changes"],
+        )
+        return Response({"updated": updated})
+
+    def get_selection(self, data):
+        """Transactions of the user matching validated ``ids`` or ``filter``"""
+        queryset = models.Transaction.objects.filter(user=self.request.user)
+        if data.get("ids"):
+            return queryset.filter(id__in=data["ids"])
+        unknown = set(data["filter"]) - set(filters.TransactionFilter.base_filters)
+        if unknown:
+            raise ValidationError({"filter": [f"Unknown filters: {', '.join(sorted(unknown))}."]})
+        filterset = filters.TransactionFilter(data["filter"], queryset=queryset)
+        if not filterset.is_valid():
+            raise ValidationError({"filter": filterset.errors})
+        return filterset.qs
+
+    @action(
+        detail=False,
+        methods=["post"],
+        url_path="import",
+        parser_classes=[JSONParser, MultiPartParser],
+    )
+    def import_transactions(self, request):
+        """Create many transactions from a JSON array or an uploaded CSV file.
+        Rows are validated in chunks and nothing is written if any row fails"""
+        if "file" in request.FILES:
             try:
-                date = datetime.strptime(created_at, "%Y-%m-%d")
-                first_day = make_aware(datetime(date.year, date.month, 1))
-                last_day = make_aware(
-                    datetime(
-                        date.year,
-                        date.month,
-                        calendar.monthrange(date.year, date.month)[1],
-                    )
+                rows = utilities.read_csv_rows(
+                    request.FILES["file"], optional_fields=["description", "category"]
+                )
+            except ValueError as error:
+                return Response({"detail": str(error)}, status=status.HTTP_400_BAD_REQUEST)
+        elif isinstance(request.data, list):
+            rows = request.data
+        else:
+            return Response(
+                {"detail": "Expected a JSON array or a CSV file."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        context = {
+            "category_ids": set(
+                models.Category.objects.filter(user=request.user).values_list("id", flat=True)
+            )
+        }
+        transactions = []
+        errors = []
+        for start in range(0, len(rows), IMPORT_CHUNK_SIZE):
+            serializer = serializers.ImportTransactionSerializer(
+                data=rows[start:start + IMPORT_CHUNK_SIZE], many=True, context=context
+            )
+            if serializer.is_valid():
+                transactions.extend(
+                    models.Transaction(user=request.user, **row)
+                    for row in serializer.validated_data
+                )
+            elif isinstance(serializer.errors, dict):
+                errors.append({"row": start + 1, "errors": serializer.errors})
+            else:
+                errors.extend(
+                    {"row": start + index + 1, "errors": row_errors}
+                    for index, row_errors in enumerate(serializer.errors)
+                    if row_errors
                 )
 
-                queryset = queryset.filter(created_at__range=(first_day, last_day))
+        if errors:
+            return Response({"errors": errors}, status=status.HTTP_400_BAD_REQUEST)
 
-            except ValueError as e:
-                print("Value Error", e)
-                queryset = queryset.none()
+        created = ledger.bulk_create_transactions(request.user.id, transactions)
+        return Response({"created": len(created)}, status=status.HTTP_201_CREATED)
 
-        # Return the filtered queryset
-        return queryset
+
+class RecurringTransactionViewSet(ModelViewSet):
+    """Recurring transaction viewset. Occurrences are created by the
+    ``run_recurring_transactions`` command"""
+
+    serializer_class = serializers.RecurringTransactionSerializer
+    permission_classes = [permissions.IsAuthenticated]
+
+    def get_queryset(self):
+        return models.RecurringTransaction.objects.filter(user=self.request.user).order_by("pk")
 
 
 class ProjectViewSet(ModelViewSet):
     """Project ViewSet"""
     permission_classes = [permissions.IsAuthenticated]
-    queryset = models.Project.objects.select_related("user").prefetch_related('participants').order_by("-updated_at")
+    queryset = models.Project.objects.order_by("-updated_at")
     filter_backends = [DjangoFilterBackend]
     filterset_fields = ["is_active"]
 
@@ -106,24 +318,102 @@ class ProjectViewSet(ModelViewSet):
         return serializers.GetProjectSerializer
 
     def get_queryset(self):
-        """Retrieves filtered projects for authenticated users,
-        and all for superuser"""
-        return self.queryset.filter(
-            Q(user=self.request.user) | Q(participants=self.request.user)
-        ).distinct()
+        """Retrieves the projects the user owns or participates in, loading
+        the progress of their tasks and their relations only when the
+        requested fields include them"""
+        queryset = self.queryset.filter(access__user=self.request.user)
+        if self.request.method != "GET":
+            return queryset
+        fields, expand = serializers.GetProjectSerializer.requested_fields(self.request)
+        if fields is None or fields & serializers.GetProjectSerializer.PROGRESS_FIELDS:
+            queryset = utilities.annotate_project_progress(queryset)
+        if fields is None or "participants" in fields:
+            queryset = queryset.prefetch_related("participants")
+        if "user" in expand:
+            queryset = queryset.select_related("user")
+        return queryset
+
+    @caching.conditional(utilities.project_list_version)
+    @caching.cached(utilities.project_list_version)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @action(detail=True, methods=["get"])
+    def board(self, request, pk=None):
+        """Kanban board of the project: the task count and first ``?limit=``
+        tasks by priority of every status, each column with a ``next`` link.
+        With ``?status=`` and a ``cursor`` a single column is paged"""
+        if own_permissions.project_role(request, pk) is None:
+            raise NotFound()
+        params = serializers.BoardSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        paginator = pagination.BoardColumnPagination()
+        _, expand = serializers.GetTaskSerializer.requested_fields(request)
+        context = {"request": request}
+
+        if "status" in params.validated_data:
+            tasks = models.Task.objects.filter(
+                project_id=pk, status=params.validated_data["status"]
+            ).select_related(*expand)
+            page = paginator.paginate_queryset(tasks, request, view=self)
+            return paginator.get_paginated_response(
+                serializers.GetTaskSerializer(page, many=True, context=context).data
+            )
+
+        columns = utilities.board_columns(pk, params.validated_data["limit"], related=expand)
+        for column in columns:
+            tasks = column["tasks"]
+            column["next"] = None
+            if column["count"] > len(tasks):
+                paginator.base_url = replace_query_param(
+                    request.build_absolute_uri(), "status", column["status"]
+                )
+                column["next"] = paginator.encode_cursor(False, paginator.get_key(tasks[-1]))
+            column["tasks"] = serializers.GetTaskSerializer(
+                tasks, many=True, context=context
+            ).data
+        return Response({"columns": columns})
+
+    @action(
+        detail=True,
+        methods=["get"],
+        url_path="events",
+        renderer_classes=[JSONRenderer, events.EventStreamRenderer],
+    )
+    def event_stream(self, request, pk=None):
+        """Server-sent events of the task changes of the project: ``task.created``,
+        ``task.updated``, ``task.deleted`` and ``task.reordered``. Streams are
+        long lived, so this needs the ASGI application: a WSGI server would
+        hold a thread per stream and buffer it forever."""
+        if own_permissions.project_role(request, pk) is None:
+            raise NotFound()
+        if not isinstance(request._request, ASGIRequest):
+            return Response(
+                {"detail": "Event streams are only served by the ASGI application."},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        subscription = events.get_hub().subscribe(events.project_channel(pk))
+        response = StreamingHttpResponse(
+            events.EventStream(subscription), content_type="text/event-stream"
+        )
+        response["Cache-Control"] = "no-cache"
+        response["X-Accel-Buffering"] = "no"
+        return response
 
 
 class TaskViewSet(ModelViewSet):
+    """Task viewset, nested under a project"""
 
-    queryset = (
-        models.Task.objects.select_related("project", "user")
-        .prefetch_related("owner")
-        .order_by("-updated_at")
-    )
+    queryset = models.Task.objects.order_by("-updated_at")
+    pagination_class = pagination.TaskPagination
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = filters.TaskFilter
 
     def get_permissions(self):
         if self.request.method in ['DELETE', 'POST']:
             return [own_permissions.IsOwnerOfProject()]
+        if self.request.method in ["PUT", "PATCH"]:
+            return [own_permissions.IsOwnerOfProjectOrTask()]
         return [permissions.IsAuthenticated()]
 
     def get_serializer_class(self):
@@ -134,12 +424,80 @@ class TaskViewSet(ModelViewSet):
         return serializers.GetTaskSerializer
 
     def get_queryset(self):
-        """Retrieves filtered tasks for authenticated users, and all for superuser"""
-        return self.queryset.filter(
-            Q(project__user=self.request.user, project_id=self.kwargs["projects_pk"]) |
-            Q(owner=self.request.user, project_id=self.kwargs["projects_pk"])
+        """Retrieves the tasks of the project for its owner, and the tasks a
+        participant owns for a participant"""
+        project_id = self.kwargs["projects_pk"]
+        role = own_permissions.project_role(self.request, project_id)
+        if role is None:
+            return self.queryset.none()
+        _, expand = serializers.GetTaskSerializer.requested_fields(self.request)
+        queryset = self.queryset.filter(project_id=project_id).select_related(*expand)
+        if role != models.ProjectAccess.OWNER:
+            queryset = queryset.filter(owner=self.request.user)
+        return queryset
+
+    def perform_create(self, serializer):
+        serializer.save(project_id=int(self.kwargs["projects_pk"]))
+
+    @action(detail=False, methods=["post"])
+    def bulk(self, request, projects_pk=None):
+        """Create tasks, and update those given with an ``id``, from a JSON
+        array. Only the project owner gets past ``IsOwnerOfProject``. The
+        project is touched once and nothing is written if any task fails"""
+        if not isinstance(request.data, list):
+            return Response(
+                {"detail": "Expected a JSON array."}, status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(request.data) > serializers.BulkTaskSerializer.MAX_TASKS:
+            return Response(
+                {"detail": f"At most {serializers.BulkTaskSerializer.MAX_TASKS} tasks."},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+
+        items = [item for item in request.data if isinstance(item, dict)]
+        context = {
+            "task_ids": set(
+                models.Task.objects.filter(
+                    project_id=projects_pk, id__in=self.int_values(items, "id")
+                ).values_list("id", flat=True)
+            ),
+            "user_ids": set(
+                get_user_model()
+                .objects.filter(id__in=self.int_values(items, "owner"))
+                .values_list("id", flat=True)
+            ),
+        }
+        serializer = serializers.BulkTaskSerializer(data=request.data, many=True, context=context)
+        serializer.is_valid(raise_exception=True)
+
+        created, updated = projects.save_tasks(
+            int(projects_pk), request.user.id, serializer.validated_data
+        )
+        return Response(
+            {"created": [task.id for task in created], "updated": [task.id for task in updated]},
+            status=status.HTTP_201_CREATED if created else status.HTTP_200_OK,
         )
 
+    @action(detail=False, methods=["post"])
+    def reorder(self, request, projects_pk=None):
+        """Set the priorities of tasks of the project from their order in
+        ``ids``, starting at ``start``"""
+        serializer = serializers.TaskReorderSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        ids = serializer.validated_data["ids"]
+        found = models.Task.objects.filter(project_id=projects_pk, id__in=ids).count()
+        if found != len(ids):
+            raise ValidationError({"ids": ["Some tasks don't belong to the project."]})
+        updated = projects.reorder_tasks(
+            int(projects_pk), ids, start=serializer.validated_data["start"]
+        )
+        return Response({"updated": updated})
+
+    @staticmethod
+    def int_values(items, field):
+        values = (str(item.get(field)) for item in items)
+        return [int(value) for value in values if value.isdigit()]
+
 
 class TeamViewSet(ModelViewSet):
 
@@ -149,6 +507,19 @@ class TeamViewSet(ModelViewSet):
     def get_queryset(self):
         return self.queryset.filter(user=self.request.user)
 
+    @caching.cached(utilities.team_version)
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        # Members are set after Team.save(), so bump again once they are stored
+        utilities.bump_version(self.request.user.id, models.DataVersion.TEAM)
+
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        utilities.bump_version(self.request.user.id, models.DataVersion.TEAM)
+
     def get_serializer_class(self):
 
         if self.request.method in ["POST", "PUT", "PATCH"]:
@@ -156,6 +527,7 @@ class TeamViewSet(ModelViewSet):
         return serializers.GetTeamSerializer
 
     @action(detail=False, methods=["get"], url_path="me")
+    @caching.cached(utilities.team_version)
     def get_team(self, request):
         """Return the team of the authenticated user or create one if it doesn't exist"""
         team, created = (
@@ -165,3 +537,31 @@ class TeamViewSet(ModelViewSet):
         )
         serializer = serializers.GetTeamSerializer(team)
         return Response(serializer.data)
+
+
+class SyncViewSet(ViewSet):
+    """Delta sync for offline clients: rows changed or deleted since ``?cursor=``.
+    A cursor older than the pruned deletions gets a 410 and a full resync"""
+
+    permission_classes = [permissions.IsAuthenticated]
+
+    def list(self, request):
+        params = serializers.SyncSerializer(data=request.query_params)
+        params.is_valid(raise_exception=True)
+        try:
+            changes = sync.sync_changes(request.user.id, **params.validated_data)
+        except sync.CursorTooOld:
+            return Response(
+                {"detail": "Cursor too old, sync again without a cursor."},
+                status=status.HTTP_410_GONE,
+            )
+        return Response(serializers.SyncChangesSerializer(changes).data)
+
+
+class CacheStatsViewSet(ViewSet):
+    """Hit rates of the API response cache, for admins"""
+
+    permission_classes = [permissions.IsAdminUser]
+
+    def list(self, request):
+        return Response(caching.get_stats())
@@ -19,4 +19,11 @@ python manage.py migrate
 # --enable-threads: Allows threads to be used within worker processes.
 # --module app.wsgi: Specifies the WSGI application module (app.wsgi) to use.
 # gunicorn moneyTracker.wsgi:application --bind 0.0.0.0:8000
-gunicorn moneyTracker.wsgi:application --bind 0.0.0.0:8000 --timeout=5 --threads=10
\ No newline at end of file
+# Serve the ASGI application from a gunicorn managed uvicorn worker: the
+# project event streams stay open for as long as a client listens, which a
+# WSGI worker thread cannot do. gunicorn restarts the worker when it stops
+# answering for --timeout seconds; Django runs the sync views of each request
+# in a thread of its own. Keep a single worker while the event hub is the
+# in-process one (TRACKER_EVENT_HUB): events do not cross workers.
+gunicorn moneyTracker.asgi:application --worker-class uvicorn.workers.UvicornWorker \
+    --bind 0.0.0.0:8000 --timeout=5
\ No newline at end of file